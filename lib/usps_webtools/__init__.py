@@ -0,0 +1,14 @@
+#!/usr/bin/env python
+'''
+File			:	__init__.py
+Package			:	usps_webtools
+Brief			:	Python interface to the USPS webtools APIs.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import logging
+
+# Stay quiet unless the application configures logging.
+from usps_webtools.diagnostics import LOGGER_NAME, NullHandler
+logging.getLogger(LOGGER_NAME).addHandler(NullHandler())
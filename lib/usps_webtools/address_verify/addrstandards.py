@@ -7,16 +7,21 @@ Author			:	William M. Clifford
 --------------------------------------------------------------------------------
 '''
 
+import logging
 import os
 import xml.dom.minidom
 
-USPS_USER_ID = os.environ['USPS_USER_ID']
+# Default user ID, used unless RequestBase.CREDENTIAL_POOL hands one out.
+USPS_USER_ID = os.environ.get('USPS_USER_ID', '')
+
+log = logging.getLogger(__name__)
 
 # Import the base request and response objects.
 from usps_webtools.base import RequestBase, ResponseBase
+from usps_webtools.lazy import LazyResponseBase
 
 # Import the USPSAddress class for use with the response/request classes.
-from usps_webtools.address_verify.usaddress import USPSAddress
+from usps_webtools.address_verify.usaddress import USPSAddress, LazyUSPSAddress
 
 # Grab the utility functions
 from usps_webtools.utility import createXmlElement, getXmlElement, getXmlElementContents
@@ -58,8 +63,8 @@ class AddressVerResponse(ResponseBase):
 		try:
 			root_element = getXmlElement(elem, '/AddressValidateResponse')
 		except Exception:
-			sys.stderr.write('AddressVerResponse._parseElement(): XML document root element is not of expected value.\n')
-			sys.stderr.write('\tExpecting "<AddressValidateResponse>", got "<%s>".\n' % elem.name)
+			log.warning('AddressVerResponse._parseElement(): XML document root element is not of expected value.'
+				' Expecting "<AddressValidateResponse>", got "<%s>".', elem.name)
 			return
 		# Get each of the addresses that were validated.
 		for addr_elem in elem.xpathEval('/AddressValidateResponse/Address'):
@@ -72,6 +77,31 @@ class AddressVerResponse(ResponseBase):
 	
 	pass
 
+#-------------------------------------------------------------------------------
+# class: LazyAddressVerResponse
+# inherits: usps_webtools.lazy.LazyResponseBase
+#
+# Description:
+#	Lazily-decoded variant of AddressVerResponse. The response text is kept
+#	and the <Address> elements are only located; their fields are decoded on
+#	access. Used by AddressVerRequest.submit(lazy=True).
+#
+#-------------------------------------------------------------------------------
+class LazyAddressVerResponse(LazyResponseBase):
+	ROOT_ELEMENT_NAME = 'AddressValidateResponse'
+	ELEMENT_NAME = 'Address'
+	RECORD_CLASS = LazyUSPSAddress
+	
+	def __str__(self):
+		s = ('=' * 72) + '\nUSPS Address Verification - Response\n' + ('=' * 72) + '\n'
+		for k, v in self.addresses:
+			s += 'ADDRESS ID "%s"\n' % k
+			s += str(v)
+			pass
+		return s
+	
+	pass
+
 #-------------------------------------------------------------------------------
 # class: AddressVerRequest
 # inherits: usps_webtools.RequestBase
@@ -87,25 +117,48 @@ class AddressVerResponse(ResponseBase):
 #	clearAddresses()
 #		Removes all the addresses previously added to the request.
 #
+# Public properties:
+#	addressIds - tuple; the IDs of the addresses in the request, in the order
+#		they were added. Addresses are sent to the server in this order.
+#
 #-------------------------------------------------------------------------------
 class AddressVerRequest(RequestBase):
 	SERVER_REQUEST_URI = 'https://production.shippingapis.com/ShippingAPI.dll'
 	RESPONSE_CLASS = AddressVerResponse
+	LAZY_RESPONSE_CLASS = LazyAddressVerResponse
 	
 	def __init__(self):
 		RequestBase.__init__(self)
 		self._api = 'Verify'
 		self.__addresses = {}
+		self.__addr_ids = []
 		return
 	
+	@property
+	def addressIds(self):
+		'''
+		The IDs of the addresses in the request, in the order they were added.
+		'''
+		return tuple(self.__addr_ids)
+	
 	def addAddress(self, addr_id, usps_addr):
-		if len(self.__addresses) >= 5:
+		if len(self.__addresses) >= 5 and addr_id not in self.__addresses:
 			raise ValueError('USPS address verification only allows up to 5 addresses per request.')
+		if addr_id not in self.__addresses:
+			self.__addr_ids.append(addr_id)
 		self.__addresses[addr_id] = usps_addr
 		return
 	
 	def clearAddresses(self):
 		self.__addresses.clear()
+		del self.__addr_ids[:]
+	
+	def _defaultUserId(self):
+		'''
+		Returns the module's USPS_USER_ID, sent when no credential pool is
+		installed.
+		'''
+		return USPS_USER_ID
 	
 	def _constructDOM(self):
 		'''
@@ -114,11 +167,9 @@ class AddressVerRequest(RequestBase):
 		'''
 		xd = xml.dom.minidom.Document()
 		root_elem = xd.createElement('AddressValidateRequest')
-		root_elem.setAttribute('USERID', USPS_USER_ID)
-		# We want to add all our addresses.
-		addr_ids = self.__addresses.keys()
-		addr_ids.sort()
-		for addr_id in addr_ids:
+		root_elem.setAttribute('USERID', self.userId or self._defaultUserId())
+		# We want to add all our addresses, in the order they were added.
+		for addr_id in self.__addr_ids:
 			usps_addr = self.__addresses[addr_id]
 			usps_addr.appendToXml(addr_id, root_elem)
 			pass
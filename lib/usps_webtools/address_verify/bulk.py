@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+'''
+File			:	bulk.py
+Package			:	usps_webtools.address_verify
+Brief			:	Submits any number of addresses through the batched
+					request classes, collecting the results by address ID.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import time
+
+# Results of every batch are merged into a single ResultIndex.
+from usps_webtools.results import ResultIndex
+
+# Error classification, for the retry path.
+from usps_webtools.errors import ERROR_TRANSIENT, classifyError
+
+# Bulk work yields to interactive requests when a scheduler is installed.
+from usps_webtools.scheduler import PRIORITY_BULK
+
+from usps_webtools.address_verify.usaddress import addressKey, normalizeAddressField
+
+# The server accepts at most this many addresses per request.
+MAX_BATCH_SIZE = 5
+
+#-------------------------------------------------------------------------------
+# function: requestCacheKey(request_class, usps_addr)
+#
+# Description:
+# Returns the key under which the result of looking up usps_addr (a USPSAddress,
+# a USPSZipCode or a plain ZIP code string) with request_class is cached. The
+# request class is part of the key, since the same address gives different
+# answers from different APIs.
+#
+#-------------------------------------------------------------------------------
+def requestCacheKey(request_class, usps_addr):
+	'''
+	Returns the key under which the result of looking up usps_addr with
+	request_class is cached.
+	'''
+	if hasattr(usps_addr, 'address2'):
+		return (request_class.__name__,) + addressKey(usps_addr)
+	return (request_class.__name__, normalizeAddressField(getattr(usps_addr, 'zip5', usps_addr)))
+
+#-------------------------------------------------------------------------------
+# function: submitInBatches(request_class, addresses, results=None, lazy=False,
+#		negative_cache=None, retries=0, retry_delay=0.5, priority=PRIORITY_BULK,
+#		deadline=None, result_cache=None)
+#
+# Description:
+# Splits the (address id, address) pairs into requests of MAX_BATCH_SIZE
+# addresses, submits each one and merges the responses into a ResultIndex.
+# The request class is one of AddressVerRequest, ZipCodeLookupRequest or
+# CityStateLookupRequest (anything with addAddress()/addressIds/submit()).
+#
+# Where a negative cache is given, addresses it already knows to be bad are
+# answered from it (their cached error is attached in the ResultIndex) instead
+# of being sent, and permanent per-address errors from the server are added to
+# it. Addresses that failed for a transient reason (no response, or an error
+# classified as transient) are sent again, up to retries more times, waiting
+# retry_delay seconds before the first retry and doubling the wait each time.
+# Where a result cache is given, addresses it holds a result for are answered
+# from it the same way, and every error-free result from the server is added
+# to it.
+# With a deadline, each submit() is bounded by the time left and no retry is
+# made that could not start before the deadline. Once it has passed, nothing
+# more is sent: the remaining addresses are only marked missing in the
+# ResultIndex, without building a request for them.
+#
+# Params:
+#	request_class - class; the request class used for each batch
+#	addresses - iterable of (address id, address) tuples; the IDs must be
+#		strings and unique across the whole run
+#	results - ResultIndex; merged into and returned, or None for a new one
+#	lazy - boolean; passed on to submit()
+#	negative_cache - usps_webtools.cache.NegativeCache, or None
+#	retries - integer; number of times transient failures are retried
+#	retry_delay - float; seconds to wait before the first retry
+#	priority - integer; scheduler priority class of the requests
+#	deadline - usps_webtools.deadline.Deadline covering the whole run, or None
+#	result_cache - usps_webtools.cache.ResultCache, or None
+#
+# Returns:
+#	The ResultIndex holding the results of all the batches.
+#
+#-------------------------------------------------------------------------------
+def submitInBatches(request_class, addresses, results=None, lazy=False,
+		negative_cache=None, retries=0, retry_delay=0.5, priority=PRIORITY_BULK,
+		deadline=None, result_cache=None):
+	'''
+	Splits the (address id, address) pairs into requests of MAX_BATCH_SIZE
+	addresses, submits each one and merges the responses into a ResultIndex.
+	'''
+	if results is None:
+		results = ResultIndex()
+	request = request_class()
+	request.priority = priority
+	batch = []
+	for addr_id, usps_addr in addresses:
+		if negative_cache is not None:
+			error = negative_cache.get(requestCacheKey(request_class, usps_addr))
+			if error is not None:
+				results.attachError(addr_id, error)
+				continue
+			pass
+		if result_cache is not None:
+			result = result_cache.get(requestCacheKey(request_class, usps_addr))
+			if result is not None:
+				results.attachResult(addr_id, result)
+				continue
+			pass
+		batch.append( (addr_id, usps_addr) )
+		if len(batch) >= MAX_BATCH_SIZE:
+			_submitBatch(request, batch, results, lazy, negative_cache, retries, retry_delay, deadline,
+				result_cache)
+			batch = []
+			pass
+		pass
+	if batch:
+		_submitBatch(request, batch, results, lazy, negative_cache, retries, retry_delay, deadline,
+			result_cache)
+	return results
+
+#-------------------------------------------------------------------------------
+# function: _isTransientFailure(results, addr_id)
+#
+# Description:
+# True where the address has no usable result for a reason that may clear up:
+# nothing came back for it, or its error is classified as transient.
+#
+#-------------------------------------------------------------------------------
+def _isTransientFailure(results, addr_id):
+	error = results.error(addr_id)
+	if error is not None:
+		return classifyError(error) == ERROR_TRANSIENT
+	return results.isMissing(addr_id)
+
+#-------------------------------------------------------------------------------
+# function: _submitBatch(request, batch, results, lazy, negative_cache, retries,
+#		retry_delay, deadline, result_cache)
+#
+# Description:
+# Submits one batch of at most MAX_BATCH_SIZE addresses, retrying transient
+# failures, records permanent per-address errors in the negative cache and
+# good results in the result cache.
+#
+#-------------------------------------------------------------------------------
+def _submitBatch(request, batch, results, lazy, negative_cache, retries, retry_delay, deadline,
+		result_cache):
+	pending = batch
+	attempt = 0
+	while pending:
+		if deadline is not None and deadline.expired:
+			results.merge(None, [ addr_id for addr_id, usps_addr in pending ])
+			break
+		request.clearAddresses()
+		for addr_id, usps_addr in pending:
+			request.addAddress(addr_id, usps_addr)
+		results.mergeRequest(request, request.submit(lazy=lazy, deadline=deadline))
+		if attempt >= retries:
+			break
+		pending = [ item for item in pending if _isTransientFailure(results, item[0]) ]
+		backoff = retry_delay * (2 ** attempt)
+		if pending and deadline is not None and deadline.remaining() <= backoff:
+			# The retry could not even start before the deadline.
+			break
+		if pending:
+			time.sleep(backoff)
+		attempt += 1
+		pass
+	request.clearAddresses()
+	if negative_cache is not None:
+		for addr_id, usps_addr in batch:
+			# Only errors reported against the address itself are cached, not
+			# whole-request errors.
+			if addr_id in results and results.error(addr_id) is not None:
+				negative_cache.record(requestCacheKey(request.__class__, usps_addr), results.error(addr_id))
+			pass
+		pass
+	if result_cache is not None:
+		for addr_id, usps_addr in batch:
+			if addr_id in results and results.error(addr_id) is None:
+				result_cache.record(requestCacheKey(request.__class__, usps_addr), results[addr_id])
+			pass
+		pass
+	return
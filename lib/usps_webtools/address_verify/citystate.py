@@ -7,13 +7,21 @@ Author			:	William M. Clifford
 --------------------------------------------------------------------------------
 '''
 
+import logging
 import os
 import xml.dom.minidom
 
-USPS_USER_ID = os.environ['USPS_USER_ID']
+# Default user ID, used unless RequestBase.CREDENTIAL_POOL hands one out.
+USPS_USER_ID = os.environ.get('USPS_USER_ID', '')
+
+log = logging.getLogger(__name__)
 
 # Import the base request and response objects.
 from usps_webtools.base import RequestBase, ResponseBase
+from usps_webtools.lazy import LazyRecord, LazyResponseBase, lazyField
+
+# Per-ZIP <Error> elements are wrapped in an ErrorResponse.
+from usps_webtools.base import ErrorResponse
 
 # Grab the utility functions
 from usps_webtools.utility import createXmlElement, getXmlElement, getXmlElementContents
@@ -27,8 +35,25 @@ class USPSZipCode(object):
 		self.city = kw.get('city', '')
 		self.state = kw.get('state', '')
 		self.zip5 = kw.get('zip5', '')
+		self.__error = None
 		return
 	
+	def __str__(self):
+		return '''------------------------------------------------------------------------
+	CITY      : %(_USPSZipCode__city)s
+	STATE     : %(_USPSZipCode__state)s
+	ZIP       : %(_USPSZipCode__zip5)s
+------------------------------------------------------------------------
+''' % self.__dict__
+	
+	@property
+	def error(self):
+		return self.__error
+	
+	@property
+	def valid(self):
+		return self.__error is None
+	
 	@property
 	def city(self):
 		return self.__city
@@ -79,13 +104,49 @@ class USPSZipCode(object):
 				self.__setattr__(fieldName, fieldValue)
 				pass
 			except Exception, ex:
-				sys.stderr.write('USPSZipCode.parseFromXML(): Failed to parse element %s from XML.\n\t%s\n' % (elemName, str(ex)))
+				log.warning('USPSZipCode.parseFromXML(): Failed to parse element %s from XML: %s', elemName, ex)
 				pass
 			pass
+		err_elem = getXmlElement(xmlpath_ctx, './Error')
+		if err_elem:
+			self.__error = ErrorResponse(err_elem)
 		return
 	
 	pass
 
+#-------------------------------------------------------------------------------
+# class: LazyUSPSZipCode
+# inherits: usps_webtools.lazy.LazyRecord
+#
+# Description:
+#	Read-only counterpart to USPSZipCode used by LazyCityStateLookupResponse,
+#	decoding each field from the response text only when first read.
+#
+#-------------------------------------------------------------------------------
+class LazyUSPSZipCode(LazyRecord):
+	__slots__ = ()
+	
+	FIELDS = (
+		('zip5', 'Zip5'),
+		('city', 'City'),
+		('state', 'State'),
+		)
+	
+	zip5 = lazyField('Zip5')
+	city = lazyField('City')
+	state = lazyField('State')
+	
+	def __str__(self):
+		return str(self.materialize())
+	
+	def materialize(self):
+		'''
+		Returns a USPSZipCode instance holding all the fields of the record.
+		'''
+		return USPSZipCode(city=self.city, state=self.state, zip5=self.zip5)
+	
+	pass
+
 #-------------------------------------------------------------------------------
 # class: CityStateLookupResponse
 #-------------------------------------------------------------------------------
@@ -114,8 +175,8 @@ class CityStateLookupResponse(ResponseBase):
 		try:
 			root_element = getXmlElement(elem, '/CityStateLookupResponse')
 		except Exception:
-			sys.stderr.write('CityStateLookupResponse._parseElement(): XML document root element is not of expected value.\n')
-			sys.stderr.write('\tExpecting "<CityStateLookupResponse>", got "<%s>".\n' % elem.name)
+			log.warning('CityStateLookupResponse._parseElement(): XML document root element is not of expected value.'
+				' Expecting "<CityStateLookupResponse>", got "<%s>".', elem.name)
 			return
 		# Get each of the addresses that were validated.
 		for addr_elem in elem.xpathEval('/CityStateLookupResponse/ZipCode'):
@@ -128,27 +189,71 @@ class CityStateLookupResponse(ResponseBase):
 	
 	pass
 
+#-------------------------------------------------------------------------------
+# class: LazyCityStateLookupResponse
+# inherits: usps_webtools.lazy.LazyResponseBase
+#
+# Description:
+#	Lazily-decoded variant of CityStateLookupResponse. The response text is kept
+#	and the <ZipCode> elements are only located; their fields are decoded on
+#	access. Used by CityStateLookupRequest.submit(lazy=True).
+#
+#-------------------------------------------------------------------------------
+class LazyCityStateLookupResponse(LazyResponseBase):
+	ROOT_ELEMENT_NAME = 'CityStateLookupResponse'
+	ELEMENT_NAME = 'ZipCode'
+	RECORD_CLASS = LazyUSPSZipCode
+	
+	def __str__(self):
+		s = ('=' * 72) + '\nUSPS City State Lookup - Response\n' + ('=' * 72) + '\n'
+		for k, v in self.addresses:
+			s += 'ZIP CODE ID "%s"\n' % k
+			s += str(v)
+			pass
+		return s
+	
+	pass
+
 #-------------------------------------------------------------------------------
 # class: CityStateLookupRequest
 #-------------------------------------------------------------------------------
 class CityStateLookupRequest(RequestBase):
 	SERVER_REQUEST_URI = 'http://production.shippingapis.com/ShippingAPI.dll'
 	RESPONSE_CLASS = CityStateLookupResponse
+	LAZY_RESPONSE_CLASS = LazyCityStateLookupResponse
 	
 	def __init__(self):
 		RequestBase.__init__(self)
 		self._api = 'CityStateLookup'
 		self.__addresses = {}
+		self.__addr_ids = []
 		return
 	
+	@property
+	def addressIds(self):
+		'''
+		The IDs of the addresses in the request, in the order they were added.
+		'''
+		return tuple(self.__addr_ids)
+	
 	def addAddress(self, addr_id, usps_zipcode):
-		if len(self.__addresses) >= 5:
+		if len(self.__addresses) >= 5 and addr_id not in self.__addresses:
 			raise ValueError('USPS city/state lookup only allows up to 5 addresses per request.')
+		if addr_id not in self.__addresses:
+			self.__addr_ids.append(addr_id)
 		self.__addresses[addr_id] = usps_zipcode
 		return
 	
 	def clearAddresses(self):
 		self.__addresses.clear()
+		del self.__addr_ids[:]
+	
+	def _defaultUserId(self):
+		'''
+		Returns the module's USPS_USER_ID, sent when no credential pool is
+		installed.
+		'''
+		return USPS_USER_ID
 	
 	def _constructDOM(self):
 		'''
@@ -157,14 +262,14 @@ class CityStateLookupRequest(RequestBase):
 		'''
 		xd = xml.dom.minidom.Document()
 		root_elem = xd.createElement('CityStateLookupRequest')
-		root_elem.setAttribute('USERID', USPS_USER_ID)
-		# We want to add all our addresses.
-		addr_ids = self.__addresses.keys()
-		addr_ids.sort()
-		for addr_id in addr_ids:
+		root_elem.setAttribute('USERID', self.userId or self._defaultUserId())
+		# We want to add all our addresses, in the order they were added.
+		for addr_id in self.__addr_ids:
+			usps_zipcode = self.__addresses[addr_id]
 			zc_elem = xd.createElement('ZipCode')
 			zc_elem.setAttribute('ID', addr_id)
-			createXmlElement(zc_elem, 'Zip5', self.__addresses[addr_id])
+			createXmlElement(zc_elem, 'Zip5', getattr(usps_zipcode, 'zip5', usps_zipcode))
+			root_elem.appendChild(zc_elem)
 			pass
 		# Don't forget to append the root element, and we're all set.
 		xd.appendChild(root_elem)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+'''
+File			:	columnar.py
+Package			:	usps_webtools.address_verify
+Brief			:	Column-oriented address verification for tabular data
+					(parallel sequences or a pandas DataFrame). Rows are
+					normalized and de-duplicated column-wise, only the unique
+					rows are sent to the server, and the results come back as
+					new columns.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+# pandas/numpy are optional; they are only needed for DataFrame input.
+try:
+	import numpy
+	import pandas
+except ImportError:
+	numpy = None
+	pandas = None
+
+from usps_webtools.address_verify.addrstandards import AddressVerRequest
+from usps_webtools.address_verify.bulk import submitInBatches
+from usps_webtools.address_verify.usaddress import ADDRESS_FIELDS, KEY_SEPARATOR, USPSAddress, normalizeAddressField
+
+# Default input column name for each USPSAddress field.
+DEFAULT_COLUMNS = {
+	'firmName': 'firm',
+	'address1': 'address1',
+	'address2': 'address2',
+	'city': 'city',
+	'state': 'state',
+	'zip5': 'zip5',
+	'zip4': 'zip4',
+	}
+
+# Digits of the ZIP code fields. Numbers in these fields (a column read as
+# integers or floats) are written out zero-padded to this width.
+_ZIP_WIDTHS = { 'zip5': 5, 'zip4': 4 }
+
+#-------------------------------------------------------------------------------
+# function: verifyColumns(data, columns=None, prefix='usps_',
+#		request_class=AddressVerRequest, negative_cache=None, retries=0)
+#
+# Description:
+# Verifies the addresses held column-wise in data, which is either a pandas
+# DataFrame or a dict of equal-length sequences. Each address field is
+# normalized (see normalizeAddressField()) a whole column at a time, the rows
+# are de-duplicated on the normalized fields, and only the unique rows are
+# submitted, 5 to a request, using lazy responses. The results are then
+# scattered back to every row. ZIP code columns may hold numbers, as when a
+# file is read without a dtype: they are formatted as zero-padded integers
+# (20770.0 -> "20770", 2134 -> "02134") and missing values (None, NaN) are
+# sent empty. A ValueError is raised for a ZIP code that is not a whole
+# number.
+#
+# Params:
+#	data - pandas DataFrame or dict of column name -> sequence
+#	columns - dict; USPSAddress field name -> input column name, overriding
+#		DEFAULT_COLUMNS. Fields whose column is absent are sent empty.
+#	prefix - string; prefix of the output column names. One output column is
+#		produced per field in DEFAULT_COLUMNS (e.g. "usps_zip4") plus
+#		"<prefix>error" holding the error description ('' when none).
+#	request_class - class; AddressVerRequest or ZipCodeLookupRequest
+#	negative_cache, retries - passed on to submitInBatches()
+#
+# Returns:
+#	For a DataFrame, a copy of it with the output columns added. Otherwise a
+#	dict of output column name -> list, aligned with the input rows.
+#
+#-------------------------------------------------------------------------------
+def verifyColumns(data, columns=None, prefix='usps_', request_class=AddressVerRequest,
+		negative_cache=None, retries=0):
+	'''
+	Verifies the addresses held column-wise in data (a pandas DataFrame or a
+	dict of equal-length sequences), submitting only the unique normalized
+	rows, and returns the results as new columns.
+	'''
+	column_names = dict(DEFAULT_COLUMNS)
+	if columns:
+		column_names.update(columns)
+	if pandas is not None and isinstance(data, pandas.DataFrame):
+		codes, unique_rows = _factorizeFrame(data, column_names)
+	else:
+		codes, unique_rows = _factorizeSequences(data, column_names)
+	# Only the unique rows turn into USPSAddress objects.
+	results = submitInBatches(request_class,
+		( (str(idx), USPSAddress(**dict(zip(ADDRESS_FIELDS, row)))) for idx, row in enumerate(unique_rows) ),
+		lazy=True, negative_cache=negative_cache, retries=retries)
+	# One value per unique row for each output column.
+	unique_values = {}
+	for name in ADDRESS_FIELDS:
+		unique_values[prefix + DEFAULT_COLUMNS[name]] = [''] * len(unique_rows)
+	unique_values[prefix + 'error'] = [''] * len(unique_rows)
+	for idx in xrange(len(unique_rows)):
+		result, error = results.lookup(idx)
+		if error is not None:
+			unique_values[prefix + 'error'][idx] = error.description
+		elif result is None:
+			unique_values[prefix + 'error'][idx] = 'No response for address.'
+		if result is None or error is not None:
+			continue
+		for name in ADDRESS_FIELDS:
+			unique_values[prefix + DEFAULT_COLUMNS[name]][idx] = getattr(result, name)
+		pass
+	# Scatter back to the original rows.
+	if pandas is not None and isinstance(data, pandas.DataFrame):
+		frame = data.copy()
+		for out_name, values in unique_values.items():
+			frame[out_name] = numpy.asarray(values, dtype=object).take(codes)
+		return frame
+	scattered = {}
+	for out_name, values in unique_values.items():
+		scattered[out_name] = [ values[code] for code in codes ]
+	return scattered
+
+#-------------------------------------------------------------------------------
+# function: _factorizeFrame(frame, column_names)
+#
+# Description:
+# DataFrame flavour of the normalize/de-duplicate step, done with column-wise
+# pandas string operations. Returns (codes, unique rows): codes is an integer
+# array mapping each row to its unique row, and each unique row is a tuple of
+# normalized fields in ADDRESS_FIELDS order.
+#
+#-------------------------------------------------------------------------------
+def _factorizeFrame(frame, column_names):
+	key = None
+	for name in ADDRESS_FIELDS:
+		if column_names[name] in frame.columns:
+			col = frame[column_names[name]]
+			if name in _ZIP_WIDTHS:
+				col = col.map(lambda value: _formatZip(value, _ZIP_WIDTHS[name]))
+			col = col.fillna('').astype(str)
+			# Control characters count as whitespace, as in
+			# normalizeAddressField(), so no field contains KEY_SEPARATOR.
+			col = col.str.upper().str.replace(r'[\s\x00-\x1f]+', ' ', regex=True).str.strip()
+		else:
+			col = pandas.Series('', index=frame.index)
+		if key is None:
+			key = col
+		else:
+			key = key + KEY_SEPARATOR + col
+		pass
+	codes, uniques = pandas.factorize(key)
+	unique_rows = [ tuple(unique_key.split(KEY_SEPARATOR)) for unique_key in uniques ]
+	return codes, unique_rows
+
+#-------------------------------------------------------------------------------
+# function: _factorizeSequences(data, column_names)
+#
+# Description:
+# Plain-Python flavour of _factorizeFrame() for a dict of parallel sequences.
+#
+#-------------------------------------------------------------------------------
+def _factorizeSequences(data, column_names):
+	normalized = []
+	row_count = None
+	for name in ADDRESS_FIELDS:
+		col = data.get(column_names[name])
+		if col is None:
+			normalized.append(None)
+			continue
+		if name in _ZIP_WIDTHS:
+			col = [ _formatZip(value, _ZIP_WIDTHS[name]) for value in col ]
+		normalized.append(map(normalizeAddressField, col))
+		if row_count is None:
+			row_count = len(normalized[-1])
+		elif row_count != len(normalized[-1]):
+			raise ValueError('Column "%s" does not have the same length as the others.' % column_names[name])
+		pass
+	if row_count is None:
+		return [], []
+	normalized = [ col or [''] * row_count for col in normalized ]
+	codes = []
+	unique_rows = []
+	seen = {}
+	for row in zip(*normalized):
+		code = seen.get(row)
+		if code is None:
+			code = len(unique_rows)
+			seen[row] = code
+			unique_rows.append(row)
+			pass
+		codes.append(code)
+		pass
+	return codes, unique_rows
+
+#-------------------------------------------------------------------------------
+# function: _formatZip(value, width)
+#
+# Description:
+# Returns a ZIP code field value as text: numbers are formatted as integers
+# zero-padded to width digits, missing values (None, NaN) become '' and
+# anything else is returned as it is.
+#
+#-------------------------------------------------------------------------------
+def _formatZip(value, width):
+	if value is None or isinstance(value, basestring):
+		return value
+	if isinstance(value, float) or (numpy is not None and isinstance(value, numpy.floating)):
+		if value != value:
+			return ''
+		if value != int(value):
+			raise ValueError('ZIP code %r is not a whole number.' % value)
+		value = int(value)
+		pass
+	if isinstance(value, (int, long)) or (numpy is not None and isinstance(value, numpy.integer)):
+		return '%0*d' % (width, value)
+	return value
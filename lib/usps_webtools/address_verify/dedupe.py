@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+'''
+File			:	dedupe.py
+Package			:	usps_webtools.address_verify
+Brief			:	De-duplication of address files too large to hold in
+					memory: rows are grouped by a hash of the normalized
+					address, spilling hash partitions to disk past a memory
+					budget, so that each unique address is verified once and
+					the result handed to every row that has it.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import hashlib
+import marshal
+import os
+import shutil
+import tempfile
+
+from usps_webtools.address_verify.addrstandards import AddressVerRequest
+from usps_webtools.address_verify.bulk import submitInBatches
+from usps_webtools.address_verify.usaddress import ADDRESS_FIELDS, USPSAddress, addressKey, joinKey
+
+# Size of the SHA-1 digests groups are keyed by, and the number of files an
+# oversized partition is split into, on one byte of the digest at a time.
+_DIGEST_SIZE = 20
+_SUB_PARTITIONS = 16
+
+#-------------------------------------------------------------------------------
+# class: ExternalDeduplicator
+#
+# Description:
+# Groups rows by normalized address (see addressKey()) using a SHA-1 digest of
+# the normalized fields as the group key. Groups are kept in memory until more
+# than max_rows row IDs are held, at which point every group is appended to
+# one of partitions files on disk, chosen by digest, and memory is cleared.
+# Since equal addresses always land in the same partition, the partitions can
+# then be read back and merged one at a time. A partition holding more than
+# max_rows group records is first split again into sub-partitions on the next
+# byte of the digest, as often as it takes, so merging never holds more than
+# max_rows records. Row IDs are kept in memory for up to max_rows rows of a
+# partition; the row IDs of any other group (a hot address, say) are read back
+# from the spill file as they are iterated. Memory use thus stays bounded by
+# about twice max_rows whatever the size or duplication of the input. Nothing
+# touches the disk if the input fits within max_rows.
+#
+# Use as a context manager, or call close(), to remove the spill files.
+#
+# Public properties:
+#	rowCount - integer; number of rows added
+#
+#	spilled - boolean; True once groups have been written to disk
+#
+#	peakHeld - integer; the most row IDs and spilled group records held in
+#		memory at any one time
+#
+# Public methods:
+#	add(row_id, usps_addr)
+#		Adds a row. The row ID may be any string or number; the address is a
+#		USPSAddress (or anything with the same fields).
+#
+#	groups()
+#		Generator yielding a (normalized fields, row IDs) tuple per unique
+#		address, one partition at a time. The fields are in ADDRESS_FIELDS
+#		order; the row IDs support len() and iteration, and can be iterated
+#		until close() is called. No more rows can be added once this has been
+#		called.
+#
+#	close()
+#		Removes the spill files.
+#
+#-------------------------------------------------------------------------------
+class ExternalDeduplicator(object):
+	
+	def __init__(self, max_rows=100000, partitions=64, tmp_dir=None):
+		if max_rows < 1:
+			raise ValueError('max_rows must be at least 1.')
+		if not 1 <= partitions <= 256:
+			raise ValueError('partitions must be between 1 and 256.')
+		self.maxRows = max_rows
+		self.partitions = partitions
+		self.rowCount = 0
+		self.peakHeld = 0
+		self.__tmpDir = tmp_dir
+		self.__spillDir = None
+		self.__records = []
+		self.__groups = {}
+		self.__held = 0
+		self.__closed = False
+		return
+	
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+		return False
+	
+	@property
+	def spilled(self):
+		return self.__spillDir is not None
+	
+	def add(self, row_id, usps_addr):
+		'''
+		Adds a row, spilling the groups held in memory to disk when more than
+		maxRows row IDs are held.
+		'''
+		if self.__closed:
+			raise ValueError('Cannot add rows once the groups have been read.')
+		fields = addressKey(usps_addr)
+		digest = hashlib.sha1(joinKey(fields)).digest()
+		group = self.__groups.get(digest)
+		if group is None:
+			self.__groups[digest] = (fields, [row_id])
+		else:
+			group[1].append(row_id)
+		self.rowCount += 1
+		self.__held += 1
+		self.peakHeld = max(self.peakHeld, self.__held)
+		if self.__held > self.maxRows:
+			self.__spill()
+		return
+	
+	def groups(self):
+		'''
+		Generator yielding a (normalized fields, row IDs) tuple per unique
+		address, one partition at a time.
+		'''
+		self.__closed = True
+		if self.__spillDir is None:
+			for fields, row_ids in self.__groups.itervalues():
+				yield (fields, row_ids)
+			self.__groups = {}
+			self.__held = 0
+			return
+		self.__spill()
+		# Stack of (path, group records, digest byte to split on next).
+		pending = [ (self.__partitionPath(part), self.__records[part], 1) for part in xrange(self.partitions - 1, -1, -1) ]
+		while pending:
+			path, records, level = pending.pop()
+			if records > self.maxRows and level < _DIGEST_SIZE:
+				for sub_path, sub_records in self.__split(path, level):
+					# A sub-partition that got every record cannot be split any
+					# further (they all belong to one hot address).
+					if sub_records == records:
+						pending.append( (sub_path, sub_records, _DIGEST_SIZE) )
+					elif sub_records:
+						pending.append( (sub_path, sub_records, level + 1) )
+					else:
+						os.remove(sub_path)
+					pass
+				continue
+			for group in self.__merge(path, records):
+				yield group
+			pass
+		return
+	
+	def close(self):
+		'''
+		Removes the spill files.
+		'''
+		self.__closed = True
+		self.__groups = {}
+		self.__held = 0
+		if self.__spillDir is not None:
+			shutil.rmtree(self.__spillDir, True)
+			self.__spillDir = None
+			pass
+		return
+	
+	def __partitionPath(self, part):
+		return os.path.join(self.__spillDir, 'part-%03d' % part)
+	
+	def __spill(self):
+		if self.__spillDir is None:
+			self.__spillDir = tempfile.mkdtemp(prefix='usps-dedupe-', dir=self.__tmpDir)
+			for part in xrange(self.partitions):
+				open(self.__partitionPath(part), 'wb').close()
+			self.__records = [0] * self.partitions
+			pass
+		part_files = {}
+		try:
+			for digest, (fields, row_ids) in self.__groups.iteritems():
+				part = ord(digest[0]) % self.partitions
+				part_file = part_files.get(part)
+				if part_file is None:
+					part_file = part_files[part] = open(self.__partitionPath(part), 'ab')
+				marshal.dump((digest, fields, row_ids), part_file)
+				self.__records[part] += 1
+				pass
+		finally:
+			for part_file in part_files.itervalues():
+				part_file.close()
+		self.__groups = {}
+		self.__held = 0
+		return
+	
+	def __split(self, path, level):
+		'''
+		Moves the group records of a spill file into _SUB_PARTITIONS files
+		chosen by byte level of the digest. Returns a list of (path, group
+		records) tuples.
+		'''
+		sub_paths = [ '%s-%02x' % (path, part) for part in xrange(_SUB_PARTITIONS) ]
+		sub_records = [0] * _SUB_PARTITIONS
+		sub_files = [ open(sub_path, 'wb') for sub_path in sub_paths ]
+		try:
+			part_file = open(path, 'rb')
+			try:
+				while True:
+					try:
+						record = marshal.load(part_file)
+					except EOFError:
+						break
+					part = ord(record[0][level]) % _SUB_PARTITIONS
+					marshal.dump(record, sub_files[part])
+					sub_records[part] += 1
+					pass
+			finally:
+				part_file.close()
+		finally:
+			for sub_file in sub_files:
+				sub_file.close()
+		os.remove(path)
+		return zip(sub_paths, sub_records)
+	
+	def __merge(self, path, records):
+		'''
+		Generator yielding the groups of a spill file, reading back the row IDs
+		of the groups it does not have room to hold.
+		'''
+		# digest -> [fields, row count, record offsets, row IDs or None]
+		merged = {}
+		held_rows = 0
+		streamed = False
+		part_file = open(path, 'rb')
+		try:
+			while True:
+				offset = part_file.tell()
+				try:
+					digest, fields, row_ids = marshal.load(part_file)
+				except EOFError:
+					break
+				group = merged.get(digest)
+				if group is None:
+					group = merged[digest] = [fields, 0, [], []]
+				group[1] += len(row_ids)
+				group[2].append(offset)
+				if group[3] is not None:
+					if held_rows + len(row_ids) <= self.maxRows:
+						group[3].extend(row_ids)
+						held_rows += len(row_ids)
+					else:
+						held_rows -= len(group[3])
+						group[3] = None
+						streamed = True
+					pass
+				pass
+		finally:
+			part_file.close()
+		self.peakHeld = max(self.peakHeld, held_rows + records)
+		if not streamed:
+			os.remove(path)
+		for fields, row_count, offsets, row_ids in merged.itervalues():
+			if row_ids is None:
+				row_ids = _SpilledRowIds(path, row_count, offsets)
+			yield (fields, row_ids)
+		return
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: _SpilledRowIds
+#
+# Description:
+# The row IDs of one group, left in a spill file and read back a record at a
+# time when iterated.
+#
+#-------------------------------------------------------------------------------
+class _SpilledRowIds(object):
+	
+	def __init__(self, path, row_count, offsets):
+		self.__path = path
+		self.__rowCount = row_count
+		self.__offsets = offsets
+		return
+	
+	def __len__(self):
+		return self.__rowCount
+	
+	def __iter__(self):
+		part_file = open(self.__path, 'rb')
+		try:
+			for offset in self.__offsets:
+				part_file.seek(offset)
+				for row_id in marshal.load(part_file)[2]:
+					yield row_id
+				pass
+		finally:
+			part_file.close()
+		return
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# function: verifyDeduplicated(rows, request_class=AddressVerRequest,
+#		max_rows=100000, partitions=64, tmp_dir=None, negative_cache=None,
+#		retries=0, deadline=None, stats=None)
+#
+# Description:
+# Verifies the addresses of any number of (row ID, address) pairs, sending
+# each unique normalized address to the server only once. The rows are run
+# through an ExternalDeduplicator, the unique addresses of each partition are
+# submitted through submitInBatches() (lazy responses), and the result of each
+# one is handed out to every row that had it. Upstream requests therefore drop
+# in proportion to the duplication of the input. Addresses are verified in
+# batches of at most max_rows row IDs, so memory stays bounded by a small
+# multiple of max_rows even when the input does not fit in memory.
+#
+# This is a generator: rows come out grouped by address, not in input order.
+#
+# Params:
+#	rows - iterable of (row ID, USPSAddress) tuples
+#	request_class - class; AddressVerRequest or ZipCodeLookupRequest
+#	max_rows, partitions, tmp_dir - passed on to the ExternalDeduplicator
+#	negative_cache, retries, deadline - passed on to submitInBatches()
+#	stats - dict or None; if given, the "rows" and "unique" counts are
+#		stored in it as the run goes (their ratio is the duplication factor)
+#
+# Yields:
+#	A (row ID, result, error) tuple for every input row. result is None where
+#	the server returned nothing for the address; error is the ErrorResponse
+#	(or lazy error record) reported for it, or None.
+#
+#-------------------------------------------------------------------------------
+def verifyDeduplicated(rows, request_class=AddressVerRequest, max_rows=100000, partitions=64,
+		tmp_dir=None, negative_cache=None, retries=0, deadline=None, stats=None):
+	'''
+	Verifies (row ID, address) pairs, sending each unique normalized address
+	only once, and yields a (row ID, result, error) tuple for every row.
+	'''
+	if stats is None:
+		stats = {}
+	stats['rows'] = 0
+	stats['unique'] = 0
+	dedupe = ExternalDeduplicator(max_rows, partitions, tmp_dir)
+	try:
+		for row_id, usps_addr in rows:
+			dedupe.add(row_id, usps_addr)
+		stats['rows'] = dedupe.rowCount
+		# Groups are verified in batches holding at most max_rows row IDs
+		# (or a single group, if it has more), not max_rows addresses.
+		batch = []
+		batch_rows = 0
+		for group in dedupe.groups():
+			if batch and batch_rows + len(group[1]) > max_rows:
+				for item in _verifyGroups(request_class, batch, negative_cache, retries, deadline, stats):
+					yield item
+				batch = []
+				batch_rows = 0
+				pass
+			batch.append(group)
+			batch_rows += len(group[1])
+			pass
+		if batch:
+			for item in _verifyGroups(request_class, batch, negative_cache, retries, deadline, stats):
+				yield item
+			pass
+	finally:
+		dedupe.close()
+	return
+
+#-------------------------------------------------------------------------------
+# function: _verifyGroups(request_class, groups, negative_cache, retries,
+#		deadline, stats)
+#
+# Description:
+# Submits the unique address of each (fields, row IDs) group and yields the
+# result for each of its rows.
+#
+#-------------------------------------------------------------------------------
+def _verifyGroups(request_class, groups, negative_cache, retries, deadline, stats):
+	results = submitInBatches(request_class,
+		( (str(idx), USPSAddress(**dict(zip(ADDRESS_FIELDS, fields)))) for idx, (fields, row_ids) in enumerate(groups) ),
+		lazy=True, negative_cache=negative_cache, retries=retries, deadline=deadline)
+	stats['unique'] += len(groups)
+	for idx, (fields, row_ids) in enumerate(groups):
+		result, error = results.lookup(idx)
+		for row_id in row_ids:
+			yield (row_id, result, error)
+		pass
+	return
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+'''
+File			:	incremental.py
+Package			:	usps_webtools.address_verify
+Brief			:	Incremental re-verification of address tables. A manifest
+					keeps a content hash, the verification time and the result
+					of every row, so that only new, changed or aged-out rows
+					are sent to the server on the next run.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import anydbm
+import hashlib
+import marshal
+import time
+
+from usps_webtools.errors import ERROR_PERMANENT, ErrorRecord, classifyError
+
+from usps_webtools.address_verify.addrstandards import AddressVerRequest
+from usps_webtools.address_verify.bulk import requestCacheKey, submitInBatches
+from usps_webtools.address_verify.usaddress import ADDRESS_FIELDS, USPSAddress, addressKey, joinKey
+
+#-------------------------------------------------------------------------------
+# function: contentHash(request_class, usps_addr)
+#
+# Description:
+# Returns the hex SHA-1 digest of the normalized fields of usps_addr (see
+# addressKey()) together with the name of the request class, so that a row
+# verified through one API is not taken as verified through another.
+#
+#-------------------------------------------------------------------------------
+def contentHash(request_class, usps_addr):
+	'''
+	Returns the hex SHA-1 digest of the request class name and the normalized
+	fields of usps_addr.
+	'''
+	return hashlib.sha1(joinKey((request_class.__name__,) + addressKey(usps_addr))).hexdigest()
+
+#-------------------------------------------------------------------------------
+# class: VerificationManifest
+#
+# Description:
+# Persistent record, kept in a dbm file, of the last verification of each row
+# of an address table: the content hash of the row's address, when it was
+# verified, and the address fields and error that came back. Row IDs are
+# compared as strings.
+#
+# Use as a context manager, or call close(), to flush the file.
+#
+# Public methods:
+#	get(row_id)
+#		Returns a (content hash, verified at, result, error) tuple for the row,
+#		or None if the row is not in the manifest. result is a USPSAddress (or
+#		None) and error a usps_webtools.errors.ErrorRecord (or None).
+#
+#	put(row_id, content_hash, verified_at, result, error=None)
+#		Records the verification of a row. result is anything with the
+#		USPSAddress fields, error anything with number/source/description.
+#
+#	discard(row_id)
+#		Forgets a row, e.g. one deleted from the table.
+#
+#	sync()
+#		Writes pending changes to disk, where the dbm module supports it.
+#
+#	close()
+#		Closes the dbm file.
+#
+#-------------------------------------------------------------------------------
+class VerificationManifest(object):
+	
+	def __init__(self, path, flag='c'):
+		self.path = path
+		self.__db = anydbm.open(path, flag)
+		return
+	
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+		return False
+	
+	def __len__(self):
+		return len(self.__db)
+	
+	def __contains__(self, row_id):
+		return self.__db.has_key(str(row_id))
+	
+	def get(self, row_id):
+		'''
+		Returns a (content hash, verified at, result, error) tuple for the row,
+		or None if the row is not in the manifest.
+		'''
+		row_id = str(row_id)
+		if not self.__db.has_key(row_id):
+			return None
+		content_hash, verified_at, fields, error_fields = marshal.loads(self.__db[row_id])
+		result = None
+		if fields is not None:
+			result = USPSAddress(**dict(zip(ADDRESS_FIELDS, fields)))
+		error = None
+		if error_fields is not None:
+			error = ErrorRecord(*error_fields)
+		return (content_hash, verified_at, result, error)
+	
+	def put(self, row_id, content_hash, verified_at, result, error=None):
+		'''
+		Records the verification of a row.
+		'''
+		fields = None
+		if result is not None:
+			fields = tuple([ getattr(result, name) or '' for name in ADDRESS_FIELDS ])
+		error_fields = None
+		if error is not None:
+			error_fields = (error.number or '', error.source or '', error.description or '')
+		self.__db[str(row_id)] = marshal.dumps((content_hash, float(verified_at), fields, error_fields))
+		return
+	
+	def discard(self, row_id):
+		'''
+		Forgets a row.
+		'''
+		row_id = str(row_id)
+		if self.__db.has_key(row_id):
+			del self.__db[row_id]
+		return
+	
+	def sync(self):
+		'''
+		Writes pending changes to disk, where the dbm module supports it.
+		'''
+		if hasattr(self.__db, 'sync'):
+			self.__db.sync()
+		return
+	
+	def close(self):
+		'''
+		Closes the dbm file.
+		'''
+		if self.__db is not None:
+			self.__db.close()
+			self.__db = None
+			pass
+		return
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# function: verifyIncremental(rows, manifest, request_class=AddressVerRequest,
+#		max_age=None, chunk_size=500, negative_cache=None, retries=0,
+#		deadline=None, stats=None, clock=time.time)
+#
+# Description:
+# Verifies the (row ID, address) pairs of a table against a
+# VerificationManifest. A row whose content hash matches the manifest and whose
+# verification is younger than max_age seconds is answered from the manifest
+# without a request; every other row (new, changed or aged out) is collected
+# and sent through submitInBatches() chunk_size rows at a time. Rows that come
+# back with a result, or with a permanent error reported against the address
+# itself (or answered from the negative cache), are written to the manifest.
+# Rows that failed for any other reason, including whole-request errors, are
+# left as they were, so the next run tries them again. The number of requests
+# is thus proportional to the number of rows that changed, not to the size of
+# the table.
+#
+# This is a generator: reused rows come out straight away, verified rows once
+# their chunk has been submitted, so the output is not in input order.
+#
+# Params:
+#	rows - iterable of (row ID, USPSAddress) tuples
+#	manifest - VerificationManifest
+#	request_class - class; AddressVerRequest or ZipCodeLookupRequest
+#	max_age - float; seconds after which a verification is redone even if
+#		the row has not changed, or None to keep verifications forever
+#	chunk_size - integer; rows collected before submitting
+#	negative_cache, retries, deadline - passed on to submitInBatches()
+#	stats - dict or None; if given, "rows", "reused", "verified" and "failed"
+#		counts are stored in it as the run goes
+#	clock - callable returning the current time
+#
+# Yields:
+#	A (row ID, result, error) tuple for every input row, as in
+#	usps_webtools.address_verify.dedupe.verifyDeduplicated().
+#
+#-------------------------------------------------------------------------------
+def verifyIncremental(rows, manifest, request_class=AddressVerRequest, max_age=None,
+		chunk_size=500, negative_cache=None, retries=0, deadline=None, stats=None,
+		clock=time.time):
+	'''
+	Verifies (row ID, address) pairs, sending only the rows that are new,
+	changed or aged out according to the manifest, and yields a
+	(row ID, result, error) tuple for every row.
+	'''
+	if stats is None:
+		stats = {}
+	for name in ('rows', 'reused', 'verified', 'failed'):
+		stats[name] = 0
+	pending = []
+	for row_id, usps_addr in rows:
+		stats['rows'] += 1
+		content_hash = contentHash(request_class, usps_addr)
+		entry = manifest.get(row_id)
+		if entry is not None and entry[0] == content_hash:
+			if max_age is None or clock() - entry[1] < max_age:
+				stats['reused'] += 1
+				yield (row_id, entry[2], entry[3])
+				continue
+			pass
+		pending.append( (row_id, content_hash, usps_addr) )
+		if len(pending) >= chunk_size:
+			for item in _verifyPending(request_class, pending, manifest, negative_cache, retries, deadline, stats, clock):
+				yield item
+			pending = []
+			pass
+		pass
+	if pending:
+		for item in _verifyPending(request_class, pending, manifest, negative_cache, retries, deadline, stats, clock):
+			yield item
+		pass
+	manifest.sync()
+	return
+
+#-------------------------------------------------------------------------------
+# function: _verifyPending(request_class, pending, manifest, negative_cache,
+#		retries, deadline, stats, clock)
+#
+# Description:
+# Submits a chunk of (row ID, content hash, address) tuples, records the
+# outcomes worth keeping in the manifest and yields the result of each row.
+#
+#-------------------------------------------------------------------------------
+def _verifyPending(request_class, pending, manifest, negative_cache, retries, deadline, stats, clock):
+	# Rows the negative cache answers have an error but no result; unlike
+	# whole-request errors, those errors are about the address itself.
+	from_negative_cache = set()
+	if negative_cache is not None:
+		for idx, (row_id, content_hash, usps_addr) in enumerate(pending):
+			if negative_cache.get(requestCacheKey(request_class, usps_addr)) is not None:
+				from_negative_cache.add(idx)
+			pass
+		pass
+	results = submitInBatches(request_class,
+		( (str(idx), usps_addr) for idx, (row_id, content_hash, usps_addr) in enumerate(pending) ),
+		lazy=True, negative_cache=negative_cache, retries=retries, deadline=deadline)
+	verified_at = clock()
+	for idx, (row_id, content_hash, usps_addr) in enumerate(pending):
+		result, error = results.lookup(idx)
+		# Keep results and permanent per-address errors; anything else is
+		# retried on the next run. An error without a result is a whole-request
+		# error, unless the negative cache supplied it.
+		if error is None:
+			keep = result is not None
+		elif result is not None or idx in from_negative_cache:
+			keep = classifyError(error) == ERROR_PERMANENT
+		else:
+			keep = False
+		if keep:
+			manifest.put(row_id, content_hash, verified_at, result, error)
+			stats['verified'] += 1
+		else:
+			stats['failed'] += 1
+		yield (row_id, result, error)
+		pass
+	return
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+'''
+File			:	prefixindex.py
+Package			:	usps_webtools.address_verify
+Brief			:	Local prefix index over addresses already verified by USPS,
+					for address suggestions while the user types.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import bisect
+import marshal
+import os
+
+from usps_webtools.address_verify.usaddress import ADDRESS_FIELDS, USPSAddress, normalizeAddressField
+
+# Magic bytes and format version at the start of a saved index.
+INDEX_MAGIC = 'USPSPFX1'
+
+#-------------------------------------------------------------------------------
+# class: AddressPrefixIndex
+#
+# Description:
+# Verified addresses grouped by ZIP5, each group kept as a sorted array of
+# normalized street lines (address2, followed by address1 when there is one)
+# with the address fields alongside. A prefix query is a binary search in the
+# ZIP5's array followed by a short scan, so it does not depend on the number of
+# other ZIP codes indexed. Addresses can be added at any time.
+#
+# Public methods:
+#	add(usps_addr)
+#		Adds a verified address (USPSAddress or lazy record). Addresses without
+#		a ZIP5 or street line, and exact duplicates, are ignored. Returns True
+#		if the address was added.
+#
+#	addResults(results)
+#		Adds every address of a usps_webtools.results.ResultIndex that has no
+#		error. Returns the number of addresses added.
+#
+#	query(zip5, prefix, limit=10)
+#		Returns up to limit USPSAddress instances in ZIP code zip5 whose street
+#		line starts with prefix (compared after normalization), in order.
+#
+#	save(path)
+#		Writes the index to a file.
+#
+#	load(path) (class method)
+#		Reads an index written by save().
+#
+#-------------------------------------------------------------------------------
+class AddressPrefixIndex(object):
+	
+	def __init__(self):
+		# zip5 -> (sorted street lines, address field tuples in the same order)
+		self.__zips = {}
+		self.__count = 0
+		return
+	
+	def __len__(self):
+		return self.__count
+	
+	def add(self, usps_addr):
+		'''
+		Adds a verified address. Returns True if the address was added.
+		'''
+		zip5 = normalizeAddressField(usps_addr.zip5)
+		street = _streetLine(usps_addr.address2, usps_addr.address1)
+		if not zip5 or not street:
+			return False
+		record = tuple([ getattr(usps_addr, name) or '' for name in ADDRESS_FIELDS ])
+		keys, records = self.__zips.setdefault(zip5, ([], []))
+		pos = bisect.bisect_left(keys, street)
+		end = bisect.bisect_right(keys, street, pos)
+		if record in records[pos:end]:
+			return False
+		keys.insert(end, street)
+		records.insert(end, record)
+		self.__count += 1
+		return True
+	
+	def addResults(self, results):
+		'''
+		Adds every address of a ResultIndex that has no error. Returns the
+		number of addresses added.
+		'''
+		added = 0
+		for addr_id, usps_addr in results.items():
+			if results.error(addr_id) is None and self.add(usps_addr):
+				added += 1
+			pass
+		return added
+	
+	def query(self, zip5, prefix, limit=10):
+		'''
+		Returns up to limit USPSAddress instances in ZIP code zip5 whose
+		street line starts with prefix.
+		'''
+		group = self.__zips.get(normalizeAddressField(zip5))
+		if group is None:
+			return []
+		keys, records = group
+		prefix = normalizeAddressField(prefix)
+		pos = bisect.bisect_left(keys, prefix)
+		matches = []
+		while pos < len(keys) and len(matches) < limit and keys[pos].startswith(prefix):
+			matches.append(USPSAddress(**dict(zip(ADDRESS_FIELDS, records[pos]))))
+			pos += 1
+			pass
+		return matches
+	
+	def save(self, path):
+		'''
+		Writes the index to a file. The file is written under a temporary name
+		and renamed into place, so readers never see a partial index.
+		'''
+		tmp_path = '%s.%d.tmp' % (path, os.getpid())
+		index_file = open(tmp_path, 'wb')
+		try:
+			index_file.write(INDEX_MAGIC)
+			marshal.dump(self.__zips, index_file)
+		finally:
+			index_file.close()
+		os.rename(tmp_path, path)
+		return
+	
+	@classmethod
+	def load(cls, path):
+		'''
+		Reads an index written by save().
+		'''
+		index_file = open(path, 'rb')
+		try:
+			if index_file.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+				raise ValueError('%s is not an address prefix index.' % path)
+			zips = marshal.load(index_file)
+		finally:
+			index_file.close()
+		index = cls()
+		index.__zips = zips
+		index.__count = sum([ len(keys) for keys, records in zips.itervalues() ])
+		return index
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# function: _streetLine(address2, address1)
+#
+# Description:
+# The normalized street line used as the index key: the street address
+# (address2) followed by the apartment/suite (address1), if any. Empty when
+# there is no street address.
+#
+#-------------------------------------------------------------------------------
+def _streetLine(address2, address1):
+	street = normalizeAddressField(address2)
+	unit = normalizeAddressField(address1)
+	if street and unit:
+		return street + ' ' + unit
+	return street
@@ -7,8 +7,80 @@ Author			:	William M. Clifford
 --------------------------------------------------------------------------------
 '''
 
+import logging
+import string
+
+# Per-address <Error> elements are wrapped in an ErrorResponse.
+from usps_webtools.base import ErrorResponse
+
 # Grab the utility functions
-from usps_webtools.utility import createXmlElement, getXmlElementContents
+from usps_webtools.utility import createXmlElement, getXmlElement, getXmlElementContents
+
+# Lazily-decoded record support.
+from usps_webtools.lazy import LazyRecord, lazyField
+
+log = logging.getLogger(__name__)
+
+# Names of the USPSAddress fields, in the order used by the request XML.
+ADDRESS_FIELDS = ('firmName', 'address1', 'address2', 'city', 'state', 'zip5', 'zip4')
+
+# Separator placed between the parts of a key (see joinKey()). Being a control
+# character, it never appears in a normalized field.
+KEY_SEPARATOR = '\x1f'
+
+# Translation table turning the ASCII control characters into spaces.
+_CONTROL_TO_SPACE = string.maketrans(''.join([ chr(code) for code in xrange(32) ]), ' ' * 32)
+
+#-------------------------------------------------------------------------------
+# function: normalizeAddressField(value)
+#
+# Description:
+# Normalizes a single address field for comparison purposes: None becomes an
+# empty string, letters are upper-cased and runs of whitespace and control
+# characters are collapsed to a single space.
+#
+#-------------------------------------------------------------------------------
+def normalizeAddressField(value):
+	'''
+	Normalizes a single address field for comparison purposes.
+	'''
+	if value is None:
+		return ''
+	return ' '.join(str(value).upper().translate(_CONTROL_TO_SPACE).split())
+
+#-------------------------------------------------------------------------------
+# function: joinKey(parts)
+#
+# Description:
+# Joins the parts of a key (normalized fields, request class names) into one
+# string, e.g. for hashing. The parts must not contain KEY_SEPARATOR, which
+# normalizeAddressField() guarantees; a ValueError is raised otherwise.
+#
+#-------------------------------------------------------------------------------
+def joinKey(parts):
+	'''
+	Joins the parts of a key into one string, separated by KEY_SEPARATOR.
+	'''
+	for part in parts:
+		if KEY_SEPARATOR in part:
+			raise ValueError('Key part %r contains the key separator.' % part)
+		pass
+	return KEY_SEPARATOR.join(parts)
+
+#-------------------------------------------------------------------------------
+# function: addressKey(usps_addr)
+#
+# Description:
+# Returns a tuple of the normalized fields of the address, in ADDRESS_FIELDS
+# order, suitable as a dictionary key when matching up equivalent addresses.
+#
+#-------------------------------------------------------------------------------
+def addressKey(usps_addr):
+	'''
+	Returns a tuple of the normalized fields of the address, suitable as a
+	dictionary key when matching up equivalent addresses.
+	'''
+	return tuple([ normalizeAddressField(getattr(usps_addr, name)) for name in ADDRESS_FIELDS ])
 
 #-------------------------------------------------------------------------------
 # class: USPSAddress
@@ -21,6 +93,8 @@ from usps_webtools.utility import createXmlElement, getXmlElementContents
 #	state - string; 2-character abbreviation
 #	zip5 - string; 5-digit zip code
 #	zip4 - string; the zip+4 4-digit zip code
+#	error - ErrorResponse; the error reported by the server for this address,
+#		or None (read-only, set by parseFromXML)
 #
 #	Must provide either city & state or zip5 when requesting address
 #	verification. Also note that address1 & address2 work backwards from what
@@ -49,6 +123,7 @@ class USPSAddress(object):
 		self.state = kw.get('state', '')
 		self.zip4 = kw.get('zip4', '')
 		self.zip5 = kw.get('zip5', '')
+		self.__error = None
 		return
 	
 	def __str__(self):
@@ -139,6 +214,14 @@ class USPSAddress(object):
 			self.__zip5 = str(value).strip()
 		return
 	
+	@property
+	def error(self):
+		return self.__error
+	
+	@property
+	def valid(self):
+		return self.__error is None
+	
 	def appendToXml(self, address_id, parent_element):
 		'''
 		Generates an XML DOM node beneath the given parent node, forming the
@@ -176,10 +259,60 @@ class USPSAddress(object):
 				self.__setattr__(fieldName, fieldValue)
 				pass
 			except Exception, ex:
-				sys.stderr.write('USPSAddress.parseFromXML(): Failed to parse element %s from XML.\n\t%s\n' % (elemName, str(ex)))
+				log.warning('USPSAddress.parseFromXML(): Failed to parse element %s from XML: %s', elemName, ex)
 				pass
 			pass
+		# The server reports per-address problems as a nested <Error>.
+		err_elem = getXmlElement(xmlpath_ctx, './Error')
+		if err_elem:
+			self.__error = ErrorResponse(err_elem)
 		return
 	
 	pass
 
+
+#-------------------------------------------------------------------------------
+# class: LazyUSPSAddress
+# inherits: usps_webtools.lazy.LazyRecord
+#
+# Description:
+#	Read-only counterpart to USPSAddress used by the lazy responses. Exposes
+#	the same field properties, each decoded from the response text only when
+#	first read.
+#
+# Public methods:
+#	materialize()
+#		Returns a USPSAddress instance holding all the fields of the record.
+#
+#-------------------------------------------------------------------------------
+class LazyUSPSAddress(LazyRecord):
+	__slots__ = ()
+	
+	FIELDS = (
+		('firmName', 'FirmName'),
+		('address1', 'Address1'),
+		('address2', 'Address2'),
+		('city', 'City'),
+		('state', 'State'),
+		('zip5', 'Zip5'),
+		('zip4', 'Zip4'),
+		)
+	
+	firmName = lazyField('FirmName')
+	address1 = lazyField('Address1')
+	address2 = lazyField('Address2')
+	city = lazyField('City')
+	state = lazyField('State')
+	zip5 = lazyField('Zip5')
+	zip4 = lazyField('Zip4')
+	
+	def __str__(self):
+		return str(self.materialize())
+	
+	def materialize(self):
+		'''
+		Returns a USPSAddress instance holding all the fields of the record.
+		'''
+		return USPSAddress(**dict([ (name, getattr(self, name)) for name, elemName in self.FIELDS ]))
+	
+	pass
@@ -7,16 +7,21 @@ Author			:	William M. Clifford
 --------------------------------------------------------------------------------
 '''
 
+import logging
 import os
 import xml.dom.minidom
 
-USPS_USER_ID = os.environ['USPS_USER_ID']
+# Default user ID, used unless RequestBase.CREDENTIAL_POOL hands one out.
+USPS_USER_ID = os.environ.get('USPS_USER_ID', '')
+
+log = logging.getLogger(__name__)
 
 # Import the base request and response objects.
 from usps_webtools.base import RequestBase, ResponseBase
+from usps_webtools.lazy import LazyResponseBase
 
 # Import the USPSAddress class for use with the response/request classes.
-from usps_webtools.address_verify.usaddress import USPSAddress
+from usps_webtools.address_verify.usaddress import USPSAddress, LazyUSPSAddress
 
 # Grab the utility functions
 from usps_webtools.utility import createXmlElement, getXmlElement, getXmlElementContents
@@ -49,8 +54,8 @@ class ZipCodeLookupResponse(ResponseBase):
 		try:
 			root_element = getXmlElement(elem, '/ZipCodeLookupResponse')
 		except Exception:
-			sys.stderr.write('ZipCodeLookupResponse._parseElement(): XML document root element is not of expected value.\n')
-			sys.stderr.write('\tExpecting "<ZipCodeLookupResponse>", got "<%s>".\n' % elem.name)
+			log.warning('ZipCodeLookupResponse._parseElement(): XML document root element is not of expected value.'
+				' Expecting "<ZipCodeLookupResponse>", got "<%s>".', elem.name)
 			return
 		# Get each of the addresses that were validated.
 		for addr_elem in elem.xpathEval('/ZipCodeLookupResponse/Address'):
@@ -64,27 +69,71 @@ class ZipCodeLookupResponse(ResponseBase):
 	pass
 
 
+#-------------------------------------------------------------------------------
+# class: LazyZipCodeLookupResponse
+# inherits: usps_webtools.lazy.LazyResponseBase
+#
+# Description:
+#	Lazily-decoded variant of ZipCodeLookupResponse. The response text is kept
+#	and the <Address> elements are only located; their fields are decoded on
+#	access. Used by ZipCodeLookupRequest.submit(lazy=True).
+#
+#-------------------------------------------------------------------------------
+class LazyZipCodeLookupResponse(LazyResponseBase):
+	ROOT_ELEMENT_NAME = 'ZipCodeLookupResponse'
+	ELEMENT_NAME = 'Address'
+	RECORD_CLASS = LazyUSPSAddress
+	
+	def __str__(self):
+		s = ('=' * 72) + '\nUSPS Zip Code Lookup - Response\n' + ('=' * 72) + '\n'
+		for k, v in self.addresses:
+			s += 'ADDRESS ID "%s"\n' % k
+			s += str(v)
+			pass
+		return s
+	
+	pass
+
 #-------------------------------------------------------------------------------
 # class: ZipCodeLookupRequest
 #-------------------------------------------------------------------------------
 class ZipCodeLookupRequest(RequestBase):
 	SERVER_REQUEST_URI = 'http://production.shippingapis.com/ShippingAPI.dll'
 	RESPONSE_CLASS = ZipCodeLookupResponse
+	LAZY_RESPONSE_CLASS = LazyZipCodeLookupResponse
 	
 	def __init__(self):
 		RequestBase.__init__(self)
 		self._api = 'ZipCodeLookup'
 		self.__addresses = {}
+		self.__addr_ids = []
 		return
 	
+	@property
+	def addressIds(self):
+		'''
+		The IDs of the addresses in the request, in the order they were added.
+		'''
+		return tuple(self.__addr_ids)
+	
 	def addAddress(self, addr_id, usps_addr):
-		if len(self.__addresses) >= 5:
+		if len(self.__addresses) >= 5 and addr_id not in self.__addresses:
 			raise ValueError('USPS zip code lookup only allows up to 5 addresses per request.')
+		if addr_id not in self.__addresses:
+			self.__addr_ids.append(addr_id)
 		self.__addresses[addr_id] = usps_addr
 		return
 	
 	def clearAddresses(self):
 		self.__addresses.clear()
+		del self.__addr_ids[:]
+	
+	def _defaultUserId(self):
+		'''
+		Returns the module's USPS_USER_ID, sent when no credential pool is
+		installed.
+		'''
+		return USPS_USER_ID
 	
 	def _constructDOM(self):
 		'''
@@ -93,11 +142,9 @@ class ZipCodeLookupRequest(RequestBase):
 		'''
 		xd = xml.dom.minidom.Document()
 		root_elem = xd.createElement('ZipCodeLookupRequest')
-		root_elem.setAttribute('USERID', USPS_USER_ID)
-		# We want to add all our addresses.
-		addr_ids = self.__addresses.keys()
-		addr_ids.sort()
-		for addr_id in addr_ids:
+		root_elem.setAttribute('USERID', self.userId or self._defaultUserId())
+		# We want to add all our addresses, in the order they were added.
+		for addr_id in self.__addr_ids:
 			usps_addr = self.__addresses[addr_id]
 			usps_addr.appendToXml(addr_id, root_elem)
 			pass
@@ -8,44 +8,32 @@ Author			:	William M. Clifford
 --------------------------------------------------------------------------------
 '''
 
-import libxml2
-import urllib
+import contextlib
+import logging
 
-#-------------------------------------------------------------------------------
-# class: ResponseBase
-#
-# Description:
-# Base response class. All of the response handling classes in the usps_webtools
-# package and its subpackages should derive from this class, implementing the
-# _parseElement() method.
-#
-# Public methods:
-#	None
-#
-# Protected methods:
-#	_parseElement(elem)
-#		Parses the provided XML element, populating the fields of the response
-#		object with the data in the XML element and its child nodes. Since
-#		each response object will expose different kinds of data, this base
-#		interface is left abstract.
-#
-#-------------------------------------------------------------------------------
-class ResponseBase(object):
-	
-	def _parseElement(self, elem):
-		'''
-		Parses the provided XML element, filling the fields of the object with
-		the data in the XML element.
-		'''
-		pass
-	
-	pass
+log = logging.getLogger(__name__)
+
+# The ResponseBase class lives in its own module, so that the errors module
+# can subclass it without importing this one.
+from usps_webtools.response import ResponseBase
 
-# Forward declaration of the ErrorResponse class, based on ResponseBase.
-from usps_webtools.errors import ErrorResponse
+# The ErrorResponse class, based on ResponseBase.
+from usps_webtools.errors import ConfigurationError, ErrorResponse
 
-# Utility function used to parse out XPATH elements from the response XML.
-from usps_webtools.utility import getXmlElement
+# Utility functions used to parse out XPATH elements from the response XML.
+from usps_webtools.utility import getXmlElement, isPlainXml, parsedXmlDocument, rootElementName
+
+# The default transport used to talk to the USPS server.
+from usps_webtools.transport import HttpTransport, encodePostData
+
+# Priority classes used by the optional request scheduler.
+from usps_webtools.scheduler import PRIORITY_NORMAL
+
+# Sampling of the request/response dumps written in TEST mode.
+from usps_webtools.diagnostics import samplePayload
+
+# Per-call time budgets.
+from usps_webtools.deadline import DeadlineExceeded, remainingTimeout
 
 #-------------------------------------------------------------------------------
 # class: RequestBase
@@ -56,9 +44,34 @@ from usps_webtools.utility import getXmlElement
 #
 #	OPERATION_MODE - string; "TEST" or "PRODUCTION" (static)
 #
+#	PAYLOAD_SAMPLE_RATE - float; in TEST mode, the fraction (0.0 - 1.0) of
+#		requests whose post data, request XML and response text are logged
+#		(at DEBUG level, to the usps_webtools.base logger). (static)
+#
 #	RESPONSE_CLASS - class; the ResponseBase descendant that will interpret the
 #		response given by the USPS server. (static)
 #
+#	LAZY_RESPONSE_CLASS - class; the usps_webtools.lazy.LazyResponseBase
+#		descendant used instead of RESPONSE_CLASS when a lazy response is
+#		requested, or None if the request has no lazy counterpart. (static)
+#
+#	TRANSPORT - object; carries the request to the server and returns the
+#		response text through its send(api, xml_txt, req_uri, timeout=None)
+#		method.
+#		Defaults to an HttpTransport, which negotiates gzip/deflate compressed
+#		responses. RecordingTransport and ReplayTransport (see
+#		usps_webtools.transport) capture and replay exchanges for offline
+#		load testing. (static)
+#
+#	SCHEDULER - usps_webtools.scheduler.RequestScheduler; when set, every
+#		request waits for admission by the scheduler (according to its
+#		priority) before it is sent. None by default. (static)
+#
+#	CREDENTIAL_POOL - usps_webtools.credentials.CredentialPool; when set, each
+#		submit() takes a user ID from the pool instead of the module-level
+#		USPS_USER_ID, and reports back whether the server accepted it. None
+#		by default. (static)
+#
 #	SERVER_REQUEST_URI - string; the URI to which the request will be sent.
 #		This should be the complete URI, including the http:/https: prefix.
 #		Note that this will be modified according to the value of OPERATION_MODE
@@ -67,12 +80,28 @@ from usps_webtools.utility import getXmlElement
 #
 #	xml - string; the XML request as a string.
 #
+#	userId - string; the user ID taken from CREDENTIAL_POOL by the last
+#		submit(), or None.
+#
+#	priority - integer; the scheduler priority class of the request, one of
+#		the PRIORITY_* values in usps_webtools.scheduler. Defaults to
+#		PRIORITY_NORMAL.
+#
 # Public methods:
 #
-#	submit()
+#	submit(lazy=False, deadline=None)
 #		Submits the request to the USPS webserver, posting the API and XML
 #		request text, and uses an instance of the RESPONSE_CLASS class to
-#		interpret the response received from the server.
+#		interpret the response received from the server. Where lazy is True
+#		and the request defines a LAZY_RESPONSE_CLASS, that class is used
+#		instead; it keeps the response text and decodes fields on access.
+#		Responses containing comments, CDATA sections, processing
+#		instructions or a DOCTYPE are parsed in full all the same.
+#		Where a usps_webtools.deadline.Deadline is given, the scheduler wait,
+#		credential selection and network I/O are limited to its remaining
+#		time, and the request is dropped (None is returned) as soon as the
+#		deadline has passed. Raises usps_webtools.errors.ConfigurationError
+#		if there is neither a CREDENTIAL_POOL nor a default user ID.
 #
 # Protected properties:
 #
@@ -81,6 +110,17 @@ from usps_webtools.utility import getXmlElement
 #
 # Protected methods:
 #
+#	_transmit(xml_txt, deadline=None)
+#		Sends the request XML through the TRANSPORT and returns the response
+#		text.
+#
+#	_defaultUserId()
+#		Returns the user ID sent when no CREDENTIAL_POOL is installed: the
+#		USPS_USER_ID of the request's module. '' here.
+#
+#	_parseResponse(resp_txt, lazy=False)
+#		Turns the response text into a response object.
+#
 #	_constructDOM()
 #		Constructs the XML DOM document that describes the contents of the
 #		Request instance. This is utilized by the xml property, calling
@@ -98,69 +138,186 @@ class RequestBase(object):
 	# "MyResponseClass").
 	RESPONSE_CLASS = None
 	
+	# The lazily-decoding counterpart of RESPONSE_CLASS, used by submit() when
+	# asked for a lazy response. None where there is no such class.
+	LAZY_RESPONSE_CLASS = None
+	
 	# Operating in TEST or PRODUCTION mode.
 	OPERATION_MODE = 'PRODUCTION'
 	
+	# Fraction of the requests whose payloads are dumped in TEST mode.
+	PAYLOAD_SAMPLE_RATE = 1.0
+	
+	# The transport used to exchange the request for the response text.
+	TRANSPORT = HttpTransport()
+	
+	# Admission control shared by all requests, or None.
+	SCHEDULER = None
+	
+	# Pool of USPS user IDs to spread requests over, or None.
+	CREDENTIAL_POOL = None
+	
 	def __init__(self):
 		self._api = ''
+		self._userId = None
+		self.priority = PRIORITY_NORMAL
 		return
 	
-	def submit(self):
+	def submit(self, lazy=False, deadline=None):
 		'''
 		Submits the request to the USPS webserver, posting the API and XML
 		request text, and uses an instance of the RESPONSE_CLASS class to
-		interpret the response received from the server.
+		interpret the response received from the server. Where lazy is True,
+		LAZY_RESPONSE_CLASS is used instead (if the request has one), leaving
+		the fields of the response undecoded until they are accessed. Where a
+		deadline is given, every stage is limited to the time it has left and
+		None is returned once it has passed.
 		'''
 		resp_obj = None
-		post_data = urllib.urlencode({
-			'API': self._api,
-			'XML': self.xml,
-			})
+		credential = None
 		try:
-			req_uri = self.SERVER_REQUEST_URI
-			if self.OPERATION_MODE == 'TEST':
-				req_uri = req_uri.replace('API.dll', 'APITest.dll')
-				if req_uri.startswith('https:'):
-					req_uri = req_uri.replace('production', 'secure')
+			try:
+				with self._admission(deadline):
+					# With a credential pool, the user ID is picked per request,
+					# so the XML can only be built once one has been handed out.
+					if self.CREDENTIAL_POOL is not None:
+						credential = self.CREDENTIAL_POOL.acquire(remainingTimeout(deadline))
+						if credential is None:
+							if deadline is not None:
+								deadline.check('waiting for a USPS credential')
+							raise LookupError('no usable USPS credential available')
+						self._userId = credential.userId
+					elif not self._defaultUserId():
+						raise ConfigurationError('No USPS user ID configured: set the USPS_USER_ID environment variable or install a CREDENTIAL_POOL.')
+					resp_txt = self._transmit(self.xml, deadline)
+					pass
+				# The response may have arrived too late to be of any use.
+				if deadline is not None:
+					deadline.check('before parsing the response')
+				pass
+			except DeadlineExceeded, ex:
+				log.warning('Dropping %s request: %s', self._api, ex)
+				return None
+			except ConfigurationError:
+				raise
+			except Exception, ex:
+				if deadline is not None and deadline.expired:
+					# Most likely the transport timing out on the deadline.
+					log.warning('Dropping %s request: deadline of %.3fs passed: %s', self._api, deadline.budget, ex)
 				else:
-					req_uri = req_uri.replace('production', 'testing')
-				sys.stderr.write('TESTING MODE := ON\nRequest URI := %s\n' % req_uri)
-				sys.stderr.write('Post data := %s\n' % str(post_data))
-				sys.stderr.write('self.xml := %s\n' % self.xml)
+					log.error('Unable to retrieve request: %s', ex)
+				return None
+			resp_obj = self._parseResponse(resp_txt, lazy)
+			return resp_obj
+		finally:
+			if credential is not None:
+				self.CREDENTIAL_POOL.release(credential, resp_obj)
+			pass
+		pass
+	
+	@property
+	def userId(self):
+		'''
+		The USPS user ID sent with the request: the one handed out by the
+		credential pool for the last submit(), or None to use the USPS_USER_ID
+		of the request's module.
+		'''
+		return self._userId
+	
+	def _defaultUserId(self):
+		'''
+		Returns the user ID sent when no CREDENTIAL_POOL is installed.
+		'''
+		return ''
+	
+	@contextlib.contextmanager
+	def _admission(self, deadline=None):
+		'''
+		Context manager holding a slot of the SCHEDULER, if there is one, for
+		the duration of the with block. Raises DeadlineExceeded if the deadline
+		passes while waiting for the slot.
+		'''
+		if deadline is not None:
+			deadline.check('before the request was queued')
+		if self.SCHEDULER is None:
+			yield
+			return
+		if not self.SCHEDULER.acquire(self.priority, remainingTimeout(deadline)):
+			raise DeadlineExceeded('deadline of %.3fs passed while queued for the scheduler' % deadline.budget)
+		try:
+			yield
+		finally:
+			self.SCHEDULER.release()
+		return
+	
+	def _transmit(self, xml_txt, deadline=None):
+		'''
+		Sends the request XML to the server through the TRANSPORT, returning
+		the response text. Work whose deadline has passed is not sent at all.
+		Errors propagate to the caller.
+		'''
+		req_uri = self.SERVER_REQUEST_URI
+		dump_payload = False
+		if self.OPERATION_MODE == 'TEST':
+			req_uri = req_uri.replace('API.dll', 'APITest.dll')
+			if req_uri.startswith('https:'):
+				req_uri = req_uri.replace('production', 'secure')
+			else:
+				req_uri = req_uri.replace('production', 'testing')
+			log.info('TESTING MODE := ON, Request URI := %s', req_uri)
+			dump_payload = log.isEnabledFor(logging.DEBUG) and samplePayload(self.PAYLOAD_SAMPLE_RATE)
+			if dump_payload:
+				log.debug('Post data := %s', encodePostData(self._api, xml_txt))
+				log.debug('self.xml := %s', xml_txt)
 				pass
-			url_handle = urllib.urlopen(req_uri, post_data)
-			resp_txt = url_handle.read()
-			url_handle.close()
-			# Dump the XML response if testing.
-			if self.OPERATION_MODE == 'TEST':
-				sys.stderr.write('Response text:\n%s\n' % resp_txt)
+			pass
+		if deadline is not None:
+			deadline.check('before the request was sent')
+		resp_txt = self.TRANSPORT.send(self._api, xml_txt, req_uri, timeout=remainingTimeout(deadline))
+		# Dump the XML response if testing.
+		if dump_payload:
+			log.debug('Response text:\n%s', resp_txt)
+		return resp_txt
+	
+	def _parseResponse(self, resp_txt, lazy=False):
+		'''
+		Turns the response text into a response object (see submit()),
+		returning None if it cannot be parsed.
+		'''
+		resp_obj = None
+		# Lazy responses only need the response text; <Error> responses, and
+		# responses with markup the text scan does not handle (comments, CDATA
+		# sections, ...), still go through the full parse below.
+		if lazy and self.LAZY_RESPONSE_CLASS is not None and isPlainXml(resp_txt):
+			try:
+				root_name = rootElementName(resp_txt)
+				if root_name and root_name.upper() != 'ERROR':
+					return self.LAZY_RESPONSE_CLASS(resp_txt)
 				pass
+			except Exception, ex:
+				log.error('Unable to scan response text: %s', ex)
+				return None
 			pass
-		except Exception, ex:
-			sys.stderr.write('Unable to retrieve request: %s\n' % str(ex))
-			return None
 		# Parse the response text into a response object.
 		try:
 			# The response class should be identified by the request class
-			# using the RESPONSE_CLASS class-level value.
-			xd = libxml2.parseMemory(resp_txt, len(resp_txt))
-			ctx = xd.xpathNewContext()
-			# Check for an error response as the root of the XML document.
-			root_elem = getXmlElement(ctx, '/*')
-			if root_elem:
-				# Check to see if the root element is <Error>
-				if root_elem.name.upper() == 'ERROR':
-					resp_obj = ErrorResponse(root_elem)
-				else:
-					resp_obj = self.RESPONSE_CLASS(root_elem)
+			# using the RESPONSE_CLASS class-level value. The libxml2 document
+			# and XPATH context are released on the way out of the with block,
+			# whether or not the response class managed to parse the text.
+			with parsedXmlDocument(resp_txt) as (xd, ctx):
+				# Check for an error response as the root of the XML document.
+				root_elem = getXmlElement(ctx, '/*')
+				if root_elem:
+					# Check to see if the root element is <Error>
+					if root_elem.name.upper() == 'ERROR':
+						resp_obj = ErrorResponse(root_elem)
+					else:
+						resp_obj = self.RESPONSE_CLASS(root_elem)
+					pass
 				pass
-			# At this point the response object has parsed the XML text.
-			# Release the libxml2 XML document.
-			xd.freeDoc()
-			ctx.xpathFreeContext()
 			pass
 		except Exception, ex:
-			sys.stderr.write('Unable to parse response text: %s\n' % str(ex))
+			log.error('Unable to parse response text: %s', ex)
 			return None
 		return resp_obj
 	
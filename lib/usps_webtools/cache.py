@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+'''
+File			:	cache.py
+Package			:	usps_webtools
+Brief			:	In-process caches with per-entry expiry, used to answer
+					repeated lookups without going back to the USPS server.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import heapq
+import threading
+import time
+
+# Error classification used to decide what is worth remembering.
+from usps_webtools.errors import ERROR_PERMANENT, ErrorRecord, classifyError
+
+#-------------------------------------------------------------------------------
+# class: TTLCache
+#
+# Description:
+# Thread-safe dictionary-like cache where each entry expires ttl seconds after
+# it was stored. Expired entries are dropped lazily when looked up, and in bulk
+# when the cache grows past maxsize; if that does not free enough room, the
+# entries closest to expiry are evicted.
+#
+# Public properties:
+#	ttl - float; default lifetime of an entry, in seconds
+#
+#	maxsize - integer; maximum number of entries, or None for no limit
+#
+# Public methods:
+#	get(key, default=None)
+#		Returns the live value stored for key, or default.
+#
+#	put(key, value, ttl=None)
+#		Stores value for key, expiring after ttl seconds (default: self.ttl).
+#
+#	discard(key)
+#		Removes key from the cache if present.
+#
+#	clear()
+#		Removes every entry.
+#
+#	purge()
+#		Removes the expired entries, returning how many were removed.
+#
+#-------------------------------------------------------------------------------
+class TTLCache(object):
+	
+	def __init__(self, ttl=3600.0, maxsize=None, clock=time.time):
+		self.ttl = ttl
+		self.maxsize = maxsize
+		self._clock = clock
+		self._lock = threading.Lock()
+		self._entries = {}
+		return
+	
+	def __len__(self):
+		return len(self._entries)
+	
+	def __contains__(self, key):
+		return self.get(key, self) is not self
+	
+	def get(self, key, default=None):
+		'''
+		Returns the live value stored for key, or default.
+		'''
+		entry = self._entries.get(key)
+		if entry is None:
+			return default
+		if entry[0] <= self._clock():
+			self._lock.acquire()
+			try:
+				# Only drop it if nobody stored a fresh value meanwhile.
+				if self._entries.get(key) is entry:
+					del self._entries[key]
+			finally:
+				self._lock.release()
+			return default
+		return entry[1]
+	
+	def put(self, key, value, ttl=None):
+		'''
+		Stores value for key, expiring after ttl seconds (default: self.ttl).
+		'''
+		if ttl is None:
+			ttl = self.ttl
+		self._lock.acquire()
+		try:
+			self._entries[key] = (self._clock() + ttl, value)
+			if self.maxsize is not None and len(self._entries) > self.maxsize:
+				self._shrink()
+		finally:
+			self._lock.release()
+		return
+	
+	def discard(self, key):
+		'''
+		Removes key from the cache if present.
+		'''
+		self._lock.acquire()
+		try:
+			self._entries.pop(key, None)
+		finally:
+			self._lock.release()
+		return
+	
+	def clear(self):
+		'''
+		Removes every entry.
+		'''
+		self._lock.acquire()
+		try:
+			self._entries.clear()
+		finally:
+			self._lock.release()
+		return
+	
+	def purge(self):
+		'''
+		Removes the expired entries, returning how many were removed.
+		'''
+		self._lock.acquire()
+		try:
+			return self._purge()
+		finally:
+			self._lock.release()
+		pass
+	
+	def _purge(self):
+		now = self._clock()
+		expired = [ key for key, entry in self._entries.iteritems() if entry[0] <= now ]
+		for key in expired:
+			del self._entries[key]
+		return len(expired)
+	
+	def _shrink(self):
+		# Called with the lock held. Evict down to 90% of maxsize so that the
+		# scan is not repeated on every put().
+		self._purge()
+		excess = len(self._entries) - int(self.maxsize * 0.9)
+		if excess > 0:
+			for expires, key in heapq.nsmallest(excess, [ (entry[0], key) for key, entry in self._entries.iteritems() ]):
+				del self._entries[key]
+			pass
+		return
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: NegativeCache
+# inherits: usps_webtools.cache.TTLCache
+#
+# Description:
+# Remembers inputs the server has rejected for good (see
+# usps_webtools.errors.classifyError()), so they can be answered locally for
+# the lifetime of the entry. Transient and unknown errors are never stored.
+# Errors are stored as ErrorRecord copies, so that an entry read from a lazy
+# response does not keep the whole response text alive.
+#
+# Public methods:
+#	record(key, error)
+#		Stores the error for key if it is permanent. Returns True if stored.
+#
+#-------------------------------------------------------------------------------
+class NegativeCache(TTLCache):
+	
+	def record(self, key, error):
+		'''
+		Stores the error for key if it is permanent. Returns True if stored.
+		'''
+		if error is None or classifyError(error) != ERROR_PERMANENT:
+			return False
+		self.put(key, ErrorRecord.fromError(error))
+		return True
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: ResultCache
+# inherits: usps_webtools.cache.TTLCache
+#
+# Description:
+# Remembers successful lookups (address verification, ZIP code and city/state
+# results) so that repeated inputs are answered locally. Lazy records are
+# materialized before they are stored, so the cache never holds on to a whole
+# response buffer. A snapshot (see usps_webtools.snapshot.CacheSnapshot) can
+# be attached to back the cache: a key missing from memory is looked up in the
+# snapshot and, if found there and still live, copied into memory with the
+# rest of its lifetime.
+#
+# Public properties:
+#	snapshot - object with get(key) returning (expires, value) or None and
+#		entries() yielding (key, expires, value) tuples, or None for no
+#		snapshot
+#
+# Public methods:
+#	record(key, result)
+#		Stores the result for key if it carries no error. Returns True if
+#		stored.
+#
+#	entries()
+#		Returns a list of (key, expires, value) tuples for the live entries
+#		held in memory.
+#
+#-------------------------------------------------------------------------------
+class ResultCache(TTLCache):
+	
+	def __init__(self, ttl=86400.0, maxsize=None, clock=time.time, snapshot=None):
+		TTLCache.__init__(self, ttl, maxsize, clock)
+		self.snapshot = snapshot
+		return
+	
+	def get(self, key, default=None):
+		'''
+		Returns the live value stored for key, looking in the snapshot if it is
+		not held in memory, or default.
+		'''
+		value = TTLCache.get(self, key, self)
+		if value is not self:
+			return value
+		if self.snapshot is None:
+			return default
+		entry = self.snapshot.get(key)
+		if entry is None:
+			return default
+		expires, value = entry
+		ttl = expires - self._clock()
+		if ttl <= 0:
+			return default
+		self.put(key, value, ttl)
+		return value
+	
+	def record(self, key, result):
+		'''
+		Stores the result for key if it carries no error. Returns True if
+		stored.
+		'''
+		if result is None or getattr(result, 'error', None) is not None:
+			return False
+		if hasattr(result, 'materialize'):
+			result = result.materialize()
+		self.put(key, result)
+		return True
+	
+	def entries(self):
+		'''
+		Returns a list of (key, expires, value) tuples for the live entries
+		held in memory.
+		'''
+		self._lock.acquire()
+		try:
+			now = self._clock()
+			return [ (key, entry[0], entry[1]) for key, entry in self._entries.iteritems() if entry[0] > now ]
+		finally:
+			self._lock.release()
+		pass
+	
+	pass
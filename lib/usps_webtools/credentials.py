@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+'''
+File			:	credentials.py
+Package			:	usps_webtools
+Brief			:	Pool of USPS user IDs, each with its own rate limit, quota
+					and health state, so that traffic can be spread over
+					several accounts.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import os
+import random
+import threading
+import time
+
+# Authorization failures bench a credential.
+from usps_webtools.errors import ErrorResponse, isAuthorizationError
+
+# Per-credential rate limiting.
+from usps_webtools.scheduler import TokenBucket
+
+# Selection strategies understood by CredentialPool.
+STRATEGY_LEAST_LOADED = 'least_loaded'
+STRATEGY_WEIGHTED = 'weighted'
+
+#-------------------------------------------------------------------------------
+# class: Credential
+#
+# Description:
+# A single USPS user ID along with its limits and bookkeeping. The counters are
+# maintained by the CredentialPool the credential belongs to.
+#
+# Public properties:
+#	userId - string; the USPS user ID
+#
+#	weight - float; relative share of the traffic (see CredentialPool)
+#
+#	quota - integer; requests allowed per quotaPeriod, or None for no limit
+#
+#	quotaPeriod - float; length of the quota window, in seconds
+#
+#	inFlight - integer; requests currently using the credential
+#
+#	used - integer; requests made in the current quota window
+#
+#	healthy - boolean; False while the credential is benched after the server
+#		rejected it
+#
+#-------------------------------------------------------------------------------
+class Credential(object):
+	
+	def __init__(self, userId, rate=None, burst=None, quota=None, quotaPeriod=86400.0, weight=1.0):
+		self.userId = userId
+		self.weight = float(weight)
+		self.quota = quota
+		self.quotaPeriod = quotaPeriod
+		self.inFlight = 0
+		self.used = 0
+		self.healthy = True
+		self._bucket = None
+		if rate:
+			self._bucket = TokenBucket(rate, burst)
+		self._windowStart = time.time()
+		self._benchedUntil = 0.0
+		return
+	
+	def __repr__(self):
+		return '<Credential %s: %d in flight, %d used%s>' % (self.userId,
+			self.inFlight, self.used, (not self.healthy) and ', unhealthy' or '')
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: CredentialPool
+#
+# Description:
+# Hands out credentials to requests. Only healthy credentials that are within
+# their quota and have a rate token to spare are considered; among those the
+# strategy picks one:
+#
+#	STRATEGY_LEAST_LOADED - the one with the fewest requests in flight
+#		relative to its weight (ties go to the least used)
+#	STRATEGY_WEIGHTED - a random one, with probability proportional to weight
+#
+# A credential whose request comes back with an authorization error is
+# benched for cooldown seconds, after which it is tried again.
+#
+# Install as RequestBase.CREDENTIAL_POOL to have every request draw its user ID
+# from the pool.
+#
+# Public methods:
+#	add(credential)
+#		Adds a credential to the pool.
+#
+#	acquire(timeout=None)
+#		Returns a credential to use for one request, waiting while all usable
+#		credentials are rate limited. Returns None if none is usable at all
+#		(all unhealthy or out of quota), or if timeout seconds pass first.
+#
+#	release(credential, response=None)
+#		Returns the credential after the request, with the response (if any)
+#		used to judge the credential's health.
+#
+#	markUnhealthy(credential, cooldown=None)
+#	markHealthy(credential)
+#		Benches a credential, or puts it back into service.
+#
+#	fromEnvironment(variable='USPS_USER_IDS', **kw) (class method)
+#		Builds a pool from a comma-separated list of user IDs in the
+#		environment; the keyword arguments are passed to each Credential.
+#
+#-------------------------------------------------------------------------------
+class CredentialPool(object):
+	
+	def __init__(self, credentials=(), strategy=STRATEGY_LEAST_LOADED, cooldown=300.0):
+		if strategy not in (STRATEGY_LEAST_LOADED, STRATEGY_WEIGHTED):
+			raise ValueError('Unknown credential selection strategy "%s".' % strategy)
+		self.strategy = strategy
+		self.cooldown = cooldown
+		self.__cond = threading.Condition()
+		self.__credentials = []
+		for credential in credentials:
+			self.add(credential)
+		return
+	
+	def __len__(self):
+		return len(self.__credentials)
+	
+	@property
+	def credentials(self):
+		return tuple(self.__credentials)
+	
+	@classmethod
+	def fromEnvironment(cls, variable='USPS_USER_IDS', **kw):
+		'''
+		Builds a pool from a comma-separated list of user IDs in the
+		environment; the keyword arguments are passed to each Credential.
+		'''
+		user_ids = [ user_id.strip() for user_id in os.environ.get(variable, '').split(',') ]
+		return cls([ Credential(user_id, **kw) for user_id in user_ids if user_id ])
+	
+	def add(self, credential):
+		'''
+		Adds a credential to the pool.
+		'''
+		self.__cond.acquire()
+		try:
+			self.__credentials.append(credential)
+			self.__cond.notifyAll()
+		finally:
+			self.__cond.release()
+		return
+	
+	def acquire(self, timeout=None):
+		'''
+		Returns a credential to use for one request, waiting while all usable
+		credentials are rate limited. Returns None if none is usable at all, or
+		if timeout seconds pass first.
+		'''
+		give_up = None
+		if timeout is not None:
+			give_up = time.time() + timeout
+		self.__cond.acquire()
+		try:
+			while True:
+				now = time.time()
+				candidates = []
+				wait = None
+				for credential in self.__credentials:
+					if not self.__usable(credential, now):
+						continue
+					delay = 0.0
+					if credential._bucket is not None:
+						delay = credential._bucket.delay()
+					if delay <= 0:
+						candidates.append(credential)
+					elif wait is None or delay < wait:
+						wait = delay
+					pass
+				if candidates:
+					credential = self.__choose(candidates)
+					if credential._bucket is not None:
+						credential._bucket.take()
+					credential.inFlight += 1
+					credential.used += 1
+					return credential
+				if wait is None:
+					# Nothing will become usable just by waiting for tokens.
+					return None
+				if give_up is not None:
+					remaining = give_up - now
+					if remaining <= 0:
+						return None
+					wait = min(wait, remaining)
+					pass
+				self.__cond.wait(wait)
+				pass
+		finally:
+			self.__cond.release()
+		pass
+	
+	def release(self, credential, response=None):
+		'''
+		Returns the credential after the request, with the response (if any)
+		used to judge the credential's health.
+		'''
+		self.__cond.acquire()
+		try:
+			credential.inFlight -= 1
+			if isinstance(response, ErrorResponse) and isAuthorizationError(response):
+				self.__bench(credential, self.cooldown)
+			self.__cond.notifyAll()
+		finally:
+			self.__cond.release()
+		return
+	
+	def markUnhealthy(self, credential, cooldown=None):
+		'''
+		Benches a credential for cooldown seconds (default: self.cooldown).
+		'''
+		if cooldown is None:
+			cooldown = self.cooldown
+		self.__cond.acquire()
+		try:
+			self.__bench(credential, cooldown)
+		finally:
+			self.__cond.release()
+		return
+	
+	def markHealthy(self, credential):
+		'''
+		Puts a benched credential back into service.
+		'''
+		self.__cond.acquire()
+		try:
+			credential.healthy = True
+			credential._benchedUntil = 0.0
+			self.__cond.notifyAll()
+		finally:
+			self.__cond.release()
+		return
+	
+	def __bench(self, credential, cooldown):
+		credential.healthy = False
+		credential._benchedUntil = time.time() + cooldown
+		return
+	
+	def __usable(self, credential, now):
+		if not credential.healthy:
+			if now < credential._benchedUntil:
+				return False
+			# Cooldown over; give it another chance.
+			credential.healthy = True
+			pass
+		if credential.quota is not None:
+			if now - credential._windowStart >= credential.quotaPeriod:
+				credential._windowStart = now
+				credential.used = 0
+				pass
+			if credential.used >= credential.quota:
+				return False
+			pass
+		return True
+	
+	def __choose(self, candidates):
+		if self.strategy == STRATEGY_WEIGHTED:
+			point = random.uniform(0.0, sum([ credential.weight for credential in candidates ]))
+			for credential in candidates:
+				point -= credential.weight
+				if point <= 0:
+					return credential
+				pass
+			return candidates[-1]
+		best = None
+		best_load = None
+		for credential in candidates:
+			load = (credential.inFlight / credential.weight, credential.used / credential.weight)
+			if best is None or load < best_load:
+				best = credential
+				best_load = load
+			pass
+		return best
+	
+	pass
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+'''
+File			:	deadline.py
+Package			:	usps_webtools
+Brief			:	Total time budgets for a call, carried through queueing,
+					credential selection, network I/O, retries and parsing.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import time
+
+#-------------------------------------------------------------------------------
+# class: DeadlineExceeded
+#
+# Description:
+#	Raised when work is abandoned because its deadline has passed.
+#
+#-------------------------------------------------------------------------------
+class DeadlineExceeded(Exception):
+	pass
+
+#-------------------------------------------------------------------------------
+# class: Deadline
+#
+# Description:
+# A point in time by which a call has to be finished, created from a budget in
+# seconds. Pass the same Deadline to every stage of the call; each stage waits
+# at most remaining() seconds and skips its work once the deadline is expired.
+# The caller can ask the Deadline afterwards how much of the budget is left.
+#
+# Public properties:
+#	budget - float; the budget the deadline was created with, in seconds
+#
+#	expired - boolean; True once the deadline has passed
+#
+# Public methods:
+#	remaining()
+#		Returns the seconds left before the deadline, never less than 0.
+#
+#	elapsed()
+#		Returns the seconds since the deadline was created.
+#
+#	check(stage)
+#		Raises DeadlineExceeded, naming the stage, if the deadline has passed.
+#
+#-------------------------------------------------------------------------------
+class Deadline(object):
+	
+	def __init__(self, budget, clock=time.time):
+		self.__clock = clock
+		self.__budget = float(budget)
+		self.__start = clock()
+		self.__expires = self.__start + self.__budget
+		return
+	
+	def __repr__(self):
+		return '<Deadline %.3fs of %.3fs left>' % (self.remaining(), self.__budget)
+	
+	@property
+	def budget(self):
+		return self.__budget
+	
+	@property
+	def expired(self):
+		return self.__clock() >= self.__expires
+	
+	def remaining(self):
+		'''
+		Returns the seconds left before the deadline, never less than 0.
+		'''
+		return max(0.0, self.__expires - self.__clock())
+	
+	def elapsed(self):
+		'''
+		Returns the seconds since the deadline was created.
+		'''
+		return self.__clock() - self.__start
+	
+	def check(self, stage):
+		'''
+		Raises DeadlineExceeded, naming the stage, if the deadline has passed.
+		'''
+		if self.expired:
+			raise DeadlineExceeded('deadline of %.3fs passed %s' % (self.__budget, stage))
+		return
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# function: remainingTimeout(deadline)
+#
+# Description:
+# Returns the seconds left on deadline, or None (no limit) if there is no
+# deadline. Convenient for passing on as a timeout argument.
+#
+#-------------------------------------------------------------------------------
+def remainingTimeout(deadline):
+	'''
+	Returns the seconds left on deadline, or None if there is no deadline.
+	'''
+	if deadline is None:
+		return None
+	return deadline.remaining()
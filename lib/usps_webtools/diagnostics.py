@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+'''
+File			:	diagnostics.py
+Package			:	usps_webtools
+Brief			:	Logging support. All diagnostics of the package go to the
+					"usps_webtools" logger hierarchy; this module provides a
+					queue-backed handler so that request threads only enqueue
+					log records while a background thread formats and writes
+					them.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import logging
+import Queue
+import random
+import sys
+import threading
+
+# Name of the logger all the package's loggers descend from.
+LOGGER_NAME = 'usps_webtools'
+
+#-------------------------------------------------------------------------------
+# class: NullHandler
+# inherits: logging.Handler
+#
+# Description:
+#	Discards every record. Attached to the package logger so that using the
+#	package without configuring logging stays quiet (logging.NullHandler is
+#	not available before Python 2.7).
+#
+#-------------------------------------------------------------------------------
+class NullHandler(logging.Handler):
+	
+	def emit(self, record):
+		pass
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: QueueHandler
+# inherits: logging.Handler
+#
+# Description:
+# Puts log records on a queue instead of writing them. Never blocks: when the
+# queue is full the record is dropped and counted. Message formatting is left
+# to whoever drains the queue (see QueueListener).
+#
+# Public properties:
+#	dropped - integer; number of records dropped because the queue was full
+#
+#-------------------------------------------------------------------------------
+class QueueHandler(logging.Handler):
+	
+	def __init__(self, queue):
+		logging.Handler.__init__(self)
+		self.queue = queue
+		self.dropped = 0
+		return
+	
+	def emit(self, record):
+		try:
+			self.queue.put_nowait(record)
+		except Queue.Full:
+			self.dropped += 1
+		return
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: QueueListener
+#
+# Description:
+# Background thread taking records off a queue and passing them to the target
+# handlers (which do the formatting and writing), honouring each handler's
+# level.
+#
+# Public methods:
+#	start()
+#		Starts the background thread.
+#
+#	stop()
+#		Writes out the records still queued and stops the thread.
+#
+#-------------------------------------------------------------------------------
+class QueueListener(object):
+	
+	# Put on the queue to tell the thread to stop.
+	_SENTINEL = None
+	
+	def __init__(self, queue, *handlers):
+		self.queue = queue
+		self.handlers = handlers
+		self.__thread = None
+		return
+	
+	def start(self):
+		'''
+		Starts the background thread.
+		'''
+		self.__thread = threading.Thread(target=self.__run, name='usps_webtools-log')
+		self.__thread.setDaemon(True)
+		self.__thread.start()
+		return
+	
+	def stop(self):
+		'''
+		Writes out the records still queued and stops the thread.
+		'''
+		if self.__thread is None:
+			return
+		self.queue.put(self._SENTINEL)
+		self.__thread.join()
+		self.__thread = None
+		return
+	
+	def __run(self):
+		while True:
+			record = self.queue.get()
+			if record is self._SENTINEL:
+				break
+			for handler in self.handlers:
+				if record.levelno >= handler.level:
+					handler.handle(record)
+				pass
+			pass
+		return
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# function: samplePayload(rate)
+#
+# Description:
+# True for roughly the given fraction (0.0 - 1.0) of calls. Used to decide
+# whether a full request/response payload is dumped, so that dumps can be
+# kept on under load without writing every one of them.
+#
+#-------------------------------------------------------------------------------
+def samplePayload(rate):
+	'''
+	True for roughly the given fraction (0.0 - 1.0) of calls.
+	'''
+	if rate >= 1.0:
+		return True
+	if rate <= 0.0:
+		return False
+	return random.random() < rate
+
+#-------------------------------------------------------------------------------
+# function: enableBackgroundLogging(handler=None, level=None, maxsize=10000)
+#
+# Description:
+# Routes the package's log records through a QueueHandler to a QueueListener
+# feeding the given handler (a StreamHandler on stderr by default). Records
+# are no longer propagated to the root logger, so no thread blocks on the
+# handler's I/O. Call stop() on the returned listener to flush and detach;
+# the logger's propagate setting is then put back the way it was.
+#
+# Params:
+#	handler - logging.Handler; where the records end up
+#	level - integer; level to set on the package logger, or None to leave it
+#	maxsize - integer; queue capacity, beyond which records are dropped
+#
+# Returns:
+#	The running QueueListener.
+#
+#-------------------------------------------------------------------------------
+def enableBackgroundLogging(handler=None, level=None, maxsize=10000):
+	'''
+	Routes the package's log records through a queue to a background thread
+	feeding the given handler. Returns the running QueueListener.
+	'''
+	if handler is None:
+		handler = logging.StreamHandler(sys.stderr)
+		handler.setFormatter(logging.Formatter('%(asctime)s %(name)s %(levelname)s: %(message)s'))
+		pass
+	queue = Queue.Queue(maxsize)
+	queue_handler = QueueHandler(queue)
+	logger = logging.getLogger(LOGGER_NAME)
+	listener = _BackgroundListener(queue, queue_handler, logger.propagate, handler)
+	logger.addHandler(queue_handler)
+	logger.propagate = False
+	if level is not None:
+		logger.setLevel(level)
+	listener.start()
+	return listener
+
+#-------------------------------------------------------------------------------
+# class: _BackgroundListener
+# inherits: usps_webtools.diagnostics.QueueListener
+#
+# Description:
+#	Listener returned by enableBackgroundLogging(); stopping it also detaches
+#	its QueueHandler from the package logger and restores the logger's
+#	previous propagate setting.
+#
+#-------------------------------------------------------------------------------
+class _BackgroundListener(QueueListener):
+	
+	def __init__(self, queue, queue_handler, propagate, *handlers):
+		QueueListener.__init__(self, queue, *handlers)
+		self.queueHandler = queue_handler
+		self.__propagate = propagate
+		return
+	
+	def stop(self):
+		logger = logging.getLogger(LOGGER_NAME)
+		logger.removeHandler(self.queueHandler)
+		logger.propagate = self.__propagate
+		QueueListener.stop(self)
+		return
+	
+	pass
@@ -9,11 +9,96 @@ Author			:	William M. Clifford
 '''
 
 # Import our ResponseBase class for subclassing.
-from usps_webtools.base import ResponseBase
+from usps_webtools.response import ResponseBase
 
 # Let's also get our utility function for parsing the XML response.
 from usps_webtools.utility import getXmlElementContents
 
+# Error categories returned by classifyError().
+ERROR_PERMANENT = 'permanent'
+ERROR_TRANSIENT = 'transient'
+ERROR_UNKNOWN = 'unknown'
+
+# Error numbers reported by the server for problems with the input itself;
+# sending the same input again gives the same answer.
+PERMANENT_ERROR_NUMBERS = {
+	'-2147219399': 'Invalid Zip Code.',
+	'-2147219400': 'Invalid City.',
+	'-2147219401': 'Address Not Found.',
+	'-2147219402': 'Invalid State Code.',
+	'-2147219403': 'Multiple addresses were found for the information you entered.',
+	}
+
+# Error numbers reported by the server for problems that may clear up by
+# themselves (or once the account is sorted out).
+TRANSIENT_ERROR_NUMBERS = {
+	'80040B1A': 'Authorization failure.',
+	}
+
+# Fallbacks for error numbers not listed above, matched against the
+# lower-cased description. Transient phrases are checked first.
+TRANSIENT_ERROR_PHRASES = ('authorization', 'not authorized', 'timeout', 'timed out',
+	'temporarily', 'unavailable', 'try again', 'server error', 'unable to connect')
+PERMANENT_ERROR_PHRASES = ('not found', 'invalid', 'multiple addresses')
+
+# Error numbers meaning the user ID was rejected.
+AUTHORIZATION_ERROR_NUMBERS = ('80040B1A',)
+
+#-------------------------------------------------------------------------------
+# function: isAuthorizationError(error)
+#
+# Description:
+# True where the error says the server rejected the user ID (as opposed to
+# anything being wrong with the request itself).
+#
+#-------------------------------------------------------------------------------
+def isAuthorizationError(error):
+	'''
+	True where the error says the server rejected the user ID.
+	'''
+	if (error.number or '').strip().upper() in AUTHORIZATION_ERROR_NUMBERS:
+		return True
+	description = (error.description or '').lower()
+	return 'authorization' in description or 'not authorized' in description
+
+#-------------------------------------------------------------------------------
+# function: classifyError(error)
+#
+# Description:
+# Classifies an error returned by the server as permanent (the input is bad:
+# address not found, invalid ZIP code, ...), transient (server or
+# authorization trouble; worth retrying) or unknown. The error number is
+# looked up first, then the description is searched for known phrases.
+#
+# Params:
+#	error - ErrorResponse, or anything with number/source/description
+#		properties (such as usps_webtools.lazy.LazyErrorRecord)
+#
+# Returns:
+#	ERROR_PERMANENT, ERROR_TRANSIENT or ERROR_UNKNOWN
+#
+#-------------------------------------------------------------------------------
+def classifyError(error):
+	'''
+	Classifies an error returned by the server as ERROR_PERMANENT,
+	ERROR_TRANSIENT or ERROR_UNKNOWN.
+	'''
+	number = (error.number or '').strip().upper()
+	if number in PERMANENT_ERROR_NUMBERS:
+		return ERROR_PERMANENT
+	if number in TRANSIENT_ERROR_NUMBERS:
+		return ERROR_TRANSIENT
+	description = (error.description or '').lower()
+	for phrase in TRANSIENT_ERROR_PHRASES:
+		if phrase in description:
+			return ERROR_TRANSIENT
+		pass
+	for phrase in PERMANENT_ERROR_PHRASES:
+		if phrase in description:
+			return ERROR_PERMANENT
+		pass
+	return ERROR_UNKNOWN
+
 #-------------------------------------------------------------------------------
 # class: ErrorResponse
 # inherits: usps_webtools.base.ResponseBase
@@ -101,3 +186,54 @@ class ErrorResponse(ResponseBase):
 	
 	pass
 
+
+#-------------------------------------------------------------------------------
+# class: ErrorRecord
+#
+# Description:
+#	Plain copy of the number, source and description of an error, for keeping
+#	errors around (in caches, manifests, ...) without holding on to the XML
+#	document or response text they were read from.
+#
+# Public methods:
+#	fromError(error) (class method)
+#		Returns an ErrorRecord copying the fields of error (an ErrorResponse,
+#		a LazyErrorRecord or anything with the same properties).
+#
+#-------------------------------------------------------------------------------
+class ErrorRecord(object):
+	
+	def __init__(self, number='', source='', description=''):
+		self.number = number
+		self.source = source
+		self.description = description
+		return
+	
+	def __str__(self):
+		return '''ErrorResponse:
+	Number		: %s
+	Source		: %s
+	Description	: %s
+''' % (self.number, self.source, self.description)
+	
+	@classmethod
+	def fromError(cls, error):
+		'''
+		Returns an ErrorRecord copying the fields of error.
+		'''
+		return cls(error.number or '', error.source or '', error.description or '')
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: ConfigurationError
+#
+# Description:
+#	Raised by RequestBase.submit() when a request cannot be sent because the
+#	package is not set up for it, e.g. no USPS user ID is configured. Unlike
+#	failures to reach or understand the server, this is not turned into a
+#	None response.
+#
+#-------------------------------------------------------------------------------
+class ConfigurationError(Exception):
+	pass
@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+'''
+File			:	lazy.py
+Package			:	usps_webtools
+Brief			:	Lazily-decoded response objects. The raw response text is
+					kept as-is along with the offsets of each record element;
+					fields are only pulled out of the text when accessed.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import re
+
+# Import our ResponseBase class for subclassing.
+from usps_webtools.base import ResponseBase
+
+# Grab the utility functions
+from usps_webtools.utility import rootElementName
+
+# The predefined XML entities.
+_XML_ENTITIES = { 'amp': '&', 'lt': '<', 'gt': '>', 'quot': '"', 'apos': "'" }
+
+# Matches an entity or character reference.
+_REFERENCE_RE = re.compile(r'&(#[0-9]+|#x[0-9A-Fa-f]+|[A-Za-z]+);')
+
+# Matches a CDATA section (capturing its text) or a comment.
+_TEXT_MARKUP_RE = re.compile(r'<!\[CDATA\[(.*?)\]\]>|<!--.*?-->', re.S)
+
+# Matches the ID attribute in an element's opening tag.
+_ID_ATTRIBUTE_RE = re.compile(r'''\sID\s*=\s*(["'])(.*?)\1''', re.S)
+
+# Cache of compiled field patterns, keyed by element name.
+_FIELD_RES = {}
+
+#-------------------------------------------------------------------------------
+# function: scanElements(buf, elem_name, start=0, end=None)
+#
+# Description:
+# Scans buf for the <elem_name> elements lying between start and end, without
+# descending into them. Returns a list of (ID attribute, content start,
+# content end) tuples; the content offsets exclude the element's own tags.
+# Elements of the same name must not nest, which holds for every record
+# element in the USPS responses.
+#
+#-------------------------------------------------------------------------------
+def scanElements(buf, elem_name, start=0, end=None):
+	'''
+	Scans buf for the <elem_name> elements lying between start and end.
+	Returns a list of (ID attribute, content start, content end) tuples.
+	'''
+	if end is None:
+		end = len(buf)
+	open_tag = '<' + elem_name
+	close_tag = '</' + elem_name + '>'
+	offsets = []
+	pos = buf.find(open_tag, start, end)
+	while pos >= 0:
+		name_end = pos + len(open_tag)
+		# Make sure we matched <Address> and not <Address1>.
+		if name_end < end and buf[name_end] in ' \t\r\n/>':
+			tag_end = buf.find('>', name_end, end)
+			if tag_end < 0:
+				break
+			match = _ID_ATTRIBUTE_RE.search(buf, name_end - 1, tag_end)
+			addr_id = None
+			if match:
+				addr_id = decodeText(match.group(2))
+			if buf[tag_end - 1] == '/':
+				# Empty element: <Address ID="0"/>
+				offsets.append( (addr_id, tag_end + 1, tag_end + 1) )
+				pos = buf.find(open_tag, tag_end + 1, end)
+				continue
+			content_end = buf.find(close_tag, tag_end + 1, end)
+			if content_end < 0:
+				break
+			offsets.append( (addr_id, tag_end + 1, content_end) )
+			pos = buf.find(open_tag, content_end + len(close_tag), end)
+			continue
+		pos = buf.find(open_tag, name_end, end)
+		pass
+	return offsets
+
+#-------------------------------------------------------------------------------
+# function: findElementContents(buf, elem_name, start, end, default_value='')
+#
+# Description:
+# Text-scanning counterpart to getXmlElementContents(): returns the decoded
+# contents (see decodeText()) of the first <elem_name> element found between
+# start and end, or default_value when there is none.
+#
+#-------------------------------------------------------------------------------
+def findElementContents(buf, elem_name, start, end, default_value=''):
+	'''
+	Returns the decoded contents of the first <elem_name> element found
+	between start and end of buf, or default_value when there is none.
+	'''
+	field_re = _FIELD_RES.get(elem_name)
+	if field_re is None:
+		field_re = re.compile(r'<%s(?:\s[^>]*?)?(?:/>|>(.*?)</%s>)' % (elem_name, elem_name), re.S)
+		_FIELD_RES[elem_name] = field_re
+		pass
+	match = field_re.search(buf, start, end)
+	if not match:
+		return default_value
+	return decodeText(match.group(1) or '')
+
+#-------------------------------------------------------------------------------
+# function: decodeText(text)
+#
+# Description:
+# Decodes the raw text of an element or attribute the way libxml2 reports it:
+# entity and character references are replaced (characters are UTF-8
+# encoded), CDATA sections give their text and comments are dropped.
+# References to entities other than the predefined ones are left as they are.
+#
+#-------------------------------------------------------------------------------
+def decodeText(text):
+	'''
+	Decodes the references, CDATA sections and comments in raw element or
+	attribute text.
+	'''
+	if '&' not in text and '<' not in text:
+		return text
+	parts = []
+	pos = 0
+	for match in _TEXT_MARKUP_RE.finditer(text):
+		parts.append(_REFERENCE_RE.sub(_decodeReference, text[pos:match.start()]))
+		if match.group(1) is not None:
+			parts.append(match.group(1))
+		pos = match.end()
+		pass
+	parts.append(_REFERENCE_RE.sub(_decodeReference, text[pos:]))
+	return ''.join(parts)
+
+#-------------------------------------------------------------------------------
+# function: _decodeReference(match)
+#
+# Description:
+# Replacement function for _REFERENCE_RE, returning the text a reference
+# stands for.
+#
+#-------------------------------------------------------------------------------
+def _decodeReference(match):
+	name = match.group(1)
+	if name[0] != '#':
+		return _XML_ENTITIES.get(name, match.group(0))
+	if name[1] == 'x':
+		code = int(name[2:], 16)
+	else:
+		code = int(name[1:])
+	return ('\\U%08x' % code).decode('unicode-escape').encode('utf-8')
+
+#-------------------------------------------------------------------------------
+# function: lazyField(elem_name)
+#
+# Description:
+# Builds a read-only property for a LazyRecord subclass that decodes the
+# contents of the <elem_name> child element on first access.
+#
+#-------------------------------------------------------------------------------
+def lazyField(elem_name):
+	'''
+	Builds a read-only property that decodes the contents of the <elem_name>
+	child element on first access.
+	'''
+	def getter(self):
+		return self._field(elem_name)
+	return property(getter)
+
+#-------------------------------------------------------------------------------
+# class: LazyRecord
+#
+# Description:
+# A single record element (<Address>, <ZipCode>, ...) within a response buffer.
+# Only the buffer and the element's offsets are held; each field is decoded
+# from the text the first time it is read and remembered afterwards.
+#
+# Public properties:
+#	error - LazyErrorRecord; the <Error> reported for this record by the
+#		server, or None.
+#
+#	valid - boolean; True where the server did not report an error for this
+#		record.
+#
+# Protected methods:
+#	_field(elem_name)
+#		Returns the (cached) contents of the <elem_name> child element.
+#
+#-------------------------------------------------------------------------------
+class LazyRecord(object):
+	__slots__ = ('_buf', '_start', '_end', '_values')
+	
+	# Tuple of (attribute name, element name) pairs describing the fields of
+	# the record, in document order.
+	FIELDS = ()
+	
+	def __init__(self, buf, start, end):
+		self._buf = buf
+		self._start = start
+		self._end = end
+		self._values = {}
+		return
+	
+	@property
+	def error(self):
+		if '_error' not in self._values:
+			error = None
+			offsets = scanElements(self._buf, 'Error', self._start, self._end)
+			if offsets:
+				error = LazyErrorRecord(self._buf, offsets[0][1], offsets[0][2])
+			self._values['_error'] = error
+			pass
+		return self._values['_error']
+	
+	@property
+	def valid(self):
+		return self.error is None
+	
+	def _field(self, elem_name):
+		try:
+			return self._values[elem_name]
+		except KeyError:
+			value = findElementContents(self._buf, elem_name, self._start, self._end).strip()
+			self._values[elem_name] = value
+			return value
+		pass
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: LazyErrorRecord
+# inherits: usps_webtools.lazy.LazyRecord
+#
+# Description:
+#	Lazily-decoded <Error> element, exposing the same properties as
+#	usps_webtools.errors.ErrorResponse.
+#
+#-------------------------------------------------------------------------------
+class LazyErrorRecord(LazyRecord):
+	__slots__ = ()
+	
+	FIELDS = (
+		('number', 'Number'),
+		('source', 'Source'),
+		('description', 'Description'),
+		)
+	
+	number = lazyField('Number')
+	source = lazyField('Source')
+	description = lazyField('Description')
+	
+	def __str__(self):
+		return '''ErrorResponse:
+	Number		: %s
+	Source		: %s
+	Description	: %s
+''' % (self.number, self.source, self.description)
+
+	@property
+	def error(self):
+		return None
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: LazyRecordSequence
+#
+# Description:
+# Read-only sequence of (record id, LazyRecord) tuples over a response buffer.
+# Records are created on first access and shared by later accesses; the
+# sequence itself is never copied.
+#
+#-------------------------------------------------------------------------------
+class LazyRecordSequence(object):
+	
+	def __init__(self, buf, offsets, record_class):
+		self.__buf = buf
+		self.__offsets = offsets
+		self.__record_class = record_class
+		self.__records = [None] * len(offsets)
+		return
+	
+	def __len__(self):
+		return len(self.__offsets)
+	
+	def __iter__(self):
+		for idx in xrange(len(self.__offsets)):
+			yield self[idx]
+			pass
+		return
+	
+	def __getitem__(self, idx):
+		if isinstance(idx, slice):
+			return [ self[i] for i in xrange(*idx.indices(len(self.__offsets))) ]
+		item = self.__records[idx]
+		if item is None:
+			addr_id, start, end = self.__offsets[idx]
+			item = (addr_id, self.__record_class(self.__buf, start, end))
+			self.__records[idx] = item
+			pass
+		return item
+	
+	def ids(self):
+		'''
+		Returns the record IDs, in document order, without creating any of
+		the records.
+		'''
+		return [ offset[0] for offset in self.__offsets ]
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: LazyResponseBase
+# inherits: usps_webtools.base.ResponseBase
+#
+# Description:
+# Base class for the lazily-decoded responses. Rather than an XPATH context,
+# the constructor is handed the raw response text. Subclasses name the root
+# element, the record element and the LazyRecord class used for the records.
+#
+# Public properties:
+#	addresses - LazyRecordSequence; (record id, record) tuples in document
+#		order. The same sequence object is returned on every access.
+#
+#	raw - string; the response text as received from the server.
+#
+#-------------------------------------------------------------------------------
+class LazyResponseBase(ResponseBase):
+	
+	# Name of the expected root element, e.g. "AddressValidateResponse".
+	ROOT_ELEMENT_NAME = ''
+	
+	# Name of the repeated record element, e.g. "Address".
+	ELEMENT_NAME = ''
+	
+	# The LazyRecord descendant used for each record element.
+	RECORD_CLASS = LazyRecord
+	
+	def __init__(self, resp_txt):
+		ResponseBase.__init__(self)
+		self.__buffer = resp_txt
+		self.__addresses = LazyRecordSequence(resp_txt, [], self.RECORD_CLASS)
+		self._parseElement(resp_txt)
+		return
+	
+	@property
+	def addresses(self):
+		return self.__addresses
+	
+	@property
+	def raw(self):
+		return self.__buffer
+	
+	def _parseElement(self, elem):
+		'''
+		Locates the record elements in the response text (elem), remembering
+		their offsets. No field is decoded at this point.
+		'''
+		if rootElementName(elem) != self.ROOT_ELEMENT_NAME:
+			return
+		offsets = scanElements(elem, self.ELEMENT_NAME)
+		self.__addresses = LazyRecordSequence(elem, offsets, self.RECORD_CLASS)
+		return
+	
+	pass
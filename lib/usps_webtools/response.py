@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+'''
+File			:	response.py
+Package			:	usps_webtools
+Brief			:	Base class of the response objects. It has no dependencies
+					of its own, so that both usps_webtools.base and
+					usps_webtools.errors can import it.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+#-------------------------------------------------------------------------------
+# class: ResponseBase
+#
+# Description:
+# Base response class. All of the response handling classes in the usps_webtools
+# package and its subpackages should derive from this class, implementing the
+# _parseElement() method.
+#
+# Public methods:
+#	None
+#
+# Protected methods:
+#	_parseElement(elem)
+#		Parses the provided XML element, populating the fields of the response
+#		object with the data in the XML element and its child nodes. Since
+#		each response object will expose different kinds of data, this base
+#		interface is left abstract.
+#
+#-------------------------------------------------------------------------------
+class ResponseBase(object):
+	
+	def _parseElement(self, elem):
+		'''
+		Parses the provided XML element, filling the fields of the object with
+		the data in the XML element.
+		'''
+		pass
+	
+	pass
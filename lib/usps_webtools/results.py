@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+'''
+File			:	results.py
+Package			:	usps_webtools
+Brief			:	ID-indexed container for the results of many requests, used
+					to correlate responses with the addresses that were sent.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+# Whole-request errors are recorded against every address in the request.
+from usps_webtools.base import ErrorResponse
+
+#-------------------------------------------------------------------------------
+# class: ResultIndex
+#
+# Description:
+# Merges the responses to any number of requests into a single mapping of
+# address ID to result, so that results can be joined back to the input rows
+# with a dictionary lookup per row. IDs are compared as strings, since that is
+# how they come back from the server. IDs that were sent but did not come back
+# are tracked as missing until a later response supplies them.
+#
+# Public properties:
+#	errors - dict; address ID -> error (ErrorResponse or LazyErrorRecord) for
+#		every address that has one. This is a copy.
+#
+#	missing - frozenset; IDs that were requested but have not been returned in
+#		any merged response.
+#
+# Public methods:
+#	merge(response, requested_ids=())
+#		Adds the addresses of a response (eager or lazy) to the index. Where the
+#		response is an ErrorResponse, or None (request failed), each requested
+#		ID is flagged instead. Requested IDs absent from the response are
+#		marked missing.
+#
+#	mergeRequest(request, response)
+#		Same as merge(), using the request's addressIds as the requested IDs.
+#
+#	attachError(addr_id, error)
+#		Records an error against a single address ID.
+#
+#	attachResult(addr_id, result)
+#		Records the result for a single address ID obtained some other way
+#		than through a response, e.g. from a cache.
+#
+#	get(addr_id, default=None)
+#		Returns the result for the address ID, or default.
+#
+#	error(addr_id)
+#		Returns the error recorded for the address ID, or None.
+#
+#	lookup(addr_id)
+#		Returns a (result, error) tuple for the address ID; either may be None.
+#
+#	isMissing(addr_id)
+#		Returns True if the address ID was requested but has not been
+#		returned. Unlike the missing property, this does not copy the set.
+#
+#-------------------------------------------------------------------------------
+class ResultIndex(object):
+	
+	def __init__(self):
+		self.__results = {}
+		self.__errors = {}
+		self.__missing = set()
+		return
+	
+	def __len__(self):
+		return len(self.__results)
+	
+	def __contains__(self, addr_id):
+		return str(addr_id) in self.__results
+	
+	def __getitem__(self, addr_id):
+		return self.__results[str(addr_id)]
+	
+	def __iter__(self):
+		return iter(self.__results)
+	
+	@property
+	def errors(self):
+		return dict(self.__errors)
+	
+	@property
+	def missing(self):
+		return frozenset(self.__missing)
+	
+	def attachError(self, addr_id, error):
+		'''
+		Records an error against a single address ID.
+		'''
+		self.__errors[str(addr_id)] = error
+		return
+	
+	def attachResult(self, addr_id, result):
+		'''
+		Records the result for a single address ID.
+		'''
+		addr_id = str(addr_id)
+		self.__results[addr_id] = result
+		self.__missing.discard(addr_id)
+		return
+	
+	def error(self, addr_id):
+		'''
+		Returns the error recorded for the address ID, or None.
+		'''
+		return self.__errors.get(str(addr_id))
+	
+	def get(self, addr_id, default=None):
+		'''
+		Returns the result for the address ID, or default.
+		'''
+		return self.__results.get(str(addr_id), default)
+	
+	def items(self):
+		return self.__results.items()
+	
+	def lookup(self, addr_id):
+		'''
+		Returns a (result, error) tuple for the address ID; either may be None.
+		'''
+		addr_id = str(addr_id)
+		return (self.__results.get(addr_id), self.__errors.get(addr_id))
+	
+	def isMissing(self, addr_id):
+		'''
+		Returns True if the address ID was requested but has not been returned.
+		'''
+		return str(addr_id) in self.__missing
+	
+	def merge(self, response, requested_ids=()):
+		'''
+		Adds the addresses of a response to the index. Where the response is
+		an ErrorResponse, or None, each of the requested IDs is flagged instead.
+		Requested IDs absent from the response are marked missing.
+		'''
+		requested_ids = [ str(addr_id) for addr_id in requested_ids ]
+		if response is None or isinstance(response, ErrorResponse):
+			for addr_id in requested_ids:
+				if addr_id in self.__results:
+					continue
+				if response is not None:
+					self.__errors[addr_id] = response
+				self.__missing.add(addr_id)
+				pass
+			return
+		returned = set()
+		for addr_id, result in response.addresses:
+			addr_id = str(addr_id)
+			returned.add(addr_id)
+			self.__results[addr_id] = result
+			self.__missing.discard(addr_id)
+			error = getattr(result, 'error', None)
+			if error is not None:
+				self.__errors[addr_id] = error
+			else:
+				self.__errors.pop(addr_id, None)
+			pass
+		for addr_id in requested_ids:
+			if addr_id not in returned and addr_id not in self.__results:
+				self.__missing.add(addr_id)
+			pass
+		return
+	
+	def mergeRequest(self, request, response):
+		'''
+		Same as merge(), using the request's addressIds as the requested IDs.
+		'''
+		self.merge(response, request.addressIds)
+		return
+	
+	pass
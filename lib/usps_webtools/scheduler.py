@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+'''
+File			:	scheduler.py
+Package			:	usps_webtools
+Brief			:	Priority-aware admission control in front of
+					RequestBase.submit(), sharing one concurrency and rate
+					budget between interactive and bulk traffic.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import contextlib
+import heapq
+import itertools
+import threading
+import time
+
+# Priority classes; lower values are served first.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 50
+PRIORITY_BULK = 100
+
+#-------------------------------------------------------------------------------
+# class: TokenBucket
+#
+# Description:
+# Simple token bucket rate limiter: tokens accrue at rate per second up to
+# burst, and each request consumes one. Not thread-safe on its own; callers
+# serialize access.
+#
+# Public methods:
+#	delay()
+#		Returns the number of seconds until a token is available (0 if one is
+#		available now).
+#
+#	take()
+#		Consumes a token. Only call when delay() returned 0.
+#
+#-------------------------------------------------------------------------------
+class TokenBucket(object):
+	
+	def __init__(self, rate, burst=None, clock=time.time):
+		self.rate = float(rate)
+		if burst is None:
+			burst = max(1.0, self.rate)
+		self.burst = float(burst)
+		self.__clock = clock
+		self.__tokens = self.burst
+		self.__stamp = clock()
+		return
+	
+	def __refill(self):
+		now = self.__clock()
+		self.__tokens = min(self.burst, self.__tokens + (now - self.__stamp) * self.rate)
+		self.__stamp = now
+		return
+	
+	def delay(self):
+		'''
+		Returns the number of seconds until a token is available (0 if one is
+		available now).
+		'''
+		self.__refill()
+		if self.__tokens >= 1.0:
+			return 0.0
+		return (1.0 - self.__tokens) / self.rate
+	
+	def take(self):
+		'''
+		Consumes a token. Only call when delay() returned 0.
+		'''
+		self.__tokens -= 1.0
+		return
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: RequestScheduler
+#
+# Description:
+# Admits callers wanting to talk to the server one by one, in
+# priority order (then arrival order), within a shared budget of concurrent
+# requests and, optionally, requests per second. Part of the concurrency
+# budget can be held back for PRIORITY_INTERACTIVE work: other priorities may
+# only use max_concurrency - reserved_interactive slots, so interactive
+# requests never wait for a slot held by bulk work once the reserve is
+# configured, and bulk work soaks up whatever is left.
+#
+# Install one instance as RequestBase.SCHEDULER to put every request behind
+# it; each request is then admitted according to its priority attribute.
+#
+# The clock (time.time by default) is used for the rate limit and for
+# timeouts; waits themselves are real.
+#
+# Public methods:
+#	acquire(priority=PRIORITY_NORMAL, timeout=None)
+#		Blocks until the caller is admitted, returning True, or until timeout
+#		seconds have passed, returning False.
+#
+#	release()
+#		Gives back a slot obtained through acquire().
+#
+#	slot(priority=PRIORITY_NORMAL)
+#		Context manager wrapping acquire()/release().
+#
+#-------------------------------------------------------------------------------
+class RequestScheduler(object):
+	
+	def __init__(self, max_concurrency=4, reserved_interactive=1, rate=None, burst=None, clock=time.time):
+		if max_concurrency < 1:
+			raise ValueError('max_concurrency must be at least 1.')
+		if not 0 <= reserved_interactive < max_concurrency:
+			raise ValueError('reserved_interactive must be between 0 and max_concurrency - 1.')
+		self.maxConcurrency = max_concurrency
+		self.reservedInteractive = reserved_interactive
+		self.__clock = clock
+		self.__bucket = None
+		if rate:
+			self.__bucket = TokenBucket(rate, burst, clock)
+		self.__cond = threading.Condition()
+		self.__waiters = []
+		self.__sequence = itertools.count()
+		self.__active = 0
+		return
+	
+	@property
+	def active(self):
+		return self.__active
+	
+	@property
+	def waiting(self):
+		return len(self.__waiters)
+	
+	def __hasCapacity(self, priority):
+		limit = self.maxConcurrency
+		if priority > PRIORITY_INTERACTIVE:
+			limit -= self.reservedInteractive
+		return self.__active < limit
+	
+	def acquire(self, priority=PRIORITY_NORMAL, timeout=None):
+		'''
+		Blocks until the caller is admitted, returning True, or until timeout
+		seconds have passed, returning False.
+		'''
+		give_up = None
+		if timeout is not None:
+			give_up = self.__clock() + timeout
+		entry = (priority, self.__sequence.next())
+		self.__cond.acquire()
+		try:
+			heapq.heappush(self.__waiters, entry)
+			granted = False
+			try:
+				while True:
+					wait = None
+					if self.__waiters[0] == entry and self.__hasCapacity(priority):
+						wait = 0.0
+						if self.__bucket is not None:
+							wait = self.__bucket.delay()
+						if wait <= 0:
+							if self.__bucket is not None:
+								self.__bucket.take()
+							heapq.heappop(self.__waiters)
+							self.__active += 1
+							granted = True
+							return True
+						pass
+					if give_up is not None:
+						remaining = give_up - self.__clock()
+						if remaining <= 0:
+							return False
+						if wait is None or remaining < wait:
+							wait = remaining
+						pass
+					self.__cond.wait(wait)
+					pass
+			finally:
+				if not granted:
+					self.__waiters.remove(entry)
+					heapq.heapify(self.__waiters)
+					pass
+				# Whoever is at the head of the queue now gets to re-check.
+				self.__cond.notifyAll()
+		finally:
+			self.__cond.release()
+		pass
+	
+	def release(self):
+		'''
+		Gives back a slot obtained through acquire().
+		'''
+		self.__cond.acquire()
+		try:
+			self.__active -= 1
+			self.__cond.notifyAll()
+		finally:
+			self.__cond.release()
+		return
+	
+	@contextlib.contextmanager
+	def slot(self, priority=PRIORITY_NORMAL):
+		'''
+		Context manager wrapping acquire()/release().
+		'''
+		self.acquire(priority)
+		try:
+			yield self
+		finally:
+			self.release()
+		return
+	
+	pass
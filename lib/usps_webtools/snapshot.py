@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+'''
+File			:	snapshot.py
+Package			:	usps_webtools
+Brief			:	Export of result caches to a compact binary snapshot that
+					a new process can memory-map and serve hits from at once,
+					plus pre-warming of a cache from known hot inputs.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import bisect
+import hashlib
+import marshal
+import mmap
+import os
+import struct
+import time
+
+from usps_webtools.address_verify.addrstandards import AddressVerRequest
+from usps_webtools.address_verify.bulk import submitInBatches
+from usps_webtools.address_verify.citystate import CityStateLookupRequest, USPSZipCode
+from usps_webtools.address_verify.usaddress import ADDRESS_FIELDS, USPSAddress, joinKey
+
+# Magic bytes at the start of a snapshot, followed by the header fields:
+# format version, entry count and creation time.
+SNAPSHOT_MAGIC = 'USPSSNAP'
+SNAPSHOT_VERSION = 1
+_HEADER = struct.Struct('>8sHId')
+
+# One index entry per cache entry, sorted by key hash: the first 8 bytes of the
+# SHA-1 of the key, the file offset of the record and its expiry time. Each
+# record is a 4-byte length followed by the marshalled (key, type, fields).
+_INDEX_ENTRY = struct.Struct('>8sQd')
+_RECORD_LENGTH = struct.Struct('>I')
+
+# Result types a snapshot can hold: type code -> (class, field names).
+_RESULT_TYPES = {
+	'A': (USPSAddress, ADDRESS_FIELDS),
+	'Z': (USPSZipCode, ('city', 'state', 'zip5')),
+	}
+
+#-------------------------------------------------------------------------------
+# class: _HashIndex
+#
+# Description:
+#	Read-only sequence view of the key hashes in a snapshot's index, so that
+#	the bisect module can search the memory-mapped index in place.
+#
+#-------------------------------------------------------------------------------
+class _HashIndex(object):
+	
+	def __init__(self, buf, count):
+		self.__buf = buf
+		self.__count = count
+		return
+	
+	def __len__(self):
+		return self.__count
+	
+	def __getitem__(self, idx):
+		start = _HEADER.size + idx * _INDEX_ENTRY.size
+		return self.__buf[start:start + 8]
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: CacheSnapshot
+#
+# Description:
+# A snapshot file written by exportSnapshot(), memory-mapped read-only. Opening
+# one only checks the header; each lookup is a binary search of the sorted
+# hash index followed by decoding the one record it points to, so a process
+# can serve hits from a snapshot of any size straight away. Attach it to a
+# usps_webtools.cache.ResultCache as its snapshot to have cache misses fall
+# back to it.
+#
+# Public properties:
+#	created - float; the time the snapshot was written
+#
+# Public methods:
+#	get(key)
+#		Returns an (expires, value) tuple for key, or None if the snapshot
+#		has no live entry for it. value is a USPSAddress or USPSZipCode.
+#
+#	entries()
+#		Generator yielding a (key, expires, value) tuple for every live entry,
+#		in index order.
+#
+#	close()
+#		Unmaps the file.
+#
+#-------------------------------------------------------------------------------
+class CacheSnapshot(object):
+	
+	def __init__(self, path, clock=time.time):
+		self.path = path
+		self.__clock = clock
+		snap_file = open(path, 'rb')
+		try:
+			size = os.fstat(snap_file.fileno()).st_size
+			if size < _HEADER.size:
+				raise ValueError('%s is not a cache snapshot.' % path)
+			self.__buf = mmap.mmap(snap_file.fileno(), size, access=mmap.ACCESS_READ)
+		finally:
+			snap_file.close()
+		magic, version, count, created = _HEADER.unpack(self.__buf[:_HEADER.size])
+		if magic != SNAPSHOT_MAGIC:
+			self.__buf.close()
+			raise ValueError('%s is not a cache snapshot.' % path)
+		if version != SNAPSHOT_VERSION:
+			self.__buf.close()
+			raise ValueError('%s is a version %d cache snapshot; version %d is supported.' % (path, version, SNAPSHOT_VERSION))
+		self.created = created
+		self.__hashes = _HashIndex(self.__buf, count)
+		return
+	
+	def __len__(self):
+		return len(self.__hashes)
+	
+	def get(self, key):
+		'''
+		Returns an (expires, value) tuple for key, or None if the snapshot has
+		no live entry for it.
+		'''
+		key_hash = _keyHash(key)
+		pos = bisect.bisect_left(self.__hashes, key_hash)
+		# Hash prefixes can collide, so check every entry with this hash.
+		while pos < len(self.__hashes) and self.__hashes[pos] == key_hash:
+			start = _HEADER.size + pos * _INDEX_ENTRY.size
+			entry_hash, offset, expires = _INDEX_ENTRY.unpack(self.__buf[start:start + _INDEX_ENTRY.size])
+			pos += 1
+			if expires <= self.__clock():
+				continue
+			record_key, value = self.__record(offset)
+			if record_key != tuple(key):
+				continue
+			return (expires, value)
+		return None
+	
+	def entries(self):
+		'''
+		Generator yielding a (key, expires, value) tuple for every live entry.
+		'''
+		now = self.__clock()
+		for pos in xrange(len(self.__hashes)):
+			start = _HEADER.size + pos * _INDEX_ENTRY.size
+			entry_hash, offset, expires = _INDEX_ENTRY.unpack(self.__buf[start:start + _INDEX_ENTRY.size])
+			if expires <= now:
+				continue
+			record_key, value = self.__record(offset)
+			yield (record_key, expires, value)
+			pass
+		return
+	
+	def __record(self, offset):
+		length = _RECORD_LENGTH.unpack(self.__buf[offset:offset + _RECORD_LENGTH.size])[0]
+		offset += _RECORD_LENGTH.size
+		record_key, type_code, fields = marshal.loads(self.__buf[offset:offset + length])
+		result_class, field_names = _RESULT_TYPES[type_code]
+		return (record_key, result_class(**dict(zip(field_names, fields))))
+	
+	def close(self):
+		'''
+		Unmaps the file.
+		'''
+		self.__buf.close()
+		return
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# function: exportSnapshot(cache, path)
+#
+# Description:
+# Writes the live entries of a usps_webtools.cache.ResultCache to a snapshot
+# file, keeping each entry's own expiry time. The live entries of the
+# snapshot attached to the cache, if any, are written as well, unless the
+# cache holds the same key in memory (the in-memory entry wins); that way a
+# snapshot does not lose the entries nobody asked for between a start and
+# the next export. Entries whose value is neither an address nor a city/state
+# result are skipped. The file is written under a temporary name and renamed
+# into place, so a process loading the snapshot never sees a partial one, and
+# a cache can be exported over the very snapshot it has attached.
+#
+# Returns:
+#	The number of entries written.
+#
+#-------------------------------------------------------------------------------
+def exportSnapshot(cache, path):
+	'''
+	Writes the live entries of a ResultCache to a snapshot file. Returns the
+	number of entries written.
+	'''
+	entries = cache.entries()
+	if cache.snapshot is not None:
+		in_memory = set([ tuple(key) for key, expires, value in entries ])
+		entries.extend([ entry for entry in cache.snapshot.entries() if entry[0] not in in_memory ])
+		pass
+	records = []
+	for key, expires, value in entries:
+		if hasattr(value, 'address2'):
+			type_code = 'A'
+		elif hasattr(value, 'city') and hasattr(value, 'zip5'):
+			type_code = 'Z'
+		else:
+			continue
+		fields = tuple([ getattr(value, name) or '' for name in _RESULT_TYPES[type_code][1] ])
+		records.append( (_keyHash(key), expires, marshal.dumps((tuple(key), type_code, fields))) )
+		pass
+	records.sort()
+	tmp_path = '%s.%d.tmp' % (path, os.getpid())
+	snap_file = open(tmp_path, 'wb')
+	try:
+		snap_file.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(records), time.time()))
+		offset = _HEADER.size + len(records) * _INDEX_ENTRY.size
+		for key_hash, expires, data in records:
+			snap_file.write(_INDEX_ENTRY.pack(key_hash, offset, expires))
+			offset += _RECORD_LENGTH.size + len(data)
+			pass
+		for key_hash, expires, data in records:
+			snap_file.write(_RECORD_LENGTH.pack(len(data)))
+			snap_file.write(data)
+			pass
+	finally:
+		snap_file.close()
+	os.rename(tmp_path, path)
+	return len(records)
+
+#-------------------------------------------------------------------------------
+# function: prewarmCache(cache, zip_codes=(), addresses=(),
+#		request_class=AddressVerRequest, retries=0, deadline=None)
+#
+# Description:
+# Fills a ResultCache ahead of taking traffic: looks up the city and state of
+# each hot ZIP5 (CityStateLookupRequest) and verifies each hot address with
+# request_class, skipping inputs the cache (or its snapshot) already answers.
+#
+# Params:
+#	cache - usps_webtools.cache.ResultCache
+#	zip_codes - iterable of ZIP5 strings
+#	addresses - iterable of USPSAddress instances
+#	request_class - class; AddressVerRequest or ZipCodeLookupRequest
+#	retries, deadline - passed on to submitInBatches()
+#
+# Returns:
+#	The number of entries in the cache afterwards.
+#
+#-------------------------------------------------------------------------------
+def prewarmCache(cache, zip_codes=(), addresses=(), request_class=AddressVerRequest,
+		retries=0, deadline=None):
+	'''
+	Fills a ResultCache with the results for the given hot ZIP5s and
+	addresses. Returns the number of entries in the cache afterwards.
+	'''
+	submitInBatches(CityStateLookupRequest,
+		( (str(idx), zip5) for idx, zip5 in enumerate(zip_codes) ),
+		retries=retries, deadline=deadline, result_cache=cache)
+	submitInBatches(request_class,
+		( (str(idx), usps_addr) for idx, usps_addr in enumerate(addresses) ),
+		retries=retries, deadline=deadline, result_cache=cache)
+	return len(cache)
+
+#-------------------------------------------------------------------------------
+# function: _keyHash(key)
+#
+# Description:
+# The 8-byte hash a cache key is indexed under in a snapshot.
+#
+#-------------------------------------------------------------------------------
+def _keyHash(key):
+	return hashlib.sha1(joinKey(key)).digest()[:8]
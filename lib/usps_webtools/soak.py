@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+'''
+File			:	soak.py
+Package			:	usps_webtools
+Brief			:	Memory soak test. Drives the submit/parse cycle of the
+					address verification request against a local stub
+					transport for a large number of iterations, mixing valid,
+					per-address error, <Error> and malformed responses, and
+					fails if the resident set size keeps growing.
+					
+					python -m usps_webtools.soak --cycles 1000000
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import logging
+import optparse
+import os
+import resource
+import sys
+
+# Requests are not sent without a user ID; any will do for the stub transport.
+os.environ.setdefault('USPS_USER_ID', 'SOAKTEST')
+
+import libxml2
+
+from usps_webtools.address_verify.addrstandards import AddressVerRequest, AddressVerResponse
+from usps_webtools.address_verify.usaddress import USPSAddress
+
+# Canned responses served in turn by StubTransport.
+STUB_RESPONSES = (
+	# A valid response.
+	'''<?xml version="1.0"?>
+<AddressValidateResponse><Address ID="0"><Address2>6406 IVY LN</Address2><City>GREENBELT</City><State>MD</State><Zip5>20770</Zip5><Zip4>1441</Zip4></Address></AddressValidateResponse>''',
+	# A per-address error.
+	'''<?xml version="1.0"?>
+<AddressValidateResponse><Address ID="0"><Error><Number>-2147219401</Number><Source>clsAMS</Source><Description>Address Not Found.  </Description><HelpFile/><HelpContext/></Error></Address></AddressValidateResponse>''',
+	# A well-formed response that SoakResponse fails on after it was parsed.
+	'''<?xml version="1.0"?>
+<AddressValidateResponse><Address ID="0"><Address2>6406 IVY LN</Address2><Zip5>20770</Zip5></Address><SoakFailure/></AddressValidateResponse>''',
+	# A whole-request error.
+	'''<?xml version="1.0"?>
+<Error><Number>80040B1A</Number><Description>Authorization failure.  Perhaps username and/or password is incorrect.</Description><Source>UspsCom::DoAuth</Source></Error>''',
+	# Malformed and truncated responses.
+	'''<?xml version="1.0"?>
+<AddressValidateResponse><Address ID="0"><Zip5>20770</Zip4></Address>''',
+	'''<?xml version="1.0"?>
+<AddressValidateResponse><Address ID="0"><Zip5>207''',
+	'',
+	)
+
+#-------------------------------------------------------------------------------
+# class: StubTransport
+#
+# Description:
+#	Transport returning the canned STUB_RESPONSES in turn, without any I/O.
+#
+#-------------------------------------------------------------------------------
+class StubTransport(object):
+	
+	def __init__(self, responses=STUB_RESPONSES):
+		self.__responses = responses
+		self.__next = 0
+		return
+	
+	def send(self, api, xml_txt, req_uri, timeout=None):
+		resp_txt = self.__responses[self.__next]
+		self.__next = (self.__next + 1) % len(self.__responses)
+		return resp_txt
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: SoakResponse
+# inherits: usps_webtools.address_verify.addrstandards.AddressVerResponse
+#
+# Description:
+#	Address verification response that raises once it has parsed a document
+#	containing a <SoakFailure/> element, standing in for a response class
+#	failing while the libxml2 document is still open.
+#
+#-------------------------------------------------------------------------------
+class SoakResponse(AddressVerResponse):
+	
+	def _parseElement(self, elem):
+		AddressVerResponse._parseElement(self, elem)
+		if elem.xpathEval('/AddressValidateResponse/SoakFailure'):
+			raise ValueError('simulated failure while parsing the response')
+		return
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: SoakRequest
+# inherits: usps_webtools.address_verify.addrstandards.AddressVerRequest
+#
+# Description:
+#	Address verification request wired to a StubTransport and SoakResponse.
+#
+#-------------------------------------------------------------------------------
+class SoakRequest(AddressVerRequest):
+	RESPONSE_CLASS = SoakResponse
+	TRANSPORT = StubTransport()
+	pass
+
+#-------------------------------------------------------------------------------
+# function: residentSetSize()
+#
+# Description:
+# Returns the current resident set size of the process in kilobytes, read from
+# /proc where available. Elsewhere the peak RSS reported by getrusage() is used,
+# which still only grows when memory is leaking.
+#
+#-------------------------------------------------------------------------------
+def residentSetSize():
+	'''
+	Returns the current (or, failing that, peak) resident set size of the
+	process in kilobytes.
+	'''
+	try:
+		statm = open('/proc/self/statm')
+		try:
+			pages = int(statm.read().split()[1])
+		finally:
+			statm.close()
+		return pages * resource.getpagesize() / 1024
+	except (IOError, IndexError, ValueError):
+		return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+#-------------------------------------------------------------------------------
+# function: runSoak(cycles, max_growth_kb, warmup=10000, check_every=100000,
+#		out=sys.stderr)
+#
+# Description:
+# Runs the given number of submit/parse cycles against a StubTransport. Each
+# pass over STUB_RESPONSES is parsed eagerly and the next pass lazily, so every
+# canned response goes through both the libxml2 parse and the lazy scan. The
+# RSS after the warm-up cycles is taken as the baseline and checked every
+# check_every cycles.
+#
+# Returns:
+#	True if the RSS never grew more than max_growth_kb over the baseline.
+#
+#-------------------------------------------------------------------------------
+def runSoak(cycles, max_growth_kb, warmup=10000, check_every=100000, out=sys.stderr):
+	'''
+	Runs the given number of submit/parse cycles against a stub transport
+	and returns True if the RSS stayed within max_growth_kb of the baseline.
+	'''
+	# Keep libxml2 and submit() from reporting every bad response.
+	libxml2.registerErrorHandler(lambda ctx, msg: None, None)
+	logger = logging.getLogger('usps_webtools')
+	saved_level = logger.level
+	logger.setLevel(logging.CRITICAL)
+	try:
+		request = SoakRequest()
+		# A fresh transport, so that cycle n always gets response n - 1.
+		request.TRANSPORT = StubTransport()
+		request.addAddress('0', USPSAddress(address2='6406 Ivy Lane', city='Greenbelt', state='MD'))
+		baseline = None
+		for cycle in xrange(1, cycles + 1):
+			request.submit(lazy=bool(((cycle - 1) // len(STUB_RESPONSES)) & 1))
+			if cycle == warmup:
+				baseline = residentSetSize()
+				out.write('soak: baseline RSS %d kB after %d cycles\n' % (baseline, cycle))
+				pass
+			if baseline is not None and (cycle % check_every == 0 or cycle == cycles):
+				rss = residentSetSize()
+				out.write('soak: %d cycles, RSS %d kB (%+d kB)\n' % (cycle, rss, rss - baseline))
+				if rss - baseline > max_growth_kb:
+					out.write('soak: FAILED, RSS grew by more than %d kB\n' % max_growth_kb)
+					return False
+				pass
+			pass
+	finally:
+		logger.setLevel(saved_level)
+	return True
+
+#-------------------------------------------------------------------------------
+# function: main(argv=None)
+#
+# Description:
+# Command line entry point: parses the options and runs the soak.
+#
+# Returns:
+#	The exit status; 0 if the soak passed, 1 if it failed.
+#
+#-------------------------------------------------------------------------------
+def main(argv=None):
+	parser = optparse.OptionParser(usage='%prog [options]')
+	parser.add_option('--cycles', type='int', default=1000000,
+		help='number of submit/parse cycles to run (default: %default)')
+	parser.add_option('--max-growth', type='int', default=4096,
+		help='allowed RSS growth over the baseline, in kB (default: %default)')
+	parser.add_option('--warmup', type='int', default=10000,
+		help='cycles run before the baseline RSS is taken (default: %default)')
+	parser.add_option('--check-every', type='int', default=100000,
+		help='cycles between RSS checks (default: %default)')
+	options, args = parser.parse_args(argv)
+	if not runSoak(options.cycles, options.max_growth, min(options.warmup, options.cycles), options.check_every):
+		return 1
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
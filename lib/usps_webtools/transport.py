@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+'''
+File			:	transport.py
+Package			:	usps_webtools
+Brief			:	Transports used by RequestBase.submit() to exchange the
+					request XML for the response text with the USPS server.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import hashlib
+import random
+import re
+import socket
+import struct
+import threading
+import time
+import urllib
+import urllib2
+import zlib
+
+# Bounds the whole exchange when send() is given a timeout.
+from usps_webtools.deadline import Deadline
+
+# Magic bytes at the start of a capture file written by RecordingTransport.
+CAPTURE_MAGIC = 'USPSCAP1'
+
+# Per-record header in a capture file: request fingerprint, then the lengths of
+# the API name, the compressed request XML and the compressed response text.
+_CAPTURE_RECORD = struct.Struct('>20sHII')
+
+# Matches the USERID attribute, which is left out of request fingerprints and
+# capture files so that captures can be shared and replayed under a different
+# account.
+_USERID_ATTRIBUTE_RE = re.compile(r'''\sUSERID\s*=\s*(["']).*?\1''')
+
+#-------------------------------------------------------------------------------
+# function: encodePostData(api, xml_txt)
+#
+# Description:
+# Returns the form-encoded POST body carrying the API name and request XML, as
+# expected by the USPS ShippingAPI.dll endpoint.
+#
+#-------------------------------------------------------------------------------
+def encodePostData(api, xml_txt):
+	'''
+	Returns the form-encoded POST body carrying the API name and request XML.
+	'''
+	return urllib.urlencode({
+		'API': api,
+		'XML': xml_txt,
+		})
+
+#-------------------------------------------------------------------------------
+# function: requestFingerprint(api, xml_txt)
+#
+# Description:
+# Returns the 20-byte SHA-1 digest identifying a request by its API name and
+# request XML, ignoring the USERID attribute.
+#
+#-------------------------------------------------------------------------------
+def requestFingerprint(api, xml_txt):
+	'''
+	Returns the 20-byte SHA-1 digest identifying a request by its API name and
+	request XML, ignoring the USERID attribute.
+	'''
+	return hashlib.sha1(api + '\0' + _USERID_ATTRIBUTE_RE.sub('', xml_txt, 1)).digest()
+
+#-------------------------------------------------------------------------------
+# function: readCapture(path)
+#
+# Description:
+# Generator yielding (fingerprint, api, request XML, response text) for each
+# exchange stored in a capture file written by RecordingTransport. Raises
+# ValueError if the file is not a capture file or is truncated.
+#
+#-------------------------------------------------------------------------------
+def readCapture(path):
+	'''
+	Generator yielding (fingerprint, api, request XML, response text) for each
+	exchange stored in a capture file written by RecordingTransport.
+	'''
+	capture = open(path, 'rb')
+	try:
+		if capture.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+			raise ValueError('%s is not a USPS capture file.' % path)
+		while True:
+			header = capture.read(_CAPTURE_RECORD.size)
+			if not header:
+				break
+			if len(header) != _CAPTURE_RECORD.size:
+				raise ValueError('%s: truncated capture record.' % path)
+			fingerprint, api_len, xml_len, resp_len = _CAPTURE_RECORD.unpack(header)
+			payload = capture.read(api_len + xml_len + resp_len)
+			if len(payload) != api_len + xml_len + resp_len:
+				raise ValueError('%s: truncated capture record.' % path)
+			api = payload[:api_len]
+			xml_txt = zlib.decompress(payload[api_len:api_len + xml_len])
+			resp_txt = zlib.decompress(payload[api_len + xml_len:])
+			yield (fingerprint, api, xml_txt, resp_txt)
+			pass
+	finally:
+		capture.close()
+	return
+
+#-------------------------------------------------------------------------------
+# function: decodeStream(file_obj, content_encoding, chunk_size=16384,
+#		deadline=None, sock=None)
+#
+# Description:
+# Generator reading file_obj in chunks of chunk_size bytes and yielding the
+# decoded chunks as they arrive, undoing a "gzip" or "deflate" content
+# encoding on the fly. Any other encoding (or none) is passed through as-is.
+# For "deflate", both zlib-wrapped and raw deflate streams are accepted, since
+# servers disagree on which one the name refers to.
+#
+# With a deadline (usps_webtools.deadline.Deadline), socket.timeout is raised
+# as soon as it has passed between two reads, and the timeout of sock (the
+# socket behind file_obj, if known) is cut down to the time left before each
+# read, so a response trickling in cannot outlast the deadline.
+#
+#-------------------------------------------------------------------------------
+def decodeStream(file_obj, content_encoding, chunk_size=16384, deadline=None, sock=None):
+	'''
+	Generator yielding the decoded contents of file_obj chunk by chunk,
+	undoing a "gzip" or "deflate" content encoding on the fly.
+	'''
+	content_encoding = (content_encoding or '').strip().lower()
+	if content_encoding in ('gzip', 'x-gzip'):
+		decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+	else:
+		decompressor = None
+	# For "deflate" the stream type is only known once the first two bytes
+	# (a zlib header, if there is one) have arrived.
+	head = ''
+	while True:
+		if deadline is not None:
+			remaining = deadline.remaining()
+			if remaining <= 0:
+				raise socket.timeout('deadline passed while reading the response')
+			if sock is not None:
+				sock.settimeout(remaining)
+			pass
+		chunk = file_obj.read(chunk_size)
+		if not chunk:
+			break
+		if content_encoding == 'deflate' and decompressor is None:
+			head += chunk
+			if len(head) < 2:
+				continue
+			decompressor = zlib.decompressobj(_isZlibHeader(head) and zlib.MAX_WBITS or -zlib.MAX_WBITS)
+			chunk = head
+			pass
+		if decompressor is None:
+			yield chunk
+			continue
+		data = decompressor.decompress(chunk)
+		if data:
+			yield data
+		pass
+	if decompressor is None and head:
+		# A one-byte body cannot be a zlib stream.
+		decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+		data = decompressor.decompress(head)
+		if data:
+			yield data
+		pass
+	if decompressor is not None:
+		data = decompressor.flush()
+		if data:
+			yield data
+		pass
+	return
+
+#-------------------------------------------------------------------------------
+# function: _isZlibHeader(head)
+#
+# Description:
+# True where the first two bytes of a "deflate" body are a valid zlib header
+# (deflate method, header checksum a multiple of 31) rather than the start of
+# a raw deflate stream.
+#
+#-------------------------------------------------------------------------------
+def _isZlibHeader(head):
+	cmf = ord(head[0])
+	flg = ord(head[1])
+	return cmf & 0x0f == 8 and (cmf * 256 + flg) % 31 == 0
+
+#-------------------------------------------------------------------------------
+# class: HttpTransport
+#
+# Description:
+# Posts requests to the USPS server over HTTP(S). Unless told otherwise it
+# advertises gzip/deflate support and decompresses the response while it is
+# being read.
+#
+# Public properties:
+#	acceptCompressed - boolean; whether to send "Accept-Encoding: gzip, deflate"
+#
+#	chunkSize - integer; number of bytes read from the connection at a time
+#
+# Public methods:
+#	send(api, xml_txt, req_uri, timeout=None)
+#		Posts the request to req_uri and returns the (decompressed) response
+#		text. timeout (seconds) limits the whole exchange, from connecting to
+#		reading the last byte; socket.timeout is raised when it runs out.
+#		Errors propagate to the caller.
+#
+#-------------------------------------------------------------------------------
+class HttpTransport(object):
+	
+	def __init__(self, acceptCompressed=True, chunkSize=16384):
+		self.acceptCompressed = acceptCompressed
+		self.chunkSize = chunkSize
+		return
+	
+	def send(self, api, xml_txt, req_uri, timeout=None):
+		'''
+		Posts the request to req_uri and returns the (decompressed) response
+		text. Errors propagate to the caller.
+		'''
+		http_req = urllib2.Request(req_uri, encodePostData(api, xml_txt))
+		if self.acceptCompressed:
+			http_req.add_header('Accept-Encoding', 'gzip, deflate')
+		if timeout is None:
+			deadline = None
+			url_handle = urllib2.urlopen(http_req)
+		else:
+			deadline = Deadline(max(timeout, 0.001))
+			url_handle = urllib2.urlopen(http_req, timeout=deadline.budget)
+		try:
+			content_encoding = url_handle.info().getheader('Content-Encoding', '')
+			return ''.join(decodeStream(url_handle, content_encoding, self.chunkSize,
+				deadline, _responseSocket(url_handle)))
+		finally:
+			url_handle.close()
+		pass
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# function: _responseSocket(url_handle)
+#
+# Description:
+# Digs the socket out of a response returned by urllib2.urlopen() (a file
+# object around an httplib.HTTPResponse around the socket's file object), or
+# returns None where the layout is not the expected one.
+#
+#-------------------------------------------------------------------------------
+def _responseSocket(url_handle):
+	http_resp = getattr(getattr(url_handle, 'fp', None), '_sock', None)
+	sock = getattr(getattr(http_resp, 'fp', None), '_sock', None)
+	if sock is None or not hasattr(sock, 'settimeout'):
+		return None
+	return sock
+
+#-------------------------------------------------------------------------------
+# class: RecordingTransport
+#
+# Description:
+# Wraps another transport (an HttpTransport by default), passing requests
+# through to it and appending each successful exchange to a capture file: a
+# magic header followed by one record per exchange, holding the request
+# fingerprint, the API name and the zlib-compressed request XML and response
+# text. The USERID attribute is removed from the stored request XML, so that
+# capture files can be shared without giving away the account. Safe to share
+# between threads.
+#
+# Public methods:
+#	send(api, xml_txt, req_uri, timeout=None) - See HttpTransport
+#
+#	close()
+#		Closes the capture file.
+#
+#-------------------------------------------------------------------------------
+class RecordingTransport(object):
+	
+	def __init__(self, path, transport=None):
+		if transport is None:
+			transport = HttpTransport()
+		self.__transport = transport
+		self.__lock = threading.Lock()
+		self.__capture = open(path, 'ab')
+		if self.__capture.tell() == 0:
+			self.__capture.write(CAPTURE_MAGIC)
+			self.__capture.flush()
+			pass
+		return
+	
+	def close(self):
+		'''
+		Closes the capture file.
+		'''
+		self.__lock.acquire()
+		try:
+			self.__capture.close()
+		finally:
+			self.__lock.release()
+		return
+	
+	def send(self, api, xml_txt, req_uri, timeout=None):
+		resp_txt = self.__transport.send(api, xml_txt, req_uri, timeout=timeout)
+		packed_xml = zlib.compress(_USERID_ATTRIBUTE_RE.sub('', xml_txt, 1))
+		packed_resp = zlib.compress(resp_txt)
+		record = _CAPTURE_RECORD.pack(requestFingerprint(api, xml_txt),
+			len(api), len(packed_xml), len(packed_resp)) + api + packed_xml + packed_resp
+		self.__lock.acquire()
+		try:
+			self.__capture.write(record)
+			self.__capture.flush()
+		finally:
+			self.__lock.release()
+		return resp_txt
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: ReplayMissError
+#
+# Description:
+#	Raised by ReplayTransport when a request has no recorded response.
+#
+#-------------------------------------------------------------------------------
+class ReplayMissError(LookupError):
+	pass
+
+#-------------------------------------------------------------------------------
+# class: ReplayTransport
+#
+# Description:
+# Serves responses recorded by RecordingTransport without touching the
+# network. The capture file(s) are read once, into a dictionary keyed by
+# request fingerprint; where the same request was recorded more than once,
+# the last response wins. An optional synthetic latency (a fixed delay plus a
+# uniformly distributed jitter, in seconds) is applied to every request.
+#
+# Public properties:
+#	latency - float; fixed delay added to every request, in seconds
+#
+#	jitter - float; upper bound of the random delay added on top of latency
+#
+# Public methods:
+#	send(api, xml_txt, req_uri, timeout=None)
+#		Returns the recorded response to the request, raising ReplayMissError
+#		when there is none. Raises socket.timeout when the synthetic latency
+#		exceeds the timeout, as a real connection would.
+#
+#	load(path)
+#		Adds the exchanges of another capture file.
+#
+#-------------------------------------------------------------------------------
+class ReplayTransport(object):
+	
+	def __init__(self, path=None, latency=0.0, jitter=0.0):
+		self.latency = latency
+		self.jitter = jitter
+		self.__responses = {}
+		if path is not None:
+			self.load(path)
+		return
+	
+	def __len__(self):
+		return len(self.__responses)
+	
+	def load(self, path):
+		'''
+		Adds the exchanges of another capture file.
+		'''
+		for fingerprint, api, xml_txt, resp_txt in readCapture(path):
+			self.__responses[fingerprint] = resp_txt
+		return
+	
+	def send(self, api, xml_txt, req_uri, timeout=None):
+		'''
+		Returns the recorded response to the request, raising ReplayMissError
+		when there is none.
+		'''
+		delay = self.latency
+		if self.jitter:
+			delay += random.uniform(0.0, self.jitter)
+		if timeout is not None and delay > timeout:
+			time.sleep(max(timeout, 0.0))
+			raise socket.timeout('timed out')
+		if delay > 0:
+			time.sleep(delay)
+		try:
+			return self.__responses[requestFingerprint(api, xml_txt)]
+		except KeyError:
+			raise ReplayMissError('No recorded response for %s request.' % api)
+		pass
+	
+	pass
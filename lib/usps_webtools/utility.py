@@ -7,10 +7,24 @@ Author			:	William M. Clifford
 --------------------------------------------------------------------------------
 '''
 
+import contextlib
 import libxml2
-import sys
+import logging
+import re
 import xml.dom.minidom
 
+log = logging.getLogger(__name__)
+
+# Matches the prolog of a document: byte order mark, XML declaration,
+# whitespace, processing instructions, comments and document type declaration.
+_PROLOG_RE = re.compile(r'(?:\xef\xbb\xbf)?(?:\s+|<\?.*?\?>|<!--.*?-->|<!DOCTYPE(?:[^\[>]|\[.*?\])*>)*', re.S)
+
+# Matches the name of the element at the start of the text.
+_ROOT_ELEMENT_RE = re.compile(r'<([A-Za-z_][\w.:-]*)')
+
+# Matches the XML declaration at the very start of a document.
+_XML_DECLARATION_RE = re.compile(r'(?:\xef\xbb\xbf)?<\?xml\s.*?\?>', re.S)
+
 #-------------------------------------------------------------------------------
 # function: createXmlElement(parent_element, new_element_name, new_element_value)
 #
@@ -80,7 +94,7 @@ def getXmlElement(xpath_ctx, xpath_query_txt):
 			elem = qry_results[0]
 		pass
 	except Exception, ex:
-		sys.stderr.write('getXmlElement(): exception - %s\n' % str(ex))
+		log.warning('getXmlElement(): exception - %s', ex)
 		elem = None
 		pass
 	return elem
@@ -115,3 +129,80 @@ def getXmlElementContents(xpath_ctx, xpath_query_txt, default_value=''):
 	if elem:
 		return elem.content
 	return default_value
+
+#-------------------------------------------------------------------------------
+# function: rootElementName(buf)
+#
+# Description:
+# Returns the name of the root element of the XML document held in buf without
+# parsing the document, or None if no element could be found. The XML
+# declaration, processing instructions, comments and document type
+# declaration ahead of the root element are skipped.
+#
+#-------------------------------------------------------------------------------
+def rootElementName(buf):
+	'''
+	Returns the name of the root element of the XML document held in buf
+	without parsing the document, or None if no element could be found.
+	'''
+	match = _ROOT_ELEMENT_RE.match(buf, _PROLOG_RE.match(buf).end())
+	if match:
+		return match.group(1)
+	return None
+
+#-------------------------------------------------------------------------------
+# function: isPlainXml(buf)
+#
+# Description:
+# Returns True if the XML document held in buf uses no markup besides
+# elements, attributes, character data and references, plus an XML
+# declaration at the start: no comments, CDATA sections, processing
+# instructions or document type declaration. Only such documents can be read
+# by scanning the text (see usps_webtools.lazy); anything else has to go
+# through libxml2.
+#
+#-------------------------------------------------------------------------------
+def isPlainXml(buf):
+	'''
+	Returns True if the XML document held in buf has no comments, CDATA
+	sections, processing instructions or document type declaration.
+	'''
+	pos = 0
+	match = _XML_DECLARATION_RE.match(buf)
+	if match:
+		pos = match.end()
+	return buf.find('<!', pos) < 0 and buf.find('<?', pos) < 0
+
+#-------------------------------------------------------------------------------
+# function: parsedXmlDocument(xml_txt)
+#
+# Description:
+# Context manager parsing xml_txt with libxml2 and yielding a tuple of the
+# document and a new XPATH context on it. Both are released when the with
+# block is left, however it is left, so that no libxml2 memory is leaked when
+# parsing the response fails part way through. Nothing obtained from the
+# document may be kept beyond the with block.
+#
+# Params:
+#	xml_txt - string; the XML text to parse
+#
+# Yields:
+#	(document, XPATH context)
+#
+#-------------------------------------------------------------------------------
+@contextlib.contextmanager
+def parsedXmlDocument(xml_txt):
+	'''
+	Context manager parsing xml_txt with libxml2 and yielding a tuple of the
+	document and a new XPATH context on it, both released on exit.
+	'''
+	xd = libxml2.parseMemory(xml_txt, len(xml_txt))
+	try:
+		ctx = xd.xpathNewContext()
+		try:
+			yield (xd, ctx)
+		finally:
+			ctx.xpathFreeContext()
+	finally:
+		xd.freeDoc()
+	return
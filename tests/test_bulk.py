@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+'''
+File			:	test_bulk.py
+Package			:	tests
+Brief			:	Tests of batched submission in
+					usps_webtools.address_verify.bulk.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import unittest
+
+from usps_webtools.address_verify.addrstandards import AddressVerRequest
+from usps_webtools.address_verify.bulk import submitInBatches
+from usps_webtools.address_verify.usaddress import USPSAddress
+from usps_webtools.deadline import Deadline
+
+#-------------------------------------------------------------------------------
+# class: EchoTransport
+#
+# Description:
+#	Transport answering every address of a request with a fixed address,
+#	counting the requests and addresses it was sent.
+#
+#-------------------------------------------------------------------------------
+class EchoTransport(object):
+	
+	def __init__(self):
+		self.sent = 0
+		self.addressesSent = 0
+		return
+	
+	def send(self, api, xml_txt, req_uri, timeout=None):
+		self.sent += 1
+		ids = [ part.split('"')[0] for part in xml_txt.split('<Address ID="')[1:] ]
+		self.addressesSent += len(ids)
+		return '<AddressValidateResponse>%s</AddressValidateResponse>' % ''.join([
+			'<Address ID="%s"><Address2>1 MAIN ST</Address2><Zip5>20770</Zip5></Address>' % addr_id for addr_id in ids ])
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: EchoRequest
+# inherits: usps_webtools.address_verify.addrstandards.AddressVerRequest
+#-------------------------------------------------------------------------------
+class EchoRequest(AddressVerRequest):
+	TRANSPORT = None
+	
+	def _defaultUserId(self):
+		return 'TESTUSER'
+	
+	pass
+
+def addresses(count):
+	return [ (str(idx), USPSAddress(address2='%d Main St' % idx, city='Greenbelt', state='MD')) for idx in xrange(count) ]
+
+#-------------------------------------------------------------------------------
+# class: SubmitInBatchesTest
+#-------------------------------------------------------------------------------
+class SubmitInBatchesTest(unittest.TestCase):
+	
+	def setUp(self):
+		EchoRequest.TRANSPORT = EchoTransport()
+		return
+	
+	def testBatches(self):
+		results = submitInBatches(EchoRequest, addresses(12), lazy=True)
+		self.assertEqual(EchoRequest.TRANSPORT.sent, 3)
+		self.assertEqual(len(results), 12)
+		self.assertEqual(results.missing, frozenset())
+		return
+	
+	def testExpiredDeadlineSendsNothing(self):
+		deadline = Deadline(0)
+		results = submitInBatches(EchoRequest, addresses(12), deadline=deadline)
+		self.assertEqual(EchoRequest.TRANSPORT.sent, 0)
+		self.assertEqual(results.missing, frozenset([ str(idx) for idx in xrange(12) ]))
+		return
+	
+	pass
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+'''
+File			:	test_cache.py
+Package			:	tests
+Brief			:	Tests of the in-process caches in usps_webtools.cache.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import unittest
+
+from usps_webtools.address_verify.addrstandards import LazyAddressVerResponse
+from usps_webtools.cache import NegativeCache, TTLCache
+from usps_webtools.errors import ErrorRecord
+
+NOT_FOUND_RESPONSE = '''<?xml version="1.0"?>
+<AddressValidateResponse><Address ID="0"><Error><Number>-2147219401</Number><Source>clsAMS</Source><Description>Address Not Found.  </Description></Error></Address></AddressValidateResponse>'''
+
+#-------------------------------------------------------------------------------
+# class: FakeClock
+#
+# Description:
+#	Callable standing in for time.time(), advanced by hand.
+#
+#-------------------------------------------------------------------------------
+class FakeClock(object):
+	
+	def __init__(self, now=1000.0):
+		self.now = now
+		return
+	
+	def __call__(self):
+		return self.now
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: TTLCacheTest
+#-------------------------------------------------------------------------------
+class TTLCacheTest(unittest.TestCase):
+	
+	def testExpiry(self):
+		clock = FakeClock()
+		cache = TTLCache(ttl=10, clock=clock)
+		cache.put('a', 1)
+		cache.put('b', 2, ttl=30)
+		self.assertEqual(cache.get('a'), 1)
+		clock.now += 20
+		self.assertEqual(cache.get('a'), None)
+		self.assertEqual(cache.get('b'), 2)
+		return
+	
+	def testMaxSize(self):
+		clock = FakeClock()
+		cache = TTLCache(ttl=10, maxsize=10, clock=clock)
+		for idx in xrange(20):
+			clock.now += 1
+			cache.put(idx, idx)
+			pass
+		self.assert_(len(cache) <= 10)
+		self.assertEqual(cache.get(19), 19)
+		return
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: NegativeCacheTest
+#-------------------------------------------------------------------------------
+class NegativeCacheTest(unittest.TestCase):
+	
+	def testStoresPlainCopyOfLazyError(self):
+		response = LazyAddressVerResponse(NOT_FOUND_RESPONSE)
+		error = response.addresses[0][1].error
+		cache = NegativeCache()
+		self.assert_(cache.record('key', error))
+		stored = cache.get('key')
+		# A copy, not the lazy record pinning the response text.
+		self.assert_(isinstance(stored, ErrorRecord))
+		self.assertEqual(stored.number, '-2147219401')
+		self.assertEqual(stored.source, 'clsAMS')
+		self.assertEqual(stored.description.strip(), 'Address Not Found.')
+		return
+	
+	def testSkipsTransientErrors(self):
+		cache = NegativeCache()
+		self.failIf(cache.record('key', ErrorRecord('80040B1A', '', 'Authorization failure.')))
+		self.failIf(cache.record('key', None))
+		self.assertEqual(cache.get('key'), None)
+		return
+	
+	pass
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+'''
+File			:	test_columnar.py
+Package			:	tests
+Brief			:	Tests of column-oriented verification in
+					usps_webtools.address_verify.columnar.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import unittest
+
+from usps_webtools.address_verify import columnar
+from usps_webtools.address_verify.columnar import verifyColumns
+from usps_webtools.address_verify.usaddress import KEY_SEPARATOR, joinKey, normalizeAddressField
+
+from test_bulk import EchoRequest, EchoTransport
+
+NAN = float('nan')
+
+# Four rows over two addresses: the ZIP code 02134 given as text, as an
+# integer and as a float, and a street name holding the key separator.
+COLUMNS = {
+	'address2': ['1 Main St', '1 main  st', '1 MAIN ST', '2 Elm' + KEY_SEPARATOR + 'St'],
+	'city': ['Boston', 'Boston', 'Boston', 'Boston'],
+	'state': ['MA', 'MA', 'MA', 'MA'],
+	'zip5': ['02134', 2134, 2134.0, NAN],
+	}
+
+#-------------------------------------------------------------------------------
+# class: RecordingTransport
+#
+# Description:
+#	EchoTransport keeping the request XML it was sent.
+#
+#-------------------------------------------------------------------------------
+class RecordingTransport(EchoTransport):
+	
+	def __init__(self):
+		EchoTransport.__init__(self)
+		self.requests = []
+		return
+	
+	def send(self, api, xml_txt, req_uri, timeout=None):
+		self.requests.append(xml_txt)
+		return EchoTransport.send(self, api, xml_txt, req_uri, timeout)
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: KeyTest
+#-------------------------------------------------------------------------------
+class KeyTest(unittest.TestCase):
+	
+	def testSeparatorNormalizedAway(self):
+		self.assertEqual(normalizeAddressField('2 Elm' + KEY_SEPARATOR + 'St\t'), '2 ELM ST')
+		self.assertEqual(joinKey(('A', 'B')), 'A' + KEY_SEPARATOR + 'B')
+		self.assertRaises(ValueError, joinKey, ('A' + KEY_SEPARATOR, 'B'))
+		return
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: FormatZipTest
+#-------------------------------------------------------------------------------
+class FormatZipTest(unittest.TestCase):
+	
+	def testNumbers(self):
+		self.assertEqual(columnar._formatZip(2134, 5), '02134')
+		self.assertEqual(columnar._formatZip(20770.0, 5), '20770')
+		self.assertEqual(columnar._formatZip(1441L, 4), '1441')
+		self.assertEqual(columnar._formatZip(NAN, 5), '')
+		self.assertEqual(columnar._formatZip('02134', 5), '02134')
+		self.assertEqual(columnar._formatZip(None, 5), None)
+		self.assertRaises(ValueError, columnar._formatZip, 2134.5, 5)
+		return
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: VerifyColumnsTest
+#-------------------------------------------------------------------------------
+class VerifyColumnsTest(unittest.TestCase):
+	
+	def setUp(self):
+		EchoRequest.TRANSPORT = RecordingTransport()
+		return
+	
+	def testSequences(self):
+		codes, unique_rows = columnar._factorizeSequences(COLUMNS, columnar.DEFAULT_COLUMNS)
+		self.assertEqual(codes, [0, 0, 0, 1])
+		self.assertEqual(unique_rows, [
+			('', '', '1 MAIN ST', 'BOSTON', 'MA', '02134', ''),
+			('', '', '2 ELM ST', 'BOSTON', 'MA', '', '') ])
+		output = verifyColumns(COLUMNS, request_class=EchoRequest)
+		self.assertEqual(EchoRequest.TRANSPORT.addressesSent, 2)
+		self.assert_('<Zip5>02134</Zip5>' in EchoRequest.TRANSPORT.requests[0])
+		self.assertEqual(output['usps_zip5'], ['20770'] * 4)
+		self.assertEqual(output['usps_error'], [''] * 4)
+		return
+	
+	def testFrame(self):
+		if columnar.pandas is None:
+			# pandas is optional.
+			return
+		frame = columnar.pandas.DataFrame(COLUMNS)
+		codes, unique_rows = columnar._factorizeFrame(frame, columnar.DEFAULT_COLUMNS)
+		self.assertEqual(list(codes), [0, 0, 0, 1])
+		self.assertEqual(unique_rows, [
+			('', '', '1 MAIN ST', 'BOSTON', 'MA', '02134', ''),
+			('', '', '2 ELM ST', 'BOSTON', 'MA', '', '') ])
+		# A float column, as read from a file with a missing ZIP code.
+		frame = columnar.pandas.DataFrame({ 'address2': ['1 Main St', '1 Main St'], 'zip5': [2134.0, NAN] })
+		codes, unique_rows = columnar._factorizeFrame(frame, columnar.DEFAULT_COLUMNS)
+		self.assertEqual([ row[5] for row in unique_rows ], ['02134', ''])
+		return
+	
+	pass
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+'''
+File			:	test_credentials.py
+Package			:	tests
+Brief			:	Tests of the credential pool in usps_webtools.credentials and
+					of how requests draw user IDs from it.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import os
+import random
+import unittest
+
+from usps_webtools.address_verify.addrstandards import AddressVerRequest
+from usps_webtools.address_verify.usaddress import USPSAddress
+from usps_webtools.credentials import STRATEGY_WEIGHTED, Credential, CredentialPool
+from usps_webtools.errors import ConfigurationError, ErrorResponse
+from usps_webtools.utility import getXmlElement, parsedXmlDocument
+
+from test_bulk import EchoTransport
+
+AUTHORIZATION_ERROR = '''<?xml version="1.0"?>
+<Error><Number>80040B1A</Number><Description>Authorization failure.  Perhaps username and/or password is incorrect.</Description><Source>UspsCom::DoAuth</Source></Error>'''
+
+def errorResponse(resp_txt):
+	with parsedXmlDocument(resp_txt) as (xd, ctx):
+		error = ErrorResponse(getXmlElement(ctx, '/*'))
+		pass
+	return error
+
+#-------------------------------------------------------------------------------
+# class: UserIdTransport
+#
+# Description:
+#	EchoTransport keeping the USERID of every request it was sent.
+#
+#-------------------------------------------------------------------------------
+class UserIdTransport(EchoTransport):
+	
+	def __init__(self):
+		EchoTransport.__init__(self)
+		self.userIds = []
+		return
+	
+	def send(self, api, xml_txt, req_uri, timeout=None):
+		self.userIds.append(xml_txt.split('USERID="')[1].split('"')[0])
+		return EchoTransport.send(self, api, xml_txt, req_uri, timeout)
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: PoolRequest
+# inherits: usps_webtools.address_verify.addrstandards.AddressVerRequest
+#
+# Description:
+#	Request without a default user ID, so that only a pool can supply one.
+#
+#-------------------------------------------------------------------------------
+class PoolRequest(AddressVerRequest):
+	TRANSPORT = None
+	
+	def _defaultUserId(self):
+		return ''
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: CredentialPoolTest
+#-------------------------------------------------------------------------------
+class CredentialPoolTest(unittest.TestCase):
+	
+	def testLeastLoaded(self):
+		heavy = Credential('HEAVY', weight=2)
+		light = Credential('LIGHT')
+		pool = CredentialPool([heavy, light])
+		picked = [ pool.acquire().userId for idx in xrange(6) ]
+		# In-flight requests are spread in proportion to the weights.
+		self.assertEqual(picked.count('HEAVY'), 4)
+		self.assertEqual(picked.count('LIGHT'), 2)
+		self.assertEqual((heavy.inFlight, light.inFlight), (4, 2))
+		pool.release(heavy)
+		self.assertEqual(heavy.inFlight, 3)
+		return
+	
+	def testWeighted(self):
+		random.seed(1)
+		pool = CredentialPool([Credential('A', weight=3), Credential('B')], strategy=STRATEGY_WEIGHTED)
+		picked = []
+		for idx in xrange(1000):
+			credential = pool.acquire()
+			picked.append(credential.userId)
+			pool.release(credential)
+			pass
+		self.assert_(650 < picked.count('A') < 850, picked.count('A'))
+		return
+	
+	def testQuota(self):
+		credential = Credential('A', quota=2)
+		pool = CredentialPool([credential])
+		self.assert_(pool.acquire() is credential)
+		self.assert_(pool.acquire() is credential)
+		# Out of quota: nothing to wait for.
+		self.assertEqual(pool.acquire(timeout=1.0), None)
+		self.assertEqual(credential.used, 2)
+		# A new quota window starts once the period is over.
+		credential.quotaPeriod = 0.0
+		self.assert_(pool.acquire() is credential)
+		self.assertEqual(credential.used, 1)
+		return
+	
+	def testQuotaSpillsToNextCredential(self):
+		pool = CredentialPool([Credential('A', quota=1), Credential('B', quota=1)])
+		self.assertEqual(sorted([ pool.acquire().userId, pool.acquire().userId ]), ['A', 'B'])
+		self.assertEqual(pool.acquire(), None)
+		return
+	
+	def testRateLimit(self):
+		pool = CredentialPool([Credential('A', rate=20, burst=1)])
+		self.failIf(pool.acquire() is None)
+		# The next token is 50ms away.
+		self.assertEqual(pool.acquire(timeout=0), None)
+		self.failIf(pool.acquire(timeout=1.0) is None)
+		return
+	
+	def testAuthorizationErrorBenches(self):
+		bad = Credential('BAD')
+		pool = CredentialPool([bad], cooldown=300)
+		pool.release(pool.acquire(), errorResponse(AUTHORIZATION_ERROR))
+		self.failIf(bad.healthy)
+		self.assertEqual(pool.acquire(timeout=0), None)
+		pool.markHealthy(bad)
+		self.assert_(pool.acquire() is bad)
+		# Benched credentials come back after the cooldown.
+		pool.markUnhealthy(bad, cooldown=0)
+		self.assert_(pool.acquire() is bad)
+		return
+	
+	def testFromEnvironment(self):
+		os.environ['TEST_USPS_USER_IDS'] = ' A, B ,,C'
+		try:
+			pool = CredentialPool.fromEnvironment('TEST_USPS_USER_IDS', quota=5)
+		finally:
+			del os.environ['TEST_USPS_USER_IDS']
+		self.assertEqual([ credential.userId for credential in pool.credentials ], ['A', 'B', 'C'])
+		self.assertEqual(pool.credentials[0].quota, 5)
+		return
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: RequestUserIdTest
+#-------------------------------------------------------------------------------
+class RequestUserIdTest(unittest.TestCase):
+	
+	def setUp(self):
+		PoolRequest.TRANSPORT = UserIdTransport()
+		self.request = PoolRequest()
+		self.request.addAddress('0', USPSAddress(address2='6406 Ivy Lane', city='Greenbelt', state='MD'))
+		return
+	
+	def tearDown(self):
+		PoolRequest.CREDENTIAL_POOL = None
+		return
+	
+	def testNoUserIdFailsLocally(self):
+		self.assertRaises(ConfigurationError, self.request.submit)
+		self.assertEqual(PoolRequest.TRANSPORT.sent, 0)
+		return
+	
+	def testUserIdFromPool(self):
+		credential = Credential('POOLED')
+		PoolRequest.CREDENTIAL_POOL = CredentialPool([credential])
+		self.failIf(self.request.submit() is None)
+		self.assertEqual(PoolRequest.TRANSPORT.userIds, ['POOLED'])
+		self.assertEqual(credential.inFlight, 0)
+		return
+	
+	pass
+
+if __name__ == '__main__':
+	unittest.main()
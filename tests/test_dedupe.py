@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+'''
+File			:	test_dedupe.py
+Package			:	tests
+Brief			:	Tests of the external-memory de-duplication in
+					usps_webtools.address_verify.dedupe.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import unittest
+
+from usps_webtools.address_verify import dedupe
+from usps_webtools.address_verify.dedupe import ExternalDeduplicator, verifyDeduplicated
+from usps_webtools.address_verify.usaddress import ADDRESS_FIELDS, USPSAddress
+
+from test_bulk import EchoRequest, EchoTransport
+
+# 10000 rows over 50 addresses, each appearing 200 times with varying case
+# and spacing.
+ROW_COUNT = 10000
+UNIQUE_COUNT = 50
+
+def duplicatedRows():
+	for idx in xrange(ROW_COUNT):
+		street = '%d  Main St' % (idx % UNIQUE_COUNT)
+		if idx & 1:
+			street = street.upper()
+		yield (idx, USPSAddress(address2=street, city='Greenbelt', state='MD'))
+		pass
+	return
+
+#-------------------------------------------------------------------------------
+# class: DedupeTest
+#-------------------------------------------------------------------------------
+class DedupeTest(unittest.TestCase):
+	
+	def setUp(self):
+		EchoRequest.TRANSPORT = EchoTransport()
+		self.chunks = []
+		self.realSubmit = dedupe.submitInBatches
+		dedupe.submitInBatches = self.recordingSubmit
+		return
+	
+	def tearDown(self):
+		dedupe.submitInBatches = self.realSubmit
+		return
+	
+	def recordingSubmit(self, *args, **kw):
+		self.chunks.append(0)
+		return self.realSubmit(*args, **kw)
+	
+	def testGroupsSpilled(self):
+		deduper = ExternalDeduplicator(max_rows=500, partitions=8)
+		try:
+			for row_id, usps_addr in duplicatedRows():
+				deduper.add(row_id, usps_addr)
+			self.assert_(deduper.spilled)
+			# Row IDs may be read back from the spill files, so they have to
+			# be gone through before close().
+			groups = [ (fields, list(row_ids)) for fields, row_ids in deduper.groups() ]
+		finally:
+			deduper.close()
+		self.assertEqual(len(groups), UNIQUE_COUNT)
+		self.assertEqual(sorted([ row_id for fields, row_ids in groups for row_id in row_ids ]), range(ROW_COUNT))
+		return
+	
+	def testPartitionMemoryBounded(self):
+		# 4000 addresses once each plus one hot address on 6000 rows, through
+		# only two partitions: each would hold thousands of groups, and the hot
+		# address far more row IDs than max_rows.
+		deduper = ExternalDeduplicator(max_rows=200, partitions=2)
+		try:
+			for idx in xrange(10000):
+				if idx % 5 < 3:
+					street = '1 Hot St'
+				else:
+					street = '%d Cold St' % idx
+				deduper.add(idx, USPSAddress(address2=street, city='Greenbelt', state='MD'))
+				pass
+			seen = []
+			hot_rows = None
+			for fields, row_ids in deduper.groups():
+				if fields[ADDRESS_FIELDS.index('address2')] == '1 HOT ST':
+					hot_rows = len(row_ids)
+				seen.extend(row_ids)
+				pass
+			self.assert_(deduper.peakHeld <= 2 * 200 + 1, deduper.peakHeld)
+		finally:
+			deduper.close()
+		self.assertEqual(hot_rows, 6000)
+		self.assertEqual(sorted(seen), range(10000))
+		return
+	
+	def testHighDuplicationStaysBounded(self):
+		stats = {}
+		seen = []
+		for row_id, result, error in verifyDeduplicated(duplicatedRows(), EchoRequest,
+				max_rows=1000, partitions=8, stats=stats):
+			self.assertNotEqual(result, None)
+			self.assertEqual(error, None)
+			seen.append(row_id)
+			# Rows handed out since the last submission: never more than
+			# max_rows at a time.
+			self.chunks[-1] += 1
+			self.assert_(self.chunks[-1] <= 1000)
+			pass
+		self.assertEqual(sorted(seen), range(ROW_COUNT))
+		self.assertEqual(stats, { 'rows': ROW_COUNT, 'unique': UNIQUE_COUNT })
+		# Each unique address went to the server exactly once.
+		self.assertEqual(EchoRequest.TRANSPORT.addressesSent, UNIQUE_COUNT)
+		return
+	
+	pass
+
+if __name__ == '__main__':
+	unittest.main()
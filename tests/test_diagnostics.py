@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+'''
+File			:	test_diagnostics.py
+Package			:	tests
+Brief			:	Tests of the background logging in usps_webtools.diagnostics.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import logging
+import unittest
+
+from usps_webtools.diagnostics import LOGGER_NAME, enableBackgroundLogging
+
+#-------------------------------------------------------------------------------
+# class: ListHandler
+#
+# Description:
+#	Handler keeping the messages of the records it is given.
+#
+#-------------------------------------------------------------------------------
+class ListHandler(logging.Handler):
+	
+	def __init__(self):
+		logging.Handler.__init__(self)
+		self.messages = []
+		return
+	
+	def emit(self, record):
+		self.messages.append(record.getMessage())
+		return
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: BackgroundLoggingTest
+#-------------------------------------------------------------------------------
+class BackgroundLoggingTest(unittest.TestCase):
+	
+	def setUp(self):
+		self.logger = logging.getLogger(LOGGER_NAME)
+		self.savedPropagate = self.logger.propagate
+		self.savedLevel = self.logger.level
+		return
+	
+	def tearDown(self):
+		self.logger.propagate = self.savedPropagate
+		self.logger.setLevel(self.savedLevel)
+		return
+	
+	def testRecordsReachHandler(self):
+		handler = ListHandler()
+		listener = enableBackgroundLogging(handler, level=logging.INFO)
+		self.failIf(self.logger.propagate)
+		logging.getLogger(LOGGER_NAME + '.base').info('queued %d', 1)
+		listener.stop()
+		self.assertEqual(handler.messages, ['queued 1'])
+		return
+	
+	def testStopRestoresPropagate(self):
+		for propagate in (False, True):
+			self.logger.propagate = propagate
+			enableBackgroundLogging(ListHandler()).stop()
+			self.assertEqual(self.logger.propagate, propagate)
+			pass
+		return
+	
+	pass
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+'''
+File			:	test_incremental.py
+Package			:	tests
+Brief			:	Tests of manifest-driven incremental re-verification in
+					usps_webtools.address_verify.incremental.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from usps_webtools.address_verify.addrstandards import AddressVerRequest
+from usps_webtools.address_verify.incremental import VerificationManifest, verifyIncremental
+from usps_webtools.address_verify.usaddress import USPSAddress
+from usps_webtools.cache import NegativeCache
+from usps_webtools.errors import ErrorRecord
+
+from test_bulk import EchoTransport
+from test_cache import FakeClock
+
+WHOLE_REQUEST_ERROR = '''<?xml version="1.0"?>
+<Error><Number>-2147218900</Number><Source>clsAMS</Source><Description>Invalid XML request.</Description></Error>'''
+
+#-------------------------------------------------------------------------------
+# class: ScriptedTransport
+# inherits: EchoTransport
+#
+# Description:
+#	Echoes addresses like EchoTransport, except for addresses whose street
+#	says "BAD" (answered with an "Address Not Found." error) and for whole
+#	requests while failRequests is set.
+#
+#-------------------------------------------------------------------------------
+class ScriptedTransport(EchoTransport):
+	
+	failRequests = False
+	
+	def send(self, api, xml_txt, req_uri, timeout=None):
+		if self.failRequests:
+			self.sent += 1
+			return WHOLE_REQUEST_ERROR
+		resp_txt = EchoTransport.send(self, api, xml_txt, req_uri, timeout)
+		for part in xml_txt.split('<Address ID="')[1:]:
+			if 'BAD' in part:
+				addr_id = part.split('"')[0]
+				resp_txt = resp_txt.replace('<Address ID="%s"><Address2>1 MAIN ST</Address2><Zip5>20770</Zip5></Address>' % addr_id,
+					'<Address ID="%s"><Error><Number>-2147219401</Number><Source>clsAMS</Source>'
+					'<Description>Address Not Found.</Description></Error></Address>' % addr_id)
+			pass
+		return resp_txt
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: ScriptedRequest
+# inherits: usps_webtools.address_verify.addrstandards.AddressVerRequest
+#-------------------------------------------------------------------------------
+class ScriptedRequest(AddressVerRequest):
+	TRANSPORT = None
+	
+	def _defaultUserId(self):
+		return 'TESTUSER'
+	
+	pass
+
+def tableRows(count, bad=()):
+	rows = []
+	for idx in xrange(count):
+		street = '%d Main St' % idx
+		if idx in bad:
+			street = '%d BAD St' % idx
+		rows.append( (idx, USPSAddress(address2=street, city='Greenbelt', state='MD')) )
+		pass
+	return rows
+
+#-------------------------------------------------------------------------------
+# class: IncrementalTest
+#-------------------------------------------------------------------------------
+class IncrementalTest(unittest.TestCase):
+	
+	def setUp(self):
+		ScriptedRequest.TRANSPORT = ScriptedTransport()
+		self.tmpDir = tempfile.mkdtemp()
+		self.manifest = VerificationManifest(os.path.join(self.tmpDir, 'manifest'))
+		self.clock = FakeClock()
+		return
+	
+	def tearDown(self):
+		self.manifest.close()
+		shutil.rmtree(self.tmpDir, True)
+		return
+	
+	def verify(self, rows, **kw):
+		stats = {}
+		out = list(verifyIncremental(rows, self.manifest, ScriptedRequest, stats=stats, clock=self.clock, **kw))
+		self.assertEqual(sorted([ row_id for row_id, result, error in out ]), [ row_id for row_id, usps_addr in rows ])
+		return stats
+	
+	def testOnlyChangedRowsAreSent(self):
+		rows = tableRows(20)
+		self.assertEqual(self.verify(rows)['verified'], 20)
+		rows[3] = (3, USPSAddress(address2='99 Elm St', city='Greenbelt', state='MD'))
+		stats = self.verify(rows)
+		self.assertEqual( (stats['reused'], stats['verified']), (19, 1) )
+		self.clock.now += 100
+		self.assertEqual(self.verify(rows, max_age=50)['verified'], 20)
+		return
+	
+	def testPermanentAddressErrorIsKept(self):
+		rows = tableRows(5, bad=(2,))
+		self.assertEqual(self.verify(rows)['verified'], 5)
+		self.assertEqual(self.manifest.get(2)[3].number, '-2147219401')
+		self.assertEqual(self.verify(rows)['reused'], 5)
+		return
+	
+	def testWholeRequestErrorIsNotKept(self):
+		# "Invalid" makes the error permanent, but it is not about any one
+		# of the addresses; the rows have to be tried again next time.
+		ScriptedRequest.TRANSPORT.failRequests = True
+		stats = self.verify(tableRows(5))
+		self.assertEqual( (stats['verified'], stats['failed']), (0, 5) )
+		self.assertEqual(len(self.manifest), 0)
+		ScriptedRequest.TRANSPORT.failRequests = False
+		self.assertEqual(self.verify(tableRows(5))['verified'], 5)
+		return
+	
+	def testNegativeCacheAnswerIsKept(self):
+		rows = tableRows(5, bad=(4,))
+		negative_cache = NegativeCache()
+		self.verify(rows, negative_cache=negative_cache)
+		# Re-verify from scratch: row 4 is answered by the negative cache.
+		self.manifest.discard(4)
+		sent = ScriptedRequest.TRANSPORT.addressesSent
+		stats = self.verify(rows, negative_cache=negative_cache)
+		self.assertEqual(ScriptedRequest.TRANSPORT.addressesSent, sent)
+		self.assertEqual(stats['verified'], 1)
+		self.assert_(isinstance(self.manifest.get(4)[3], ErrorRecord))
+		return
+	
+	pass
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+'''
+File			:	test_lazy.py
+Package			:	tests
+Brief			:	Tests of the lazily-decoded responses in usps_webtools.lazy,
+					checked against the full libxml2 parse.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import unittest
+
+from usps_webtools.address_verify.addrstandards import AddressVerRequest, LazyAddressVerResponse
+from usps_webtools.address_verify.usaddress import USPSAddress
+from usps_webtools.lazy import decodeText
+from usps_webtools.utility import isPlainXml, rootElementName
+
+FIELD_NAMES = ('address1', 'address2', 'city', 'state', 'zip5', 'zip4')
+
+#-------------------------------------------------------------------------------
+# class: StaticTransport
+#
+# Description:
+#	Transport answering every request with the same response text.
+#
+#-------------------------------------------------------------------------------
+class StaticTransport(object):
+	
+	def __init__(self, resp_txt):
+		self.respTxt = resp_txt
+		return
+	
+	def send(self, api, xml_txt, req_uri, timeout=None):
+		return self.respTxt
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: StaticRequest
+# inherits: usps_webtools.address_verify.addrstandards.AddressVerRequest
+#-------------------------------------------------------------------------------
+class StaticRequest(AddressVerRequest):
+	TRANSPORT = None
+	
+	def _defaultUserId(self):
+		return 'TESTUSER'
+	
+	pass
+
+def submitBothWays(resp_txt):
+	'''
+	Submits a request answered with resp_txt, eagerly and lazily, and returns
+	the two lists of (ID, field values) tuples.
+	'''
+	StaticRequest.TRANSPORT = StaticTransport(resp_txt)
+	request = StaticRequest()
+	request.addAddress('0', USPSAddress(address2='6406 Ivy Lane', city='Greenbelt', state='MD'))
+	outcomes = []
+	for lazy in (False, True):
+		response = request.submit(lazy=lazy)
+		outcomes.append([ (addr_id, tuple([ getattr(record, name) for name in FIELD_NAMES ]))
+			for addr_id, record in response.addresses ])
+		pass
+	return outcomes
+
+#-------------------------------------------------------------------------------
+# class: RootElementTest
+#-------------------------------------------------------------------------------
+class RootElementTest(unittest.TestCase):
+	
+	def testSkipsProlog(self):
+		self.assertEqual(rootElementName('<?xml version="1.0"?>\n<!-- <Foo> -->\n'
+			'<?usps note <Bar>?><!DOCTYPE Resp [<!ENTITY x "<Baz>">]><Resp/>'), 'Resp')
+		self.assertEqual(rootElementName('<Resp><!-- <Foo> --></Resp>'), 'Resp')
+		self.assertEqual(rootElementName('<!-- unterminated <Foo>'), None)
+		return
+	
+	def testPlainXml(self):
+		self.assert_(isPlainXml('<?xml version="1.0"?>\n<Resp><A ID="1">x &amp; y</A></Resp>'))
+		self.failIf(isPlainXml('<?xml version="1.0"?><!-- c --><Resp/>'))
+		self.failIf(isPlainXml('<Resp><A><![CDATA[x]]></A></Resp>'))
+		self.failIf(isPlainXml('<Resp><?pi x?></Resp>'))
+		return
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: LazyDecodingTest
+#-------------------------------------------------------------------------------
+class LazyDecodingTest(unittest.TestCase):
+	
+	def testDecodeText(self):
+		self.assertEqual(decodeText('A &amp; B &lt;&#67;&#x44;&gt; &unknown;'), 'A & B <CD> &unknown;')
+		self.assertEqual(decodeText('&#233;'), '\xc3\xa9')
+		self.assertEqual(decodeText('x<!-- y -->z<![CDATA[&amp;<]]>'), 'xz&amp;<')
+		return
+	
+	def testCommentBeforeRoot(self):
+		eager, lazy = submitBothWays('''<?xml version="1.0"?>
+<!-- <Foo> -->
+<AddressValidateResponse><Address ID="0"><Address2>6406 IVY LN</Address2><City>GREENBELT</City><State>MD</State><Zip5>20770</Zip5><Zip4>1441</Zip4></Address></AddressValidateResponse>''')
+		self.assertEqual(len(lazy), 1)
+		self.assertEqual(lazy, eager)
+		return
+	
+	def testCommentInsideResponse(self):
+		eager, lazy = submitBothWays('''<?xml version="1.0"?>
+<AddressValidateResponse><!-- <Address ID="9"><Address2>FAKE</Address2></Address> --><Address ID="0"><Address2>6406 IVY LN</Address2><Zip5>20770</Zip5></Address></AddressValidateResponse>''')
+		self.assertEqual(lazy, eager)
+		self.assertEqual([ addr_id for addr_id, fields in lazy ], ['0'])
+		return
+	
+	def testCdataAndReferences(self):
+		eager, lazy = submitBothWays('''<?xml version="1.0"?>
+<AddressValidateResponse><Address ID="0"><Address2><![CDATA[6406 IVY & LN]]></Address2><City>GREEN&#66;ELT &amp; CO</City><State>MD</State></Address></AddressValidateResponse>''')
+		self.assertEqual(lazy, eager)
+		self.assertEqual(lazy[0][1][1:3], ('6406 IVY & LN', 'GREENBELT & CO'))
+		# The text scan decodes the same without falling back to libxml2.
+		record = LazyAddressVerResponse('''<AddressValidateResponse><Address ID="0"><Address2><![CDATA[6406 IVY & LN]]></Address2><City>GREEN&#66;ELT &amp; CO</City></Address></AddressValidateResponse>''').addresses[0][1]
+		self.assertEqual((record.address2, record.city), ('6406 IVY & LN', 'GREENBELT & CO'))
+		return
+	
+	pass
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+'''
+File			:	test_prefixindex.py
+Package			:	tests
+Brief			:	Tests of the address prefix index in
+					usps_webtools.address_verify.prefixindex.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from usps_webtools.address_verify.prefixindex import AddressPrefixIndex
+from usps_webtools.address_verify.usaddress import USPSAddress
+from usps_webtools.errors import ErrorRecord
+from usps_webtools.results import ResultIndex
+
+def verified(address2, zip5='20770', address1=''):
+	return USPSAddress(address1=address1, address2=address2, city='GREENBELT', state='MD', zip5=zip5)
+
+def streets(addresses):
+	return [ (usps_addr.address2, usps_addr.address1) for usps_addr in addresses ]
+
+#-------------------------------------------------------------------------------
+# class: PrefixIndexTest
+#-------------------------------------------------------------------------------
+class PrefixIndexTest(unittest.TestCase):
+	
+	def setUp(self):
+		self.index = AddressPrefixIndex()
+		for usps_addr in (verified('6406 IVY LN'), verified('6406 IVY LN', address1='APT 2'),
+				verified('6410 IVY LN'), verified('7 IVY CT'), verified('6406 IVY LN', zip5='20771')):
+			self.assert_(self.index.add(usps_addr))
+		return
+	
+	def testQuery(self):
+		self.assertEqual(streets(self.index.query('20770', '6406 ivy')),
+			[('6406 IVY LN', ''), ('6406 IVY LN', 'APT 2')])
+		self.assertEqual(streets(self.index.query('20770', '64')),
+			[('6406 IVY LN', ''), ('6406 IVY LN', 'APT 2'), ('6410 IVY LN', '')])
+		self.assertEqual(streets(self.index.query('20770', '64', limit=1)), [('6406 IVY LN', '')])
+		self.assertEqual(streets(self.index.query('20771', '6')), [('6406 IVY LN', '')])
+		self.assertEqual(self.index.query('20770', '65'), [])
+		self.assertEqual(self.index.query('99999', '6'), [])
+		self.assertEqual(self.index.query('20770', '6406 IVY LN')[0].city, 'GREENBELT')
+		return
+	
+	def testAddSkipsDuplicatesAndIncomplete(self):
+		self.failIf(self.index.add(verified('6406 IVY LN')))
+		self.failIf(self.index.add(verified('', address1='APT 2')))
+		self.failIf(self.index.add(verified('1 MAIN ST', zip5='')))
+		self.assertEqual(len(self.index), 5)
+		return
+	
+	def testAddResults(self):
+		results = ResultIndex()
+		results.attachResult('0', verified('1 MAIN ST'))
+		results.attachResult('1', verified('2 MAIN ST'))
+		results.attachError('1', ErrorRecord('-2147219401', 'clsAMS', 'Address Not Found.'))
+		self.assertEqual(self.index.addResults(results), 1)
+		self.assertEqual(streets(self.index.query('20770', '')),
+			[('1 MAIN ST', ''), ('6406 IVY LN', ''), ('6406 IVY LN', 'APT 2'), ('6410 IVY LN', ''), ('7 IVY CT', '')])
+		return
+	
+	def testSaveLoad(self):
+		tmp_dir = tempfile.mkdtemp()
+		try:
+			path = os.path.join(tmp_dir, 'prefix.idx')
+			self.index.save(path)
+			loaded = AddressPrefixIndex.load(path)
+			bad_path = os.path.join(tmp_dir, 'bad.idx')
+			open(bad_path, 'wb').write('NOTANIDX')
+			self.assertRaises(ValueError, AddressPrefixIndex.load, bad_path)
+		finally:
+			shutil.rmtree(tmp_dir)
+		self.assertEqual(len(loaded), 5)
+		for zip5, prefix in (('20770', '6'), ('20770', '7'), ('20771', '')):
+			self.assertEqual(streets(loaded.query(zip5, prefix)), streets(self.index.query(zip5, prefix)))
+		# A loaded index can still be added to.
+		self.assert_(loaded.add(verified('6408 IVY LN')))
+		self.assertEqual(streets(loaded.query('20770', '6408')), [('6408 IVY LN', '')])
+		return
+	
+	pass
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+'''
+File			:	test_scheduler.py
+Package			:	tests
+Brief			:	Tests of the rate limiter and the priority-aware request
+					scheduler in usps_webtools.scheduler.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import threading
+import time
+import unittest
+
+from usps_webtools.scheduler import (PRIORITY_BULK, PRIORITY_INTERACTIVE, PRIORITY_NORMAL,
+	RequestScheduler, TokenBucket)
+
+from test_cache import FakeClock
+
+#-------------------------------------------------------------------------------
+# class: TokenBucketTest
+#-------------------------------------------------------------------------------
+class TokenBucketTest(unittest.TestCase):
+	
+	def testRefill(self):
+		clock = FakeClock()
+		bucket = TokenBucket(rate=2, burst=3, clock=clock)
+		for idx in xrange(3):
+			self.assertEqual(bucket.delay(), 0.0)
+			bucket.take()
+			pass
+		self.assertEqual(bucket.delay(), 0.5)
+		clock.now += 0.25
+		self.assertEqual(bucket.delay(), 0.25)
+		clock.now += 0.25
+		self.assertEqual(bucket.delay(), 0.0)
+		# Tokens do not pile up beyond the burst.
+		clock.now += 100
+		for idx in xrange(3):
+			self.assertEqual(bucket.delay(), 0.0)
+			bucket.take()
+			pass
+		self.assertEqual(bucket.delay(), 0.5)
+		return
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: RequestSchedulerTest
+#-------------------------------------------------------------------------------
+class RequestSchedulerTest(unittest.TestCase):
+	
+	def testReservedCapacity(self):
+		scheduler = RequestScheduler(max_concurrency=2, reserved_interactive=1, clock=FakeClock())
+		self.assert_(scheduler.acquire(PRIORITY_BULK, timeout=0))
+		# The last slot is held back for interactive work.
+		self.failIf(scheduler.acquire(PRIORITY_BULK, timeout=0))
+		self.failIf(scheduler.acquire(PRIORITY_NORMAL, timeout=0))
+		self.assert_(scheduler.acquire(PRIORITY_INTERACTIVE, timeout=0))
+		self.failIf(scheduler.acquire(PRIORITY_INTERACTIVE, timeout=0))
+		self.assertEqual(scheduler.active, 2)
+		self.assertEqual(scheduler.waiting, 0)
+		scheduler.release()
+		scheduler.release()
+		self.assert_(scheduler.acquire(PRIORITY_BULK, timeout=0))
+		return
+	
+	def testRateLimit(self):
+		clock = FakeClock()
+		scheduler = RequestScheduler(max_concurrency=4, reserved_interactive=0, rate=2, burst=1, clock=clock)
+		self.assert_(scheduler.acquire(timeout=0))
+		scheduler.release()
+		self.failIf(scheduler.acquire(timeout=0))
+		clock.now += 0.5
+		self.assert_(scheduler.acquire(timeout=0))
+		scheduler.release()
+		return
+	
+	def testPriorityOrder(self):
+		scheduler = RequestScheduler(max_concurrency=1, reserved_interactive=0, clock=FakeClock())
+		self.assert_(scheduler.acquire(PRIORITY_BULK))
+		admitted = []
+		def waiter(name, priority):
+			scheduler.acquire(priority)
+			admitted.append(name)
+			scheduler.release()
+			return
+		threads = []
+		# Queued in arrival order bulk, normal, bulk, interactive.
+		for name, priority in (('bulk1', PRIORITY_BULK), ('normal', PRIORITY_NORMAL),
+				('bulk2', PRIORITY_BULK), ('interactive', PRIORITY_INTERACTIVE)):
+			thread = threading.Thread(target=waiter, args=(name, priority))
+			thread.start()
+			threads.append(thread)
+			while scheduler.waiting < len(threads):
+				time.sleep(0.001)
+			pass
+		scheduler.release()
+		for thread in threads:
+			thread.join(5)
+		self.assertEqual(admitted, ['interactive', 'normal', 'bulk1', 'bulk2'])
+		self.assertEqual(scheduler.active, 0)
+		return
+	
+	pass
+
+if __name__ == '__main__':
+	unittest.main()
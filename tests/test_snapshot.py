@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+'''
+File			:	test_snapshot.py
+Package			:	tests
+Brief			:	Tests of cache snapshots in usps_webtools.snapshot.
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from usps_webtools.address_verify.citystate import USPSZipCode
+from usps_webtools.cache import ResultCache
+from usps_webtools.snapshot import CacheSnapshot, exportSnapshot
+
+from test_cache import FakeClock
+
+def zipKey(zip5):
+	return ('CityStateLookupRequest', zip5)
+
+#-------------------------------------------------------------------------------
+# class: SnapshotTest
+#-------------------------------------------------------------------------------
+class SnapshotTest(unittest.TestCase):
+	
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.path = os.path.join(self.dir, 'cache.snap')
+		self.clock = FakeClock()
+		return
+	
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+		return
+	
+	def restart(self):
+		'''
+		Returns a fresh ResultCache backed by the snapshot at self.path.
+		'''
+		return ResultCache(ttl=100, clock=self.clock, snapshot=CacheSnapshot(self.path, self.clock))
+	
+	def testRoundTrip(self):
+		cache = ResultCache(ttl=100, clock=self.clock)
+		cache.record(zipKey('20500'), USPSZipCode(city='WASHINGTON', state='DC', zip5='20500'))
+		self.assertEqual(exportSnapshot(cache, self.path), 1)
+		snapshot = CacheSnapshot(self.path, self.clock)
+		expires, value = snapshot.get(zipKey('20500'))
+		self.assertEqual(expires, 1100.0)
+		self.assertEqual((value.city, value.state, value.zip5), ('WASHINGTON', 'DC', '20500'))
+		self.assertEqual(snapshot.get(zipKey('90210')), None)
+		snapshot.close()
+		return
+	
+	def testExportKeepsSnapshotEntries(self):
+		cache = ResultCache(ttl=100, clock=self.clock)
+		for idx in xrange(10):
+			zip5 = '%05d' % idx
+			cache.record(zipKey(zip5), USPSZipCode(city='CITY', state='ST', zip5=zip5))
+			pass
+		exportSnapshot(cache, self.path)
+		# Several restarts, each touching a single entry before exporting over
+		# the snapshot it runs from.
+		for idx in xrange(3):
+			self.clock.now += 1
+			cache = self.restart()
+			self.assertNotEqual(cache.get(zipKey('00000')), None)
+			self.assertEqual(exportSnapshot(cache, self.path), 10)
+			cache.snapshot.close()
+			pass
+		snapshot = CacheSnapshot(self.path, self.clock)
+		self.assertEqual(len(snapshot), 10)
+		self.assertEqual(sorted([ key for key, expires, value in snapshot.entries() ]),
+			[ zipKey('%05d' % idx) for idx in xrange(10) ])
+		snapshot.close()
+		return
+	
+	def testMemoryTakesPrecedence(self):
+		cache = ResultCache(ttl=100, clock=self.clock)
+		cache.record(zipKey('20500'), USPSZipCode(city='OLD', state='DC', zip5='20500'))
+		exportSnapshot(cache, self.path)
+		self.clock.now += 10
+		cache = self.restart()
+		cache.record(zipKey('20500'), USPSZipCode(city='NEW', state='DC', zip5='20500'))
+		self.assertEqual(exportSnapshot(cache, self.path), 1)
+		cache.snapshot.close()
+		snapshot = CacheSnapshot(self.path, self.clock)
+		expires, value = snapshot.get(zipKey('20500'))
+		self.assertEqual(expires, 1110.0)
+		self.assertEqual(value.city, 'NEW')
+		snapshot.close()
+		return
+	
+	def testSkipsExpiredSnapshotEntries(self):
+		cache = ResultCache(ttl=100, clock=self.clock)
+		cache.record(zipKey('20500'), USPSZipCode(city='WASHINGTON', state='DC', zip5='20500'))
+		cache.put(zipKey('90210'), USPSZipCode(city='BEVERLY HILLS', state='CA', zip5='90210'), 10)
+		exportSnapshot(cache, self.path)
+		self.clock.now += 20
+		cache = self.restart()
+		self.assertEqual(exportSnapshot(cache, self.path), 1)
+		cache.snapshot.close()
+		snapshot = CacheSnapshot(self.path, self.clock)
+		self.assertEqual([ key for key, expires, value in snapshot.entries() ], [zipKey('20500')])
+		snapshot.close()
+		return
+	
+	pass
+
+if __name__ == '__main__':
+	unittest.main()
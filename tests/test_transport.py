@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+'''
+File			:	test_transport.py
+Package			:	tests
+Brief			:	Tests of HttpTransport against a local stub HTTP server
+					serving plain, gzip, zlib-deflate and raw-deflate
+					responses, plus a compressed vs. uncompressed benchmark.
+					Run with the lib directory on the path, e.g.
+					PYTHONPATH=lib python -m unittest discover -s tests
+					or "python tests/test_transport.py --benchmark".
+Author			:	William M. Clifford
+--------------------------------------------------------------------------------
+'''
+
+import BaseHTTPServer
+import cgi
+import gzip
+import optparse
+import os
+import shutil
+import socket
+import StringIO
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import zlib
+
+from usps_webtools.transport import HttpTransport, RecordingTransport, ReplayMissError, ReplayTransport, decodeStream, readCapture
+
+# A verbose 5-address response, like the ones returned for a full batch.
+SAMPLE_RESPONSE = '<?xml version="1.0"?>\n<AddressValidateResponse>%s</AddressValidateResponse>' % ''.join([
+	'<Address ID="%d"><FirmName>ACME WIDGETS</FirmName><Address1>STE %d</Address1>'
+	'<Address2>6406 IVY LN</Address2><City>GREENBELT</City><State>MD</State>'
+	'<Zip5>20770</Zip5><Zip4>144%d</Zip4></Address>' % (idx, idx, idx) for idx in xrange(5) ])
+
+#-------------------------------------------------------------------------------
+# function: encodeBody(body, encoding)
+#
+# Description:
+# Returns body compressed for the given stub encoding: "gzip", "deflate"
+# (zlib-wrapped), "rawdeflate" (deflate without the zlib header, sent as
+# "deflate") or "identity".
+#
+#-------------------------------------------------------------------------------
+def encodeBody(body, encoding):
+	'''
+	Returns body compressed for the given stub encoding.
+	'''
+	if encoding == 'gzip':
+		buf = StringIO.StringIO()
+		gz = gzip.GzipFile(fileobj=buf, mode='wb')
+		gz.write(body)
+		gz.close()
+		return buf.getvalue()
+	if encoding == 'deflate':
+		return zlib.compress(body)
+	if encoding == 'rawdeflate':
+		compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+		return compressor.compress(body) + compressor.flush()
+	return body
+
+#-------------------------------------------------------------------------------
+# class: StubHandler
+# inherits: BaseHTTPServer.BaseHTTPRequestHandler
+#
+# Description:
+#	Answers every POST with SAMPLE_RESPONSE, encoded as named by the request
+#	path ("/gzip", "/deflate", "/rawdeflate" or "/plain") when the client
+#	accepts compressed responses. The server's bandwidth attribute, if set,
+#	throttles the response to that many bytes per second.
+#
+#-------------------------------------------------------------------------------
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	
+	def do_POST(self):
+		length = int(self.headers.getheader('Content-Length', '0'))
+		form = cgi.parse_qs(self.rfile.read(length))
+		self.server.requests.append( (form.get('API', [''])[0], form.get('XML', [''])[0]) )
+		encoding = self.path.strip('/')
+		if 'deflate' not in self.headers.getheader('Accept-Encoding', ''):
+			encoding = 'plain'
+		body = encodeBody(self.server.body, encoding)
+		self.send_response(200)
+		self.send_header('Content-Type', 'text/xml')
+		self.send_header('Content-Length', str(len(body)))
+		if encoding in ('gzip', 'deflate'):
+			self.send_header('Content-Encoding', encoding)
+		elif encoding == 'rawdeflate':
+			self.send_header('Content-Encoding', 'deflate')
+		self.end_headers()
+		self.server.bytesSent += len(body)
+		if not self.server.bandwidth:
+			self.wfile.write(body)
+			return
+		chunk_size = max(1, self.server.bandwidth // 100)
+		for start in xrange(0, len(body), chunk_size):
+			self.wfile.write(body[start:start + chunk_size])
+			self.wfile.flush()
+			time.sleep(float(chunk_size) / self.server.bandwidth)
+			pass
+		return
+	
+	def finish(self):
+		# Clients giving up halfway (see testTimeoutCoversSlowBody) are fine.
+		try:
+			BaseHTTPServer.BaseHTTPRequestHandler.finish(self)
+		except socket.error:
+			pass
+		return
+	
+	def handle(self):
+		try:
+			BaseHTTPServer.BaseHTTPRequestHandler.handle(self)
+		except socket.error:
+			pass
+		return
+	
+	def log_message(self, format, *args):
+		pass
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# function: startStubServer(body=SAMPLE_RESPONSE, bandwidth=None)
+#
+# Description:
+# Starts a StubHandler server on a free local port in a background thread and
+# returns it. Call shutdown() on it when done.
+#
+#-------------------------------------------------------------------------------
+def startStubServer(body=SAMPLE_RESPONSE, bandwidth=None):
+	'''
+	Starts a stub server on a free local port in a background thread.
+	'''
+	server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), StubHandler)
+	server.body = body
+	server.bandwidth = bandwidth
+	server.bytesSent = 0
+	server.requests = []
+	thread = threading.Thread(target=server.serve_forever)
+	thread.setDaemon(True)
+	thread.start()
+	return server
+
+#-------------------------------------------------------------------------------
+# function: runBenchmark(count=200, bandwidth=None)
+#
+# Description:
+# Sends count requests through a compressing and a non-compressing
+# HttpTransport against a stub server (throttled to bandwidth bytes per
+# second, if given) and returns a dict of mode -> (seconds, bytes received).
+#
+#-------------------------------------------------------------------------------
+def runBenchmark(count=200, bandwidth=None):
+	'''
+	Times count requests with and without compressed responses. Returns a
+	dict of mode -> (seconds, bytes on the wire).
+	'''
+	timings = {}
+	for mode, transport in (('gzip', HttpTransport()), ('plain', HttpTransport(acceptCompressed=False))):
+		server = startStubServer(bandwidth=bandwidth)
+		try:
+			uri = 'http://127.0.0.1:%d/gzip' % server.server_port
+			start = time.time()
+			for idx in xrange(count):
+				transport.send('Verify', '<AddressValidateRequest/>', uri)
+			timings[mode] = (time.time() - start, server.bytesSent)
+		finally:
+			server.shutdown()
+			server.server_close()
+		pass
+	return timings
+
+#-------------------------------------------------------------------------------
+# class: HttpTransportTest
+#
+# Description:
+#	Round trips through HttpTransport.send() for each response encoding.
+#
+#-------------------------------------------------------------------------------
+class HttpTransportTest(unittest.TestCase):
+	
+	def setUp(self):
+		self.server = startStubServer()
+		self.baseUri = 'http://127.0.0.1:%d' % self.server.server_port
+		return
+	
+	def tearDown(self):
+		self.server.shutdown()
+		self.server.server_close()
+		return
+	
+	def send(self, encoding, transport=None):
+		if transport is None:
+			transport = HttpTransport(chunkSize=64)
+		return transport.send('Verify', '<AddressValidateRequest USERID="X"/>', '%s/%s' % (self.baseUri, encoding))
+	
+	def testPlain(self):
+		self.assertEqual(self.send('plain'), SAMPLE_RESPONSE)
+		return
+	
+	def testGzip(self):
+		self.assertEqual(self.send('gzip'), SAMPLE_RESPONSE)
+		self.assert_(self.server.bytesSent < len(SAMPLE_RESPONSE))
+		return
+	
+	def testZlibDeflate(self):
+		self.assertEqual(self.send('deflate'), SAMPLE_RESPONSE)
+		return
+	
+	def testRawDeflate(self):
+		self.assertEqual(self.send('rawdeflate'), SAMPLE_RESPONSE)
+		return
+	
+	def testNotAccepted(self):
+		self.assertEqual(self.send('gzip', HttpTransport(acceptCompressed=False)), SAMPLE_RESPONSE)
+		self.assertEqual(self.server.bytesSent, len(SAMPLE_RESPONSE))
+		return
+	
+	def testTimeoutCoversSlowBody(self):
+		# About 2 seconds to send the whole body; each chunk arrives well
+		# within the timeout, but the whole exchange must not.
+		self.server.bandwidth = len(SAMPLE_RESPONSE) // 2
+		start = time.time()
+		self.assertRaises(socket.timeout, HttpTransport(acceptCompressed=False, chunkSize=64).send,
+			'Verify', '<AddressValidateRequest/>', '%s/plain' % self.baseUri, 0.3)
+		self.assert_(time.time() - start < 0.6)
+		return
+	
+	def testPostData(self):
+		self.send('plain')
+		self.assertEqual(self.server.requests, [ ('Verify', '<AddressValidateRequest USERID="X"/>') ])
+		return
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: DecodeStreamTest
+#
+# Description:
+#	decodeStream() fed one byte at a time, the worst case for chunk borders.
+#
+#-------------------------------------------------------------------------------
+class DecodeStreamTest(unittest.TestCase):
+	
+	def decode(self, encoding, header):
+		stream = StringIO.StringIO(encodeBody(SAMPLE_RESPONSE, encoding))
+		return ''.join(decodeStream(stream, header, 1))
+	
+	def testEncodings(self):
+		self.assertEqual(self.decode('gzip', 'gzip'), SAMPLE_RESPONSE)
+		self.assertEqual(self.decode('deflate', 'deflate'), SAMPLE_RESPONSE)
+		self.assertEqual(self.decode('rawdeflate', 'deflate'), SAMPLE_RESPONSE)
+		self.assertEqual(self.decode('plain', ''), SAMPLE_RESPONSE)
+		return
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: RecordReplayTest
+#
+# Description:
+#	Exchanges recorded from the stub server are replayed by fingerprint, and
+#	the capture file does not give away the user ID.
+#
+#-------------------------------------------------------------------------------
+class RecordReplayTest(unittest.TestCase):
+	
+	def setUp(self):
+		self.server = startStubServer()
+		self.uri = 'http://127.0.0.1:%d/gzip' % self.server.server_port
+		self.tmpDir = tempfile.mkdtemp()
+		self.path = os.path.join(self.tmpDir, 'exchanges.cap')
+		return
+	
+	def tearDown(self):
+		self.server.shutdown()
+		self.server.server_close()
+		shutil.rmtree(self.tmpDir, True)
+		return
+	
+	def testReplayWithoutUserId(self):
+		recorder = RecordingTransport(self.path)
+		recorder.send('Verify', '<AddressValidateRequest USERID="SECRET123"><Address ID="0"/></AddressValidateRequest>', self.uri)
+		recorder.close()
+		self.assert_('SECRET123' not in open(self.path, 'rb').read())
+		for fingerprint, api, xml_txt, resp_txt in readCapture(self.path):
+			self.assert_('SECRET123' not in xml_txt)
+			self.assert_('USERID' not in xml_txt)
+			pass
+		replay = ReplayTransport(self.path)
+		resp_txt = replay.send('Verify', '<AddressValidateRequest USERID="OTHER"><Address ID="0"/></AddressValidateRequest>', self.uri)
+		self.assertEqual(resp_txt, SAMPLE_RESPONSE)
+		self.assertRaises(ReplayMissError, replay.send, 'Verify', '<AddressValidateRequest/>', self.uri)
+		return
+	
+	pass
+
+#-------------------------------------------------------------------------------
+# class: BenchmarkTest
+#
+# Description:
+#	Short run of the benchmark over a throttled link: the compressed path has
+#	to move fewer bytes and finish sooner.
+#
+#-------------------------------------------------------------------------------
+class BenchmarkTest(unittest.TestCase):
+	
+	def testCompressedIsSmallerAndFaster(self):
+		timings = runBenchmark(count=5, bandwidth=20000)
+		self.assert_(timings['gzip'][1] < timings['plain'][1])
+		self.assert_(timings['gzip'][0] < timings['plain'][0])
+		return
+	
+	pass
+
+if __name__ == '__main__':
+	parser = optparse.OptionParser(usage='%prog [--benchmark [--count N] [--bandwidth BPS]]')
+	parser.add_option('--benchmark', action='store_true', default=False,
+		help='run the compressed vs. uncompressed benchmark instead of the tests')
+	parser.add_option('--count', type='int', default=200, help='requests per mode')
+	parser.add_option('--bandwidth', type='int', default=None,
+		help='throttle the stub server to this many bytes per second')
+	options, args = parser.parse_args()
+	if not options.benchmark:
+		unittest.main(argv=[sys.argv[0]] + args)
+	for mode, (seconds, wire_bytes) in sorted(runBenchmark(options.count, options.bandwidth).items()):
+		print '%-6s %5d requests  %8.3fs  %7.2f ms/request  %9d bytes on the wire' % (mode,
+			options.count, seconds, seconds * 1000.0 / options.count, wire_bytes)
+		pass